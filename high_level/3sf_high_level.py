@@ -4,21 +4,45 @@ from pythonic_code_generic import *
 from stubs import *
 from helpers import *
 
-# @Init
-# def init() -> NodeState:
-#     return NodeState(
-#         identity=NodeIdentity(),
-#         current_phase = NodePhase.PROPOSE,
-#         current_slot=0,
-#         blocks=[],
-#         configuration=Configuration(
-#             delta=10,
-#             genesis=Block(
-#                 parent_hash="",
-#                 body=BlockBody()
-#             )
-#         )
-#     )
+
+@Init
+def init(identity: NodeIdentity, configuration: Configuration) -> NodeState:
+    """
+    The initial state of a node only knows about the genesis block `configuration.genesis`, which is also its
+    initial available chain.
+    """
+    node_state = NodeState(
+        configuration=configuration,
+        identity=identity,
+        current_slot=0,
+        current_phase=NodePhase.PROPOSE,
+        view_blocks=pmap_get_empty(),
+        view_children=pmap_get_empty(),
+        view_ancestry=pmap_get_empty(),
+        archived_blocks=pmap_get_empty(),
+        fork_choice_store=get_empty_fork_choice_store(block_hash(configuration.genesis), pmap_get_empty()),
+        view_votes=pset_get_empty(),
+        latest_messages=pmap_get_empty(),
+        view_vote_heads=pmap_get_empty(),
+        view_votes_by_head=pmap_get_empty(),
+        ffg_votes_by_target=pmap_get_empty(),
+        ffg_votes_by_source=pmap_get_empty(),
+        justified_checkpoints=pset_get_empty(),
+        finalized_checkpoints=pset_get_empty(),
+        buffer_votes=pset_get_empty(),
+        pending_aggregates=pset_get_empty(),
+        buffer_blocks=pmap_get_empty(),
+        s_cand=pset_get_empty(),
+        chava=configuration.genesis
+    )
+
+    node_state = node_state.set(
+        justified_checkpoints=pset_get_singleton(genesis_checkpoint(node_state)),
+        finalized_checkpoints=pset_get_singleton(genesis_checkpoint(node_state)),
+        pruning_anchor=genesis_checkpoint(node_state)
+    )
+
+    return update_fork_choice_store(add_block_to_view(configuration.genesis, node_state))
 
 
 @Event
@@ -35,7 +59,7 @@ def on_tick(node_state: NodeState, time: int) -> NewNodeStateAndMessagesToTx:
     new_phase = get_phase_from_time(time, node_state)
 
     if new_slot != node_state.current_slot or new_phase != node_state.current_phase:
-        node_state = node_state.set(current_slot=new_slot)
+        node_state = set_current_slot(new_slot, node_state)
         node_state = node_state.set(current_phase=new_phase)
 
         if node_state.current_phase == NodePhase.PROPOSE:
@@ -117,7 +141,7 @@ def on_vote(node_state: NodeState) -> NewNodeStateAndMessagesToTx:
         is_ancestor_descendant_relationship(k_deep_block, node_state.chava, node_state)
     ):
         node_state = node_state.set(
-            chAva=pset_max(
+            chava=pset_max(
                 pset_merge(
                     pset_get_singleton(bcand),
                     pset_get_singleton(k_deep_block)
@@ -183,6 +207,7 @@ def on_received_propose(propose: SignedProposeMessage, node_state: NodeState) ->
     """
     A validator merges the proposer's view with its own local view upon receiving a proposal within the timeframe from 
     4Δt to 4Δt+Δ, preparing it for the phase NodePhase.VOTE.    
+    The aggregate signatures of the proposer's view are verified in a single batch, see `add_aggregated_votes_to_view`.
     """
     node_state = node_state.set(
         buffer_blocks=pmap_set(
@@ -192,11 +217,12 @@ def on_received_propose(propose: SignedProposeMessage, node_state: NodeState) ->
     )
 
     if node_state.current_phase == NodePhase.PROPOSE:  # Is this Ok or do we need to also include 4\Delta t + \Delta ?
-        node_state = node_state.set(
-            view_vote=pset_merge(
-                node_state.view_votes,
-                from_pvector_to_pset(propose.message.proposer_view))
-        )
+        node_state = update_fork_choice_store(prune_view_on_finality(update_FFG_checkpoints(
+            add_aggregated_votes_to_view(
+                from_pvector_to_pset(propose.message.proposer_view),
+                node_state
+            )
+        )))
 
     return NewNodeStateAndMessagesToTx(
         state=node_state,
@@ -229,7 +255,7 @@ def on_vote_received(vote: SignedVoteMessage, node_state: NodeState) -> NewNodeS
     """
     return NewNodeStateAndMessagesToTx(
         state=node_state.set(
-            buffer_vote=pset_add(
+            buffer_votes=pset_add(
                 node_state.buffer_votes,
                 vote
             )
@@ -239,16 +265,108 @@ def on_vote_received(vote: SignedVoteMessage, node_state: NodeState) -> NewNodeS
     )
 
 
+def on_votes_received(votes: PVector[SignedVoteMessage], node_state: NodeState) -> NewNodeStateAndIngestionCounts:
+    """
+    Batch counterpart of `on_vote_received`: it adds to the buffer `node_state.buffer_votes`, in a single update of
+    `node_state`, those of `votes` that are neither in the buffer nor in the local view of votes `node_state.view_votes`.
+    As `execute_view_merge` skips the votes already in the view, the external behavior is the same as that of calling
+    `on_vote_received` on each of `votes` in turn.
+    """
+    new_votes = get_votes_not_in_view_or_buffer(from_pvector_to_pset(votes), node_state)
+    return NewNodeStateAndIngestionCounts(
+        state=node_state.set(
+            buffer_votes=pset_merge(
+                node_state.buffer_votes,
+                new_votes
+            )
+        ),
+        counts=IngestionCounts(
+            new_blocks=0,
+            duplicate_blocks=0,
+            new_votes=pset_size(new_votes),
+            duplicate_votes=pvector_size(votes) - pset_size(new_votes)
+        )
+    )
+
+
+def on_blocks_received(blocks: PVector[Block], node_state: NodeState) -> NewNodeStateAndIngestionCounts:
+    """
+    Batch counterpart of `on_block_received`: it adds to the buffer `node_state.buffer_blocks`, in a single update of
+    `node_state`, those of `blocks` that are neither in the buffer nor in `node_state`.
+    As `execute_view_merge` skips the blocks already in `node_state`, whose votes have been merged with them, the external
+    behavior is the same as that of calling `on_block_received` on each of `blocks` in turn.
+    """
+    new_blocks = get_blocks_not_in_view_or_buffer(from_pvector_to_pset(blocks), node_state)
+    return NewNodeStateAndIngestionCounts(
+        state=node_state.set(
+            buffer_blocks=pmap_merge(
+                node_state.buffer_blocks,
+                new_blocks
+            )
+        ),
+        counts=IngestionCounts(
+            new_blocks=pmap_size(new_blocks),
+            duplicate_blocks=pvector_size(blocks) - pmap_size(new_blocks),
+            new_votes=0,
+            duplicate_votes=0
+        )
+    )
+
+
+def on_received_proposes(proposes: PVector[SignedProposeMessage], node_state: NodeState) -> NewNodeStateAndIngestionCounts:
+    """
+    Batch counterpart of `on_received_propose`: it buffers the proposed blocks as `on_blocks_received` does and, during
+    the phase NodePhase.PROPOSE, merges the votes of all the proposer views that are not in the local view of votes, then
+    brings the FFG checkpoints, the pruning and the fork-choice store up to date once for the whole batch.
+    The external behavior is the same as that of calling `on_received_propose` on each of `proposes` in turn.
+    The votes are counted only if merged, i.e. if extracted from the valid aggregated votes of the proposer views, a vote
+    being a duplicate if it is already in the local view of votes.
+    """
+    new_blocks = get_blocks_not_in_view_or_buffer(
+        pset_map(
+            lambda p: p.message.block,
+            from_pvector_to_pset(proposes)
+        ),
+        node_state
+    )
+    node_state = node_state.set(
+        buffer_blocks=pmap_merge(
+            node_state.buffer_blocks,
+            new_blocks
+        )
+    )
+    proposer_views: PSet[SignedVoteMessage] = pset_get_empty()
+    new_votes: PSet[SignedVoteMessage] = pset_get_empty()
+
+    if node_state.current_phase == NodePhase.PROPOSE:
+        aggregates = get_aggregated_votes_in_proposer_views(from_pvector_to_pset(proposes))
+        proposer_views = get_votes_from_valid_aggregated_votes(aggregates, node_state)
+        new_votes = pset_difference(proposer_views, node_state.view_votes)
+        node_state = update_fork_choice_store(prune_view_on_finality(update_FFG_checkpoints(
+            add_aggregated_votes_to_view(
+                aggregates,
+                node_state
+            )
+        )))
+
+    return NewNodeStateAndIngestionCounts(
+        state=node_state,
+        counts=IngestionCounts(
+            new_blocks=pmap_size(new_blocks),
+            duplicate_blocks=pvector_size(proposes) - pmap_size(new_blocks),
+            new_votes=pset_size(new_votes),
+            duplicate_votes=pset_size(proposer_views) - pset_size(new_votes)
+        )
+    )
+
+
 @View
 def finalized_chain(node_state: NodeState) -> PVector[Block]:
     """
     The finalized chain is the chain output by the finalizing component of the protocol.
     """
     return get_blockchain(
-        get_block_from_hash(
-            get_greatest_finalized_checkpoint(node_state).block_hash,
-            node_state
-        ),
+        get_greatest_finalized_block(node_state),
         node_state
     )
 
@@ -262,3 +380,47 @@ def available_chain(node_state: NodeState) -> PVector[Block]:
         node_state.chava,
         node_state
     )
+
+
+def finalized_chain_iterator(node_state: NodeState) -> Iterator[Block]:
+    """
+    Lazy counterpart of `finalized_chain`: it yields the blocks of the finalized chain from its head back to the genesis block
+    only as far as the consumer iterates.
+    """
+    return iterate_blockchain(get_greatest_finalized_block(node_state), node_state)
+
+
+def finalized_chain_in_slot_range(first_slot: int, last_slot: int, node_state: NodeState) -> PVector[Block]:
+    """
+    The blocks of `finalized_chain(node_state)` with a slot between `first_slot` and `last_slot`, both included.
+    """
+    return get_blockchain_in_slot_range(get_greatest_finalized_block(node_state), first_slot, last_slot, node_state)
+
+
+def finalized_chain_since(ancestor_hash: Hash, node_state: NodeState) -> PVector[Block]:
+    """
+    The blocks of `finalized_chain(node_state)` that descend from the block with hash `ancestor_hash`, which must be part of it.
+    """
+    return get_blockchain_since(get_greatest_finalized_block(node_state), ancestor_hash, node_state)
+
+
+def available_chain_iterator(node_state: NodeState) -> Iterator[Block]:
+    """
+    Lazy counterpart of `available_chain`: it yields the blocks of the available chain from `node_state.chava` back to the
+    genesis block only as far as the consumer iterates.
+    """
+    return iterate_blockchain(node_state.chava, node_state)
+
+
+def available_chain_in_slot_range(first_slot: int, last_slot: int, node_state: NodeState) -> PVector[Block]:
+    """
+    The blocks of `available_chain(node_state)` with a slot between `first_slot` and `last_slot`, both included.
+    """
+    return get_blockchain_in_slot_range(node_state.chava, first_slot, last_slot, node_state)
+
+
+def available_chain_since(ancestor_hash: Hash, node_state: NodeState) -> PVector[Block]:
+    """
+    The blocks of `available_chain(node_state)` that descend from the block with hash `ancestor_hash`, which must be part of it.
+    """
+    return get_blockchain_since(node_state.chava, ancestor_hash, node_state)
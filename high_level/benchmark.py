@@ -0,0 +1,360 @@
+"""
+Benchmarks of the hot paths of the specification on synthetic node states, emitting scaling curves as JSON.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+`build_benchmark_state` builds a `NodeState` from `BenchmarkParameters`: a canonical chain of `blocks` blocks,
+`fork_width` forks of `fork_depth` blocks branching off it at evenly spaced points, and `vote_history` slots of votes
+of every validator. Each vote has the tip of the canonical chain at its slot as head, except for one validator in ten,
+which votes for the tip of a fork, and justifies the tip of the canonical chain at its slot. Each block includes the
+votes of the slot before it, aggregated by message.
+The votes of the last slot, and the last block, are left in the buffers to be merged by `execute_view_merge`.
+
+Each benchmark is timed cold, i.e. with the caches of the functions memoized by `memoization.py` cleared before
+each call, and warm, i.e. on repeated calls. Its peak memory is the peak traced by `tracemalloc` during a cold call.
+The state merged by `execute_view_merge` has its checkpoint caches and fork-choice store in sync, so that `get_head`
+and the greatest checkpoints only read them there. Bringing them in sync is timed by `update_FFG_checkpoints` and
+`update_fork_choice_store`, on the merged state with the caches reset to those of `init`, and by
+`get_head_after_store_rebuild`, which also finds the head.
+
+Example, sweeping the validator count and then the block count around the default parameters:
+
+    python benchmark.py --sweep validators=64,128,256,512 --sweep blocks=16,32,64 --output benchmark.json
+
+With `--columnar`, the benchmarks of the columnar views of votes of `columnar_votes.py` also run, with the views
+tracked while the state is prepared and timed: building a view from scratch, extending the tracked view through
+`execute_view_merge`, and running the GHOST vote filters on it.
+
+The benchmarks run on the collection backend selected at startup, see `collection_backends.py`. With `--backend`, they
+run once per backend given, each in its own process, and the report holds one entry per backend:
+
+    python benchmark.py --backend pyrsistent --backend evolver --backend builtin
+"""
+import argparse
+import gc
+import os
+import importlib
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Any, Callable, Optional, Sequence
+
+from pyrsistent import pmap, pset, pvector
+
+import columnar_votes
+import helpers
+import pythonic_code_generic
+from collection_backends import BACKEND_VARIABLE, BACKENDS
+import stubs
+from data_structures import *
+from simulator import make_genesis, make_validator_identities
+
+spec = importlib.import_module('3sf_high_level')
+
+
+@dataclass(frozen=True)
+class BenchmarkParameters:
+    validators: int = 128
+    blocks: int = 32
+    fork_width: int = 2
+    fork_depth: int = 4
+    eta: int = 2
+    vote_history: int = 4
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    benchmark: str
+    parameters: BenchmarkParameters
+    repeats: int
+    cold_seconds: float  # Median over the repeats
+    warm_seconds: float  # Median over the repeats
+    peak_bytes: int
+
+    def to_json(self) -> dict[str, Any]:
+        result = asdict(self)
+        result["parameters"] = asdict(self.parameters)
+        return result
+
+
+def checkpoint_of(block: Block, chkp_slot: int) -> Checkpoint:
+    return Checkpoint(block_hash=stubs.block_hash(block), chkp_slot=chkp_slot, block_slot=block.slot)
+
+
+def aggregate_by_message(votes: PSet[SignedVoteMessage], committee: PVector[NodeIdentity]) -> PSet[AggregatedVoteMessage]:
+    """
+    It aggregates `votes`, cast by members of the sorted validator set `committee`, by message as `helpers.aggregate_votes`
+    does, without requiring the blocks that they reference to be in a node state.
+    """
+    votes_by_message: dict[VoteMessage, list[SignedVoteMessage]] = {}
+    for vote in votes:
+        votes_by_message.setdefault(vote.message, []).append(vote)
+    return pset(
+        AggregatedVoteMessage(
+            message=message,
+            participation_bits=pythonic_code_generic.bitfield_from_members(committee, pset(vote.sender for vote in message_votes)),
+            signature=stubs.aggregate_vote_signatures(pvector(vote.signature for vote in message_votes))
+        )
+        for message, message_votes in votes_by_message.items()
+    )
+
+
+def build_benchmark_state(parameters: BenchmarkParameters) -> NodeState:
+    """
+    It builds the node state described in the module docstring. It calls `stubs.configure`.
+    """
+    identities = make_validator_identities(parameters.validators)
+    committee = pvector(sorted(identities))
+    stubs.configure(pmap({identity: 1 for identity in identities}))
+    genesis = make_genesis()
+    configuration = Configuration(delta=10, genesis=genesis, eta=parameters.eta, k=2)
+    node_state = spec.init(identities[0], configuration)
+
+    first_voting_slot = max(1, parameters.blocks - parameters.vote_history + 1)
+    chain = [genesis]
+    votes_by_slot: dict[int, PSet[SignedVoteMessage]] = {}
+    fork_blocks: list[Block] = []
+    fork_tips: list[Block] = []
+    fork_points = {
+        (parameters.blocks * (fork + 1)) // (parameters.fork_width + 1): fork
+        for fork in range(parameters.fork_width)
+    }
+    source = checkpoint_of(genesis, 0)
+
+    for slot in range(1, parameters.blocks + 1):
+        parent = chain[-1]
+        block = Block(
+            parent_hash=stubs.block_hash(parent),
+            slot=slot,
+            votes=aggregate_by_message(votes_by_slot.get(slot - 1, pset()), committee),
+            body=BlockBody()
+        )
+        chain.append(block)
+
+        if slot - 1 in fork_points:
+            # Forks skip slots so that they do not collide with the canonical chain.
+            fork_block = parent
+            for _ in range(parameters.fork_depth):
+                fork_block = Block(
+                    parent_hash=stubs.block_hash(fork_block),
+                    slot=fork_block.slot + 2 + fork_points[slot - 1],
+                    votes=pset(),
+                    body=BlockBody()
+                )
+                fork_blocks.append(fork_block)
+            fork_tips.append(fork_block)
+
+        if slot >= first_voting_slot:
+            target = checkpoint_of(block, slot)
+            votes = []
+            tips = [tip for tip in fork_tips if tip.slot <= slot]
+            for index, identity in enumerate(identities):
+                head = tips[(index // 10) % len(tips)] if index % 10 == 9 and len(tips) > 0 else block
+                votes.append(stubs.sign_vote_message(
+                    VoteMessage(slot=slot, head_hash=stubs.block_hash(head), ffg_source=source, ffg_target=target),
+                    node_state.set(identity=identity)
+                ))
+            votes_by_slot[slot] = pset(votes)
+            source = target
+
+    node_state = helpers.add_blocks_to_view(pmap({stubs.block_hash(block): block for block in chain[:-1] + fork_blocks}), node_state)
+    node_state = helpers.add_votes_to_view(
+        pythonic_code_generic.pset_merge_flatten(pset(votes for slot, votes in votes_by_slot.items() if slot < parameters.blocks)),
+        node_state
+    )
+    node_state = helpers.set_current_slot(parameters.blocks, node_state)
+    node_state = helpers.update_fork_choice_store(helpers.update_FFG_checkpoints(node_state))
+    return node_state.set(
+        current_phase=NodePhase.CONFIRM,
+        buffer_blocks=pmap({stubs.block_hash(chain[-1]): chain[-1]}),
+        buffer_votes=votes_by_slot.get(parameters.blocks, pset())
+    )
+
+
+def merged_state(node_state: NodeState) -> NodeState:
+    return helpers.execute_view_merge(node_state)
+
+
+def unsynced_checkpoints_state(node_state: NodeState) -> NodeState:
+    """
+    The merged state with only the genesis checkpoint in the caches of justified and finalized checkpoints, as after `init`.
+    """
+    node_state = merged_state(node_state)
+    genesis = helpers.genesis_checkpoint(node_state)
+    return node_state.set(justified_checkpoints=pset([genesis]), finalized_checkpoints=pset([genesis]))
+
+
+def unsynced_store_state(node_state: NodeState) -> NodeState:
+    """
+    The merged state with the empty fork-choice store of `init`, which `update_fork_choice_store` rebuilds from scratch.
+    """
+    node_state = merged_state(node_state)
+    return node_state.set(fork_choice_store=helpers.get_empty_fork_choice_store(stubs.block_hash(node_state.configuration.genesis), pmap()))
+
+
+BENCHMARKS: dict[str, tuple[Callable[[NodeState], Any], Callable[[NodeState], NodeState]]] = {
+    # Name: (function timed, preparation of its argument from the benchmark state, not timed)
+    "get_head": (helpers.get_head, merged_state),
+    "get_greatest_justified_checkpoint": (helpers.get_greatest_justified_checkpoint, merged_state),
+    "get_greatest_finalized_checkpoint": (helpers.get_greatest_finalized_checkpoint, merged_state),
+    "update_FFG_checkpoints": (helpers.update_FFG_checkpoints, unsynced_checkpoints_state),
+    "update_fork_choice_store": (helpers.update_fork_choice_store, unsynced_store_state),
+    "get_head_after_store_rebuild": (lambda node_state: helpers.get_head(helpers.update_fork_choice_store(node_state)), unsynced_store_state),
+    "is_confirmed": (lambda node_state: helpers.is_confirmed(helpers.get_head(node_state), node_state), merged_state),
+    "on_confirm": (spec.on_confirm, merged_state),
+    "votes_to_include_in_proposed_block": (helpers.votes_to_include_in_proposed_block, merged_state),
+    "execute_view_merge": (helpers.execute_view_merge, lambda node_state: node_state),
+}
+
+
+def tracked_state(node_state: NodeState) -> NodeState:
+    """
+    `node_state`, whose columnar view of votes is tracked from now on.
+    """
+    columnar_votes.get_view(node_state)
+    return node_state
+
+
+def columnar_GHOST_votes(node_state: NodeState) -> PSet[SignedVoteMessage]:
+    """
+    The latest non-expired and non-equivocating vote of each sender, from the columnar view of `node_state.view_votes`.
+    """
+    view = columnar_votes.get_view(node_state)
+    return view.votes(view.latest_per_sender_mask(
+        view.non_expired_mask(node_state.current_slot, node_state.configuration.eta) & ~view.equivocating_mask()
+    ))
+
+
+COLUMNAR_BENCHMARKS: dict[str, tuple[Callable[[NodeState], Any], Callable[[NodeState], NodeState]]] = {
+    "columnar_view_from_scratch": (lambda node_state: columnar_votes.ColumnarVoteView.from_votes(node_state.view_votes), merged_state),
+    "columnar_tracked_view_merge": (lambda node_state: columnar_votes.get_view(helpers.execute_view_merge(node_state)), tracked_state),
+    "columnar_GHOST_votes": (columnar_GHOST_votes, lambda node_state: tracked_state(merged_state(node_state))),
+}
+
+
+def measure(function: Callable[[NodeState], Any], node_state: NodeState, repeats: int) -> tuple[float, float, int]:
+    cold = []
+    for _ in range(repeats):
+        pythonic_code_generic.clear_memo_caches()
+        gc.collect()
+        started = time.perf_counter()
+        function(node_state)
+        cold.append(time.perf_counter() - started)
+
+    warm = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function(node_state)
+        warm.append(time.perf_counter() - started)
+
+    pythonic_code_generic.clear_memo_caches()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        function(node_state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(cold), statistics.median(warm), peak - baseline
+
+
+def run_benchmarks(parameters: BenchmarkParameters, names: Sequence[str], repeats: int) -> list[BenchmarkResult]:
+    node_state = build_benchmark_state(parameters)
+    results = []
+    for name in names:
+        if name in COLUMNAR_BENCHMARKS:
+            function, prepare = COLUMNAR_BENCHMARKS[name]
+            with columnar_votes.tracking():
+                cold, warm, peak = measure(function, prepare(node_state), repeats)
+        else:
+            function, prepare = BENCHMARKS[name]
+            cold, warm, peak = measure(function, prepare(node_state), repeats)
+        results.append(BenchmarkResult(name, parameters, repeats, cold, warm, peak))
+    return results
+
+
+def parse_sweep(sweep: str) -> tuple[str, list[int]]:
+    name, values = sweep.split("=", 1)
+    if name not in {f.name for f in fields(BenchmarkParameters)}:
+        raise argparse.ArgumentTypeError(f"unknown parameter {name}")
+    return name, [int(value) for value in values.split(",")]
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_in_backend(backend: str, args: argparse.Namespace) -> dict[str, Any]:
+    """
+    It runs the benchmarks given by `args` in a new process using the collection backend `backend`, and returns its report.
+    """
+    argv = [sys.executable, os.path.abspath(__file__), "--repeats", str(args.repeats)]
+    for f in fields(BenchmarkParameters):
+        argv += [f"--{f.name.replace('_', '-')}", str(getattr(args, f.name))]
+    for name, values in args.sweep:
+        argv += ["--sweep", f"{name}={','.join(str(value) for value in values)}"]
+    for name in args.benchmark or []:
+        argv += ["--benchmark", name]
+    if args.columnar:
+        argv += ["--columnar"]
+    result = subprocess.run(argv, capture_output=True, text=True, check=True, env={**os.environ, BACKEND_VARIABLE: backend})
+    return json.loads(result.stdout)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    for f in fields(BenchmarkParameters):
+        parser.add_argument(f"--{f.name.replace('_', '-')}", type=int, default=f.default)
+    parser.add_argument("--sweep", type=parse_sweep, action="append", default=[], metavar="PARAMETER=V1,V2,...",
+                        help="vary one parameter around the others; can be repeated, each sweep giving one curve")
+    parser.add_argument("--benchmark", action="append", choices=sorted({**BENCHMARKS, **COLUMNAR_BENCHMARKS}), help="defaults to all")
+    parser.add_argument("--columnar", action="store_true", help="also run the benchmarks of the columnar views of votes, see columnar_votes.py")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--backend", action="append", choices=list(BACKENDS),
+                        help="collection backend to compare, in a process of its own; can be repeated")
+    parser.add_argument("--output", help="defaults to the standard output")
+    args = parser.parse_args(argv)
+
+    base = BenchmarkParameters(**{f.name: getattr(args, f.name) for f in fields(BenchmarkParameters)})
+    if args.backend:
+        report: dict[str, Any] = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "base_parameters": asdict(base),
+            "backends": {backend: run_in_backend(backend, args) for backend in args.backend},
+        }
+    else:
+        names = args.benchmark if args.benchmark else list(BENCHMARKS) + (list(COLUMNAR_BENCHMARKS) if args.columnar else [])
+        curves = []
+        for name, values in (args.sweep if args.sweep else [(None, [None])]):
+            points = []
+            for value in values:
+                parameters = base if name is None else replace(base, **{name: value})
+                points.extend(result.to_json() for result in run_benchmarks(parameters, names, args.repeats))
+            curves.append({"parameter": name, "values": values, "results": points})
+
+        report = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "collections_backend": pythonic_code_generic.COLLECTIONS_BACKEND,
+            "base_parameters": asdict(base),
+            "curves": curves,
+        }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Alternative implementations of the collection helpers of `pythonic_code_generic.py`, selected at startup.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+The helpers of `pythonic_code_generic.py` are the only functions of the specification creating collections, and they
+define their semantics. A backend replaces some of them by implementations returning equal collections, faster:
+- `pyrsistent`, the default, keeps the helpers as they are;
+- `evolver` keeps the `pyrsistent` types, but builds the result of bulk operations in a single pass or through an
+  evolver on the larger operand, returns an operand unchanged when the result equals it, and caches the key and value
+  sets of each map;
+- `builtin` uses `frozenset`, the read-only `dict` subclass `FrozenMap` and `tuple` instead of `PSet`, `PMap` and
+  `PVector`, so that bulk operations run in C. Updating a single element copies the collection, which makes it
+  suited to a node owning state that only grows by small collections merged in bulk, and slow for large sets built
+  one element at a time.
+Collections stay immutable with every backend: the specification keeps previous versions of the collections it
+updates, and hashes the sets held by messages.
+
+The backend is read from the environment variable `SSF_COLLECTIONS_BACKEND` when `pythonic_code_generic.py` is first
+imported, so it must be set before starting Python, e.g.
+
+    SSF_COLLECTIONS_BACKEND=builtin python simulator.py
+
+Collections created outside of the specification, e.g. by `stubs.py` or `message_codec.py`, are `pyrsistent` ones,
+which every backend accepts as arguments.
+"""
+import os
+from heapq import heappop, heappush
+from itertools import islice, takewhile
+from typing import Any, Callable, Hashable, Iterable, Iterator, Mapping, TypeVar
+
+from pyrsistent import PMap, PSet, pmap, pset, pvector
+
+T1 = TypeVar('T1')
+T2 = TypeVar('T2')
+
+BACKEND_VARIABLE = "SSF_COLLECTIONS_BACKEND"
+DEFAULT_BACKEND = "pyrsistent"
+
+
+class _IdentityCache:
+    """
+    A cache of a value per object, keyed by its identity, holding at most `maxsize` entries and dropping the oldest
+    first. It keeps a reference to each object so that its identity is not reused while cached.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: dict[int, tuple[Any, Any]] = {}
+
+    def get(self, key_object: Any, compute: Callable[[Any], Any]) -> Any:
+        entry = self.entries.get(id(key_object))
+        if entry is not None and entry[0] is key_object:
+            return entry[1]
+        value = compute(key_object)
+        self.entries[id(key_object)] = (key_object, value)
+        if len(self.entries) > self.maxsize:
+            del self.entries[next(iter(self.entries))]
+        return value
+
+
+# Backend `evolver`
+
+def _as_pset(s: Iterable[T1]) -> PSet[T1]:
+    return s if isinstance(s, PSet) else pset(s)
+
+
+def evolver_pset_merge(a: PSet[T1], b: PSet[T1]) -> PSet[T1]:
+    larger, smaller = (_as_pset(a), b) if len(a) >= len(b) else (_as_pset(b), a)
+    evolver = larger.evolver()
+    for e in smaller:
+        evolver.add(e)
+    return evolver.persistent()
+
+
+def evolver_pset_intersection(s1: PSet[T1], s2: PSet[T1]) -> PSet[T1]:
+    smaller, larger = (s1, s2) if len(s1) <= len(s2) else (s2, s1)
+    kept = [e for e in smaller if e in larger]
+    return _as_pset(smaller) if len(kept) == len(smaller) else pset(kept)
+
+
+def evolver_pset_difference(s1: PSet[T1], s2: PSet[T1]) -> PSet[T1]:
+    if len(s2) < len(s1):
+        evolver = _as_pset(s1).evolver()
+        for e in s2:
+            if e in s1:
+                evolver.remove(e)
+        return evolver.persistent()
+    return pset(e for e in s1 if e not in s2)
+
+
+def evolver_pset_pick_element(s: PSet[T1]) -> T1:
+    return next(iter(s))
+
+
+def evolver_pset_filter(p: Callable[[T1], bool], s: PSet[T1]) -> PSet[T1]:
+    kept = []
+    rejected = []
+    for e in s:
+        (kept if p(e) else rejected).append(e)
+    if len(rejected) <= len(kept):
+        # Removing the few rejected elements shares the structure of `s`, and returns `s` itself if there are none.
+        evolver = _as_pset(s).evolver()
+        for e in rejected:
+            evolver.remove(e)
+        return evolver.persistent()
+    return pset(kept)
+
+
+def evolver_pset_map(p: Callable[[T1], T2], s: PSet[T1]) -> PSet[T2]:
+    return pset(map(p, s))
+
+
+_pmap_keys = _IdentityCache(1024)
+_pmap_values = _IdentityCache(1024)
+
+
+def evolver_pmap_keys(d: PMap[T1, T2]) -> PSet[T1]:
+    return _pmap_keys.get(d, lambda m: pset(m.keys()))
+
+
+def evolver_pmap_values(d: PMap[T1, T2]) -> PSet[T2]:
+    return _pmap_values.get(d, lambda m: pset(m.values()))
+
+
+def evolver_pmap_merge(a: PMap[T1, T2], b: PMap[T1, T2]) -> PMap[T1, T2]:
+    if len(b) == 0:
+        return a
+    return a.update(b)
+
+
+# Backend `builtin`
+
+class FrozenMap(dict):
+    """
+    A read-only `dict`, hashable like a `PMap`, whose hash is computed once.
+    """
+    __slots__ = ('_hash',)
+
+    def __hash__(self) -> int:  # type: ignore[override]
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash(frozenset(self.items()))
+            return self._hash
+
+    def _read_only(self, *args: Any, **kwargs: Any) -> Any:
+        raise TypeError("FrozenMap is immutable")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _read_only  # type: ignore[assignment]
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return (FrozenMap, (dict(self),))
+
+
+_EMPTY_SET: frozenset = frozenset()
+_EMPTY_MAP = FrozenMap()
+
+
+def builtin_pvector_of_one_element(e: T1) -> tuple[T1, ...]:
+    return (e,)
+
+
+def builtin_pvector_get_empty() -> tuple[T1, ...]:
+    return ()
+
+
+def builtin_pvector_concat(a: Iterable[T1], b: Iterable[T1]) -> tuple[T1, ...]:
+    return tuple(a) + tuple(b)
+
+
+def builtin_from_set_to_pvector(s: Iterable[T1]) -> tuple[T1, ...]:
+    return tuple(s)
+
+
+def builtin_pset_get_empty() -> frozenset:
+    return _EMPTY_SET
+
+
+def builtin_pset_merge(a: Iterable[T1], b: Iterable[T1]) -> frozenset:
+    return frozenset(a).union(b)
+
+
+def builtin_pset_merge_flatten(s: Iterable[Iterable[T1]]) -> frozenset:
+    return frozenset().union(*s)
+
+
+def builtin_pset_intersection(s1: Iterable[T1], s2: Iterable[T1]) -> frozenset:
+    return frozenset(s1).intersection(s2)
+
+
+def builtin_pset_difference(s1: Iterable[T1], s2: Iterable[T1]) -> frozenset:
+    return frozenset(s1).difference(s2)
+
+
+def builtin_pset_get_singleton(e: T1) -> frozenset:
+    return frozenset((e,))
+
+
+def builtin_pset_add(s: Iterable[T1], e: T1) -> frozenset:
+    if isinstance(s, frozenset) and e in s:
+        return s
+    return frozenset(s).union((e,))
+
+
+def builtin_pset_remove(s: Iterable[T1], e: T1) -> frozenset:
+    return frozenset(s).difference((e,))
+
+
+def builtin_pset_sort(s: Iterable[T1], a: Callable[[T1], int]) -> tuple[T1, ...]:
+    return tuple(sorted(s, key=a))
+
+
+def builtin_pset_pick_element(s: Iterable[T1]) -> T1:
+    return next(iter(s))
+
+
+def builtin_pset_filter(p: Callable[[T1], bool], s: Iterable[T1]) -> frozenset:
+    return frozenset(filter(p, s))
+
+
+def builtin_pvector_iterate_while(p: Callable[[T1], bool], f: Callable[[T1], T1], e: T1) -> tuple[T1, ...]:
+    values = [e]
+    while p(e):
+        e = f(e)
+        values.append(e)
+    return tuple(values)
+
+
+def builtin_iterator_take(n: int, it: Iterator[T1]) -> tuple[T1, ...]:
+    return tuple(islice(it, max(n, 0)))
+
+
+def builtin_iterator_take_while(p: Callable[[T1], bool], it: Iterator[T1]) -> tuple[T1, ...]:
+    return tuple(takewhile(p, it))
+
+
+def builtin_pvector_find_first(p: Callable[[T1], bool], v: Iterable[T1]) -> tuple[T1, ...]:
+    return tuple(islice(filter(p, v), 1))
+
+
+def builtin_pmap_propagate_to_ancestors(values: Mapping[T1, int], rank: Callable[[T1], int], parent: Callable[[T1], T1], is_root: Callable[[T1], bool]) -> FrozenMap:
+    sums: dict[T1, int] = dict(values)
+    heap: list[tuple[int, int, T1]] = [(-rank(e), n, e) for n, e in enumerate(sums)]
+    heap.sort()
+    n = len(sums)
+    while heap:
+        _, _, e = heappop(heap)
+        if not is_root(e):
+            p = parent(e)
+            if p not in sums:
+                sums[p] = 0
+                heappush(heap, (-rank(p), n, p))
+                n += 1
+            sums[p] += sums[e]
+    return FrozenMap(sums)
+
+
+def builtin_from_pvector_to_pset(v: Iterable[T1]) -> frozenset:
+    return frozenset(v)
+
+
+def builtin_pset_map(p: Callable[[T1], T2], s: Iterable[T1]) -> frozenset:
+    return frozenset(map(p, s))
+
+
+def builtin_pset_group_by(f: Callable[[T1], T2], s: Iterable[T1]) -> FrozenMap:
+    groups: dict[T2, list[T1]] = {}
+    for e in s:
+        groups.setdefault(f(e), []).append(e)
+    return FrozenMap({k: frozenset(v) for k, v in groups.items()})
+
+
+def builtin_bitfield_members(v: Iterable[T1], bits: int) -> frozenset:
+    return frozenset(e for i, e in enumerate(v) if (bits >> i) & 1)
+
+
+def builtin_pset_to_pmap(f: Callable[[T1], T2], s: Iterable[T1]) -> FrozenMap:
+    return FrozenMap({e: f(e) for e in s})
+
+
+def builtin_pmap_get_empty() -> FrozenMap:
+    return _EMPTY_MAP
+
+
+def builtin_pmap_set(pm: Mapping[T1, T2], k: T1, v: T2) -> FrozenMap:
+    d = dict(pm)
+    d[k] = v
+    return FrozenMap(d)
+
+
+def builtin_pmap_remove(pm: Mapping[T1, T2], k: T1) -> FrozenMap:
+    d = dict(pm)
+    del d[k]
+    return FrozenMap(d)
+
+
+def builtin_pmap_merge(a: Mapping[T1, T2], b: Mapping[T1, T2]) -> FrozenMap:
+    if len(b) == 0 and isinstance(a, FrozenMap):
+        return a
+    d = dict(a)
+    d.update(b)
+    return FrozenMap(d)
+
+
+def builtin_pmap_keys(d: Mapping[T1, T2]) -> frozenset:
+    return frozenset(d.keys())
+
+
+def builtin_pmap_values(d: Mapping[T1, T2]) -> frozenset:
+    return frozenset(d.values())
+
+
+def _functions_with_prefix(prefix: str) -> dict[str, Callable]:
+    return {name[len(prefix):]: value for name, value in globals().items() if name.startswith(prefix) and callable(value)}
+
+
+BACKENDS: dict[str, dict[str, Callable]] = {
+    # Name: functions replacing the helpers of `pythonic_code_generic.py` with the same name
+    "pyrsistent": {},
+    "evolver": _functions_with_prefix("evolver_"),
+    "builtin": _functions_with_prefix("builtin_"),
+}
+
+
+def selected_backend() -> str:
+    """
+    The backend named by the environment variable `SSF_COLLECTIONS_BACKEND`, by default `pyrsistent`.
+    """
+    backend = os.environ.get(BACKEND_VARIABLE, DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown {BACKEND_VARIABLE} {backend!r}, expected one of {', '.join(BACKENDS)}")
+    return backend
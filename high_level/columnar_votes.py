@@ -0,0 +1,354 @@
+"""
+Columnar representation of a set of votes, on which the vote filters of the specification run as NumPy array operations.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+A `ColumnarVoteView` stores one row per vote, with the senders, head hashes and checkpoints interned into tables
+shared by all the views extending one another. `SignedVoteMessage`s are rebuilt from the columns on demand, so that
+the result of any of the filters below can be handed back to the specification functions.
+
+The views are opt-in: `enable` starts tracking the local views of votes of the nodes, by appending the votes added by
+`add_votes_to_view` to the columnar view of the votes they are added to, if there is one, and `get_view` returns the
+columnar view of `node_state.view_votes`, only building it from scratch the first time it is asked for or after
+another change, e.g. pruning. `disable` stops tracking, so that it costs nothing while disabled.
+`python benchmark.py --columnar` times the tracked views against the specification.
+
+Example:
+
+    with tracking():
+        simulation.run(10)
+        view = get_view(simulation.nodes[0].state)
+        equivocating_votes = view.votes(view.equivocating_mask())
+"""
+import importlib
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Callable, Generic, Hashable, Iterable, Iterator, Optional, TypeVar
+
+import numpy as np
+from pyrsistent import PSet, pset
+
+import helpers
+from data_structures import Checkpoint, Hash, NodeIdentity, NodeState, Signature, SignedVoteMessage, VoteMessage
+from pythonic_code_generic import BoundedCache
+
+spec = importlib.import_module('3sf_high_level')
+
+T = TypeVar('T', bound=Hashable)
+
+_COLUMNS = ("slot", "sender", "head", "source", "target", "target_chkp_slot")
+
+
+class InternTable(Generic[T]):
+    """
+    It assigns dense indices to values in order of first appearance. It is append-only, so that the indices handed out
+    stay valid for all the views sharing the table.
+    """
+
+    def __init__(self) -> None:
+        self.values: list[T] = []
+        self.indices: dict[T, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def intern(self, value: T) -> int:
+        index = self.indices.get(value)
+        if index is None:
+            index = len(self.values)
+            self.indices[value] = index
+            self.values.append(value)
+        return index
+
+    def find(self, value: T) -> Optional[int]:
+        return self.indices.get(value)
+
+
+class _Rows:
+    """
+    The columns of the rows of the views extending one another, with spare capacity at their end. Rows are appended in
+    place only by the view holding all of them, so that the rows of the other views never change.
+    """
+
+    def __init__(self) -> None:
+        self.columns: dict[str, np.ndarray] = {name: np.zeros(0, dtype=np.int64) for name in _COLUMNS}
+        self.signatures: list[Signature] = []
+        self.length = 0
+
+    def copy(self, length: int) -> "_Rows":
+        """
+        A copy of the first `length` rows.
+        """
+        rows = _Rows()
+        rows.columns = {name: column[:length].copy() for name, column in self.columns.items()}
+        rows.signatures = self.signatures[:length]
+        rows.length = length
+        return rows
+
+    def append(self, values: dict[str, list[int]], signatures: list[Signature]) -> None:
+        length = self.length + len(signatures)
+        if length > len(self.columns["slot"]):
+            capacity = max(length, 2 * len(self.columns["slot"]), 64)
+            for name, column in self.columns.items():
+                grown = np.zeros(capacity, dtype=np.int64)
+                grown[:self.length] = column[:self.length]
+                self.columns[name] = grown
+        for name, column in self.columns.items():
+            column[self.length:length] = values[name]
+        self.signatures.extend(signatures)
+        self.length = length
+
+
+class ColumnarVoteView:
+    """
+    An immutable columnar view of a set of votes. Masks are boolean arrays with one entry per row.
+    """
+
+    def __init__(
+        self,
+        senders: InternTable[NodeIdentity],
+        heads: InternTable[Hash],
+        checkpoints: InternTable[Checkpoint],
+        rows: _Rows,
+        length: int,
+        votes: PSet[SignedVoteMessage]
+    ):
+        self.senders = senders
+        self.heads = heads
+        self.checkpoints = checkpoints
+        self.rows = rows
+        self.length = length
+        self.slot = rows.columns["slot"][:length]
+        self.sender = rows.columns["sender"][:length]
+        self.head = rows.columns["head"][:length]
+        self.source = rows.columns["source"][:length]
+        self.target = rows.columns["target"][:length]
+        self.target_chkp_slot = rows.columns["target_chkp_slot"][:length]
+        self.signatures = rows.signatures
+        self.source_votes = votes
+
+    @staticmethod
+    def empty() -> "ColumnarVoteView":
+        return ColumnarVoteView(InternTable(), InternTable(), InternTable(), _Rows(), 0, pset())
+
+    @staticmethod
+    def from_votes(votes: Iterable[SignedVoteMessage]) -> "ColumnarVoteView":
+        return ColumnarVoteView.empty().extended(votes)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def extended(self, votes: Iterable[SignedVoteMessage], source_votes: Optional[PSet[SignedVoteMessage]] = None) -> "ColumnarVoteView":
+        """
+        It returns a view that also holds the `votes` not already held by this one, whose set of votes is `source_votes`
+        if given. This view is left unchanged. The rows of the returned view are appended to those of this one, in
+        place unless another view already extends this one, so that this costs the number of new votes.
+        """
+        new_votes = [vote for vote in votes if vote not in self.source_votes]
+        if len(new_votes) == 0:
+            return self if source_votes is None else ColumnarVoteView(
+                self.senders, self.heads, self.checkpoints, self.rows, self.length, source_votes
+            )
+
+        rows = self.rows if self.rows.length == self.length else self.rows.copy(self.length)
+        rows.append(
+            {
+                "slot": [v.message.slot for v in new_votes],
+                "sender": [self.senders.intern(v.sender) for v in new_votes],
+                "head": [self.heads.intern(v.message.head_hash) for v in new_votes],
+                "source": [self.checkpoints.intern(v.message.ffg_source) for v in new_votes],
+                "target": [self.checkpoints.intern(v.message.ffg_target) for v in new_votes],
+                "target_chkp_slot": [v.message.ffg_target.chkp_slot for v in new_votes],
+            },
+            [v.signature for v in new_votes]
+        )
+        return ColumnarVoteView(
+            self.senders,
+            self.heads,
+            self.checkpoints,
+            rows,
+            rows.length,
+            self.source_votes.update(new_votes) if source_votes is None else source_votes
+        )
+
+    def vote(self, row: int) -> SignedVoteMessage:
+        """
+        It rebuilds the vote stored at `row`.
+        """
+        return SignedVoteMessage(
+            message=VoteMessage(
+                slot=int(self.slot[row]),
+                head_hash=self.heads.values[self.head[row]],
+                ffg_source=self.checkpoints.values[self.source[row]],
+                ffg_target=self.checkpoints.values[self.target[row]]
+            ),
+            signature=self.signatures[row],
+            sender=self.senders.values[self.sender[row]]
+        )
+
+    def votes(self, mask: np.ndarray) -> PSet[SignedVoteMessage]:
+        """
+        It rebuilds the votes selected by `mask`.
+        """
+        return pset(self.vote(row) for row in np.flatnonzero(mask))
+
+    def all_rows(self) -> np.ndarray:
+        return np.ones(len(self), dtype=bool)
+
+    def no_rows(self) -> np.ndarray:
+        return np.zeros(len(self), dtype=bool)
+
+    def non_expired_mask(self, current_slot: int, eta: int) -> np.ndarray:
+        """
+        The votes that are not expired, see `is_GHOST_vote_expired`.
+        """
+        return self.slot + eta >= current_slot
+
+    def equivocating_mask(self) -> np.ndarray:
+        """
+        The votes whose sender has voted for more than one head in the slot of the vote, see `is_equivocating_GHOST_vote`.
+        """
+        if len(self) == 0:
+            return self.no_rows()
+        _, group = np.unique(np.stack([self.sender, self.slot], axis=1), axis=0, return_inverse=True)
+        group = group.reshape(-1)
+        group_heads = np.unique(np.stack([group, self.head], axis=1), axis=0)
+        return np.bincount(group_heads[:, 0], minlength=group.max() + 1)[group] > 1
+
+    def latest_per_sender_mask(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Among the votes selected by `mask`, one vote per sender with the greatest slot, see `filter_out_non_LMD_GHOST_votes`.
+        """
+        rows = np.flatnonzero(self.all_rows() if mask is None else mask)
+        result = self.no_rows()
+        if len(rows) == 0:
+            return result
+        ordered = rows[np.lexsort((self.slot[rows], self.sender[rows]))]
+        senders = self.sender[ordered]
+        is_last_of_sender = np.append(senders[1:] != senders[:-1], True)
+        result[ordered[is_last_of_sender]] = True
+        return result
+
+    def ffg_target_slot_mask(self, chkp_slot: int) -> np.ndarray:
+        """
+        The votes whose FFG target has checkpoint slot `chkp_slot`, see `get_FFG_votes_for_target_slot`.
+        """
+        return self.target_chkp_slot == chkp_slot
+
+    def ffg_target_mask(self, checkpoint: Checkpoint) -> np.ndarray:
+        """
+        The votes whose FFG target is `checkpoint`, see `get_FFG_votes_for_target`.
+        """
+        index = self.checkpoints.find(checkpoint)
+        return self.no_rows() if index is None else self.target == index
+
+    def ffg_source_mask(self, checkpoint: Checkpoint) -> np.ndarray:
+        """
+        The votes whose FFG source is `checkpoint`, see `get_FFG_votes_from_source`.
+        """
+        index = self.checkpoints.find(checkpoint)
+        return self.no_rows() if index is None else self.source == index
+
+    def ffg_targets(self, mask: Optional[np.ndarray] = None) -> PSet[Checkpoint]:
+        """
+        The FFG targets of the votes selected by `mask`, see `get_set_FFG_targets`.
+        """
+        targets = self.target if mask is None else self.target[mask]
+        return pset(self.checkpoints.values[index] for index in np.unique(targets))
+
+
+class ColumnarVoteViewCache:
+    """
+    It keeps the columnar views of the `maxsize` sets of votes most recently asked about or added to, keyed by the sets
+    themselves, so that the views of the states of several nodes, or of several states of a node, are kept together.
+    """
+
+    def __init__(self, maxsize: int = 64) -> None:
+        self.views = BoundedCache(maxsize)
+        self.rebuilds = 0
+
+    def lookup(self, votes: PSet[SignedVoteMessage]) -> Optional[ColumnarVoteView]:
+        found, view = self.views.lookup(id(votes))
+        return view if found and view.source_votes is votes else None
+
+    def get(self, node_state: NodeState) -> ColumnarVoteView:
+        """
+        The columnar view of `node_state.view_votes`, built from scratch unless it is kept.
+        """
+        view = self.lookup(node_state.view_votes)
+        if view is None:
+            self.rebuilds += 1
+            view = ColumnarVoteView.empty().extended(node_state.view_votes, node_state.view_votes)
+            self.views.store(id(node_state.view_votes), view)
+        return view
+
+    def added(self, votes: PSet[SignedVoteMessage], before: NodeState, after: NodeState) -> None:
+        """
+        It records that `add_votes_to_view(votes, before)` returned `after`, by appending the added votes to the view
+        of `before.view_votes`, if it is kept.
+        """
+        view = self.lookup(before.view_votes)
+        if view is not None and after.view_votes is not before.view_votes:
+            self.views.store(id(after.view_votes), view.extended(
+                (vote for vote in votes if vote in after.view_votes),
+                after.view_votes
+            ))
+
+    def clear(self) -> None:
+        self.views.clear()
+
+
+_active: Optional[ColumnarVoteViewCache] = None
+_patches: list[tuple[ModuleType, str, Callable]] = []
+
+
+def enable(maxsize: int = 64) -> ColumnarVoteViewCache:
+    """
+    It starts tracking the local views of votes, and returns the cache holding their columnar views.
+    """
+    global _active
+    if _active is None:
+        cache = ColumnarVoteViewCache(maxsize)
+        original = helpers.add_votes_to_view
+
+        def add_votes_to_view(votes: PSet[SignedVoteMessage], node_state: NodeState) -> NodeState:
+            result = original(votes, node_state)
+            cache.added(votes, node_state, result)
+            return result
+
+        for module in (helpers, spec):
+            if vars(module).get("add_votes_to_view") is original:
+                _patches.append((module, "add_votes_to_view", original))
+                setattr(module, "add_votes_to_view", add_votes_to_view)
+        _active = cache
+    return _active
+
+
+def disable() -> Optional[ColumnarVoteViewCache]:
+    """
+    It stops tracking the local views of votes, and returns the cache that was holding their columnar views, if any.
+    """
+    global _active
+    cache = _active
+    for module, name, original in reversed(_patches):
+        setattr(module, name, original)
+    _patches.clear()
+    _active = None
+    return cache
+
+
+@contextmanager
+def tracking(maxsize: int = 64) -> Iterator[ColumnarVoteViewCache]:
+    cache = enable(maxsize)
+    try:
+        yield cache
+    finally:
+        disable()
+
+
+def get_view(node_state: NodeState) -> ColumnarVoteView:
+    """
+    The columnar view of `node_state.view_votes`, kept by the tracking cache if enabled, and built from scratch otherwise.
+    """
+    if _active is not None:
+        return _active.get(node_state)
+    return ColumnarVoteView.from_votes(node_state.view_votes)
@@ -1,9 +1,53 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from pyrsistent import PRecord, field, PSet, PMap, PVector
 from enum import Enum
+from typing import Any
+import collections.abc
+
+
+def content_of(value: Any) -> Any:
+    if isinstance(value, collections.abc.Set):
+        return frozenset(value)
+    elif isinstance(value, collections.abc.Sequence) and not isinstance(value, str):
+        return tuple(value)
+    else:
+        return value
+
+
+class ContentHashed:
+    """
+    Base of the frozen dataclasses, declared with `eq=False`, whose hash is computed from their content on first use
+    and then cached on the instance, as they are large (e.g. a `Block` and its votes) and hashed or compared often.
+    Equality is content equality: it is decided by identity or by differing hashes in constant time, and it only
+    compares the content of distinct instances with equal hashes.
+    The cached hash is not pickled, as hashes of strings differ across processes.
+    Sets and sequences are compared by their elements whatever their type, see `collection_backends.py`.
+    """
+
+    def content(self) -> tuple[Any, ...]:
+        return tuple(content_of(getattr(self, f.name)) for f in fields(self))  # type: ignore[arg-type]
+
+    def __hash__(self) -> int:
+        try:
+            return self.__dict__["_content_hash"]
+        except KeyError:
+            content_hash = hash(self.content())
+            object.__setattr__(self, "_content_hash", content_hash)
+            return content_hash
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return hash(self) == hash(other) and self.content() == other.content()  # type: ignore[attr-defined]
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = dict(self.__dict__)
+        state.pop("_content_hash", None)
+        return state
 
 
-@dataclass(frozen=True)
 class Hash(str):
     pass
 
@@ -13,7 +57,6 @@ class Signature:
     pass
 
 
-@dataclass(frozen=True)
 class NodeIdentity(str):
     pass
 
@@ -28,47 +71,58 @@ class Checkpoint:
     block_slot: int
 
 
-@dataclass(frozen=True)
-class VoteMessage:
+@dataclass(frozen=True, eq=False)
+class VoteMessage(ContentHashed):
     slot: int  # Do we need this. We could just use ffg_target.slot
     head_hash: Hash
     ffg_source: Checkpoint
     ffg_target: Checkpoint
 
 
-@dataclass(frozen=True)
-class SignedVoteMessage:
+@dataclass(frozen=True, eq=False)
+class SignedVoteMessage(ContentHashed):
     message: VoteMessage
     signature: Signature
     sender: NodeIdentity
 
 
+@dataclass(frozen=True, eq=False)
+class AggregatedVoteMessage(ContentHashed):
+    message: VoteMessage
+    participation_bits: int  # Bit `i` is set iff the `i`-th validator of `get_aggregation_committee(message, node_state)` signed `message`
+    signature: Signature  # Aggregate of the signatures of the participants
+
+
+@dataclass(frozen=True)
+class AggregatedVoteSignature(Signature):
+    aggregate: AggregatedVoteMessage  # Aggregated vote from which a vote is extracted, whose signature covers the vote if its sender participates in it
+
+
 @dataclass(frozen=True)
 class BlockBody(object):
     pass
 
 
-@dataclass(frozen=True)
-class Block:
+@dataclass(frozen=True, eq=False)
+class Block(ContentHashed):
     parent_hash: Hash
     slot: int
-    votes: PSet[SignedVoteMessage]
+    votes: PSet[AggregatedVoteMessage]
     body: BlockBody
 
 
-@dataclass(frozen=True)
-class ProposeMessage:
+@dataclass(frozen=True, eq=False)
+class ProposeMessage(ContentHashed):
     block: Block
-    proposer_view: PVector[SignedVoteMessage]
+    proposer_view: PVector[AggregatedVoteMessage]
 
 
-@dataclass(frozen=True)
-class SignedProposeMessage:
+@dataclass(frozen=True, eq=False)
+class SignedProposeMessage(ContentHashed):
     message: ProposeMessage
     signature: Signature
 
 
-@dataclass(frozen=True)
 class NodePhase(Enum):
     PROPOSE = 0
     VOTE = 1
@@ -76,12 +130,34 @@ class NodePhase(Enum):
     MERGE = 3
 
 
+@dataclass(frozen=True)
+class SenderAndSlot:
+    sender: NodeIdentity
+    slot: int
+
+
+@dataclass(frozen=True)
+class AncestryIndexEntry:
+    depth: int  # Number of blocks between the block and the genesis block
+    jump_hash: Hash  # Hash of an ancestor used to skip over the parents in between, see `get_ancestor_at_depth`
+    increasing_slots_depth: int  # Depth of the earliest ancestor from which slots strictly increase up to the block, see `get_latest_ancestor_not_after_slot`
+
+
+class ForkChoiceStore(PRecord):
+    justified_hash: Hash = field()  # Hash of the block from which the weights below are maintained
+    validator_balances: ValidatorBalances = field()  # Balances used to weight the votes
+    latest_heads: PMap[NodeIdentity, Hash] = field()  # Head hash of the GHOST vote currently counted for each validator
+    weights: PMap[Hash, int] = field()  # GHOST weight of each block descendant of `justified_hash` that has a non-zero weight
+    stale_senders: PSet[NodeIdentity] = field()  # Senders whose counted head may be out of date, see `update_fork_choice_store`
+
+
 @dataclass(frozen=True)
 class Configuration():
     delta: int
     genesis: Block
     eta: int
     k: int
+    prune_on_finality: bool = False  # Whether to prune the view every time that the greatest finalized checkpoint advances, see `prune_view_on_finality`
 
 
 class NodeState(PRecord):
@@ -90,8 +166,21 @@ class NodeState(PRecord):
     current_slot: int = field(type=int)
     current_phase: NodePhase = field(type=NodePhase)
     view_blocks: PMap[Hash, Block] = field()  # Using field(type=dict[Hash,Block]) raises a max stack depth rec. error in execution. Same for sets below
+    view_children: PMap[Hash, PSet[Hash]] = field()  # Index over `view_blocks`: parent hash -> hashes of its children
+    view_ancestry: PMap[Hash, AncestryIndexEntry] = field()  # Index over the blocks in `view_blocks` and `archived_blocks` that are part of a complete chain
+    archived_blocks: PMap[Hash, Block] = field()  # Headers of the blocks of the finalized chain preceding `pruning_anchor`, moved out of `view_blocks` by `prune_view_on_finality`
+    pruning_anchor: Checkpoint = field()  # Greatest finalized checkpoint at the time of the last pruning
+    fork_choice_store: ForkChoiceStore = field()  # Index over `view_votes` used by `get_head`
     view_votes: PSet[SignedVoteMessage] = field()
+    latest_messages: PMap[NodeIdentity, PSet[SignedVoteMessage]] = field()  # Index over the votes in `view_votes` that are not expired, by sender
+    view_vote_heads: PMap[SenderAndSlot, PSet[Hash]] = field()  # Index over `view_votes`: head hashes voted by each sender in each slot
+    view_votes_by_head: PMap[Hash, PSet[SignedVoteMessage]] = field()  # Index over `view_votes`: head hash -> votes
+    ffg_votes_by_target: PMap[int, PMap[Checkpoint, PSet[SignedVoteMessage]]] = field()  # Index over `view_votes`: target checkpoint slot -> target -> votes
+    ffg_votes_by_source: PMap[Checkpoint, PSet[SignedVoteMessage]] = field()  # Index over `view_votes`: source -> votes, i.e. the FFG links out of each checkpoint
+    justified_checkpoints: PSet[Checkpoint] = field()  # Cache of `get_justified_checkpoints`
+    finalized_checkpoints: PSet[Checkpoint] = field()  # Cache of `get_finalized_checkpoints`
     buffer_votes: PSet[SignedVoteMessage] = field()
+    pending_aggregates: PSet[AggregatedVoteMessage] = field()  # Aggregated votes received whose committee is not known yet, see `add_aggregated_votes_to_view`
     buffer_blocks: PMap[Hash, Block] = field()
     s_cand: PSet[Block] = field()
     chava: Block = field()
@@ -102,3 +191,17 @@ class NewNodeStateAndMessagesToTx:
     state: NodeState
     proposeMessagesToTx: PSet[SignedProposeMessage]
     voteMessagesToTx: PSet[SignedVoteMessage]
+
+
+@dataclass(frozen=True)
+class IngestionCounts:
+    new_blocks: int  # Blocks neither in the view nor in the buffer
+    duplicate_blocks: int
+    new_votes: int  # Votes neither in the view nor, for received votes, in the buffer
+    duplicate_votes: int
+
+
+@dataclass(frozen=True)
+class NewNodeStateAndIngestionCounts:
+    state: NodeState
+    counts: IngestionCounts
@@ -29,6 +29,13 @@ def get_phase_from_time(time: int, node_state: NodeState) -> NodePhase:
         return NodePhase.PROPOSE
 
 
+def is_genesis_block(block: Block, node_state: NodeState) -> bool:
+    """
+    It checks whether `block` is the genesis block `node_state.configuration.genesis`, comparing their hashes.
+    """
+    return block_hash(block) == block_hash(node_state.configuration.genesis)
+
+
 def genesis_checkpoint(node_state: NodeState) -> Checkpoint:
     """
     It defines the genesis block.
@@ -42,9 +49,10 @@ def genesis_checkpoint(node_state: NodeState) -> Checkpoint:
 
 def has_block_hash(block_hash: Hash, node_state: NodeState) -> bool:
     """
-    It checks if a given `block_hash` is present within a `node_state`.
+    It checks if a given `block_hash` is present within a `node_state`, either in the local view of blocks or
+    among the blocks of the finalized chain archived by `prune_view_on_finality`.
     """
-    return pmap_has(node_state.view_blocks, block_hash)
+    return pmap_has(node_state.view_blocks, block_hash) or pmap_has(node_state.archived_blocks, block_hash)
 
 
 def get_block_from_hash(block_hash: Hash, node_state: NodeState) -> Block:
@@ -52,7 +60,10 @@ def get_block_from_hash(block_hash: Hash, node_state: NodeState) -> Block:
     It retrieves the block associated to a `block_hash`.
     """
     Requires(has_block_hash(block_hash, node_state))
-    return pmap_get(node_state.view_blocks, block_hash)
+    if pmap_has(node_state.view_blocks, block_hash):
+        return pmap_get(node_state.view_blocks, block_hash)
+    else:
+        return pmap_get(node_state.archived_blocks, block_hash)
 
 
 def has_parent(block: Block, node_state: NodeState) -> bool:
@@ -72,7 +83,8 @@ def get_parent(block: Block, node_state: NodeState) -> Block:
 
 def get_all_blocks(node_state: NodeState) -> PSet[Block]:
     """
-    It retrieves all the blocks in a `node_state`.
+    It retrieves all the blocks in the local view of blocks of a `node_state`, which does not include the blocks
+    archived by `prune_view_on_finality`.
     """
     return pmap_values(node_state.view_blocks)
 
@@ -88,13 +100,27 @@ def is_complete_chain(block: Block, node_state: NodeState) -> bool:
     """
     It checks if a given `block` is part of a complete chain of blocks that reaches back to the genesis block `node_state.configuration.genesis`
     within a `node_state`.
+    The blocks of `node_state` that are part of a complete chain are exactly those in the ancestry index, see `has_ancestry_index_entry`.
+    Hence, `block` is part of a complete chain if it is the genesis block, if it is in the ancestry index or if its parent is,
+    the latter covering the blocks that are not in `node_state`.
     """
-    if block == node_state.configuration.genesis:
-        return True
-    elif not has_parent(block, node_state):
-        return False
-    else:
-        return is_complete_chain(get_parent(block, node_state), node_state)
+    return (
+        is_genesis_block(block, node_state) or
+        has_ancestry_index_entry(block_hash(block), node_state) or
+        has_ancestry_index_entry(block.parent_hash, node_state)
+    )
+
+
+def get_chain_up_to_missing_parent(block: Block, node_state: NodeState) -> PVector[Block]:
+    """
+    It retrieves `block` followed by its ancestors within `node_state`, walking back until it reaches either the genesis block
+    or a block whose parent is not in `node_state`.
+    """
+    return pvector_iterate_while(
+        lambda b: not is_genesis_block(b, node_state) and has_parent(b, node_state),
+        lambda b: get_parent(b, node_state),
+        block
+    )
 
 
 def get_blockchain(block: Block, node_state: NodeState) -> PVector[Block]:
@@ -103,47 +129,232 @@ def get_blockchain(block: Block, node_state: NodeState) -> PVector[Block]:
     assuming the given `block` is part of a complete chain.
     """
     Requires(is_complete_chain(block, node_state))
-    if block == node_state.configuration.genesis:
-        return pvector_of_one_element(block)
+    return get_chain_up_to_missing_parent(block, node_state)
+
+
+def iterate_blockchain(block: Block, node_state: NodeState) -> Iterator[Block]:
+    """
+    Lazy counterpart of `get_blockchain`: it yields the blocks of the blockchain of `block` starting from `block`, walking
+    back towards the genesis block only as far as the consumer iterates.
+    """
+    Requires(is_complete_chain(block, node_state))
+    return iterator_iterate_while(
+        lambda b: not is_genesis_block(b, node_state) and has_parent(b, node_state),
+        lambda b: get_parent(b, node_state),
+        block
+    )
+
+
+def get_blockchain_tip(block: Block, n: int, node_state: NodeState) -> PVector[Block]:
+    """
+    It retrieves the first `n` blocks of `get_blockchain(block, node_state)`, i.e. `block` and its `n - 1` closest ancestors.
+    """
+    return iterator_take(n, iterate_blockchain(block, node_state))
+
+
+def get_blockchain_since(block: Block, ancestor_hash: Hash, node_state: NodeState) -> PVector[Block]:
+    """
+    It retrieves the blocks of `get_blockchain(block, node_state)` that descend from the block with hash `ancestor_hash`,
+    i.e. all the blocks preceding it in `get_blockchain(block, node_state)`.
+    """
+    Requires(has_block_hash(ancestor_hash, node_state))
+    Requires(is_ancestor_descendant_relationship(get_block_from_hash(ancestor_hash, node_state), block, node_state))
+    return iterator_take_while(
+        lambda b: block_hash(b) != ancestor_hash,
+        iterate_blockchain(block, node_state)
+    )
+
+
+def get_latest_ancestor_not_after_slot(block: Block, slot: int, node_state: NodeState) -> Block:
+    """
+    It retrieves the first block in `get_blockchain(block, node_state)` whose slot is not greater than `slot`.
+    For a block in the ancestry index, this is found by a binary search over the depths of its ancestors down to
+    the depth `increasing_slots_depth` of its entry, along which slots strictly decrease. If the ancestor at that
+    depth is still after `slot`, which only happens when a block has a slot not greater than its parent's, the walk
+    carries on from the parent of that ancestor.
+    """
+    Requires(is_complete_chain(block, node_state))
+    Requires(slot >= node_state.configuration.genesis.slot)
+    if block.slot <= slot:
+        return block
+    elif not has_ancestry_index_entry(block_hash(block), node_state):
+        return get_latest_ancestor_not_after_slot(get_parent(block, node_state), slot, node_state)
+    else:
+        increasing_slots_depth = get_ancestry_index_entry(block_hash(block), node_state).increasing_slots_depth
+        earliest_increasing = get_block_from_hash(get_ancestor_at_depth(block_hash(block), increasing_slots_depth, node_state), node_state)
+
+        if earliest_increasing.slot > slot:
+            return get_latest_ancestor_not_after_slot(get_parent(earliest_increasing, node_state), slot, node_state)
+        else:
+            return get_block_from_hash(
+                get_ancestor_at_depth(
+                    block_hash(block),
+                    int_find_last(
+                        lambda depth: get_block_from_hash(get_ancestor_at_depth(block_hash(block), depth, node_state), node_state).slot <= slot,
+                        increasing_slots_depth,
+                        get_block_depth(block_hash(block), node_state)
+                    ),
+                    node_state
+                ),
+                node_state
+            )
+
+
+def get_blockchain_in_slot_range(block: Block, first_slot: int, last_slot: int, node_state: NodeState) -> PVector[Block]:
+    """
+    It retrieves, in the same order as `get_blockchain(block, node_state)`, the blocks of the blockchain of `block` with a slot
+    between `first_slot` and `last_slot`, both included.
+    Only the blocks within the range are walked over, as the most recent of them is found via `get_latest_ancestor_not_after_slot`.
+    """
+    Requires(is_complete_chain(block, node_state))
+    if last_slot < first_slot or last_slot < node_state.configuration.genesis.slot:
+        return pvector_get_empty()
     else:
-        return pvector_concat(
-            pvector_of_one_element(block),
-            get_blockchain(get_parent(block, node_state), node_state)
+        return iterator_take_while(
+            lambda b: b.slot >= first_slot,
+            iterate_blockchain(get_latest_ancestor_not_after_slot(block, last_slot, node_state), node_state)
+        )
+
+
+def has_ancestry_index_entry(block_hash: Hash, node_state: NodeState) -> bool:
+    """
+    It checks whether the block with hash `block_hash` is recorded in the ancestry index `node_state.view_ancestry`,
+    which holds exactly the blocks in `node_state.view_blocks` and `node_state.archived_blocks` that are part of a complete chain.
+    """
+    return pmap_has(node_state.view_ancestry, block_hash)
+
+
+def get_ancestry_index_entry(block_hash: Hash, node_state: NodeState) -> AncestryIndexEntry:
+    """
+    It retrieves the entry of the ancestry index associated to `block_hash`.
+    """
+    Requires(has_ancestry_index_entry(block_hash, node_state))
+    return pmap_get(node_state.view_ancestry, block_hash)
+
+
+def get_block_depth(block_hash: Hash, node_state: NodeState) -> int:
+    """
+    It retrieves the number of blocks between the block with hash `block_hash` and the genesis block.
+    """
+    Requires(has_ancestry_index_entry(block_hash, node_state))
+    return get_ancestry_index_entry(block_hash, node_state).depth
+
+
+def get_new_ancestry_index_entry(block: Block, node_state: NodeState) -> AncestryIndexEntry:
+    """
+    It computes the ancestry index entry of a `block` whose parent is already in the ancestry index.
+    The jump pointers follow the skew-binary scheme: the jump of a block skips either a single parent or, when the
+    jumps of its parent and of its parent's jump cover the same number of blocks, both of them. This keeps the
+    number of steps taken by `get_ancestor_at_depth` logarithmic in the depth of the block.
+    The slots increase strictly from the ancestor at depth `increasing_slots_depth` up to the block, which is the case
+    from the genesis block onwards unless a block has a slot that is not greater than its parent's.
+    """
+    if is_genesis_block(block, node_state):
+        return AncestryIndexEntry(
+            depth=0,
+            jump_hash=block_hash(block),
+            increasing_slots_depth=0
         )
+    else:
+        Requires(has_ancestry_index_entry(block.parent_hash, node_state))
+        parent = get_ancestry_index_entry(block.parent_hash, node_state)
+        parent_jump = get_ancestry_index_entry(parent.jump_hash, node_state)
+        increasing_slots_depth = parent.depth + 1
+
+        if block.slot > get_parent(block, node_state).slot:
+            increasing_slots_depth = parent.increasing_slots_depth
+
+        if parent.depth - parent_jump.depth == parent_jump.depth - get_block_depth(parent_jump.jump_hash, node_state):
+            return AncestryIndexEntry(
+                depth=parent.depth + 1,
+                jump_hash=parent_jump.jump_hash,
+                increasing_slots_depth=increasing_slots_depth
+            )
+        else:
+            return AncestryIndexEntry(
+                depth=parent.depth + 1,
+                jump_hash=block.parent_hash,
+                increasing_slots_depth=increasing_slots_depth
+            )
+
+
+def get_next_hash_towards_depth(block_hash: Hash, depth: int, node_state: NodeState) -> Hash:
+    """
+    It moves one step up the chain of the block with hash `block_hash` towards its ancestor at the given `depth`:
+    it follows the jump pointer unless that would overshoot `depth`, in which case it moves to the parent.
+    """
+    Requires(get_block_depth(block_hash, node_state) > depth)
+    if get_block_depth(get_ancestry_index_entry(block_hash, node_state).jump_hash, node_state) >= depth:
+        return get_ancestry_index_entry(block_hash, node_state).jump_hash
+    else:
+        return get_block_from_hash(block_hash, node_state).parent_hash
+
+
+def get_ancestor_at_depth(block_hash: Hash, depth: int, node_state: NodeState) -> Hash:
+    """
+    It retrieves the hash of the ancestor, at the given `depth`, of the block with hash `block_hash`.
+    """
+    Requires(has_ancestry_index_entry(block_hash, node_state))
+    Requires(0 <= depth and depth <= get_block_depth(block_hash, node_state))
+    return iterate_while(
+        lambda hash: get_block_depth(hash, node_state) > depth,
+        lambda hash: get_next_hash_towards_depth(hash, depth, node_state),
+        block_hash
+    )
+
+
+def get_closest_indexed_block_or_ancestor(block: Block, stop_at: Block, node_state: NodeState) -> Block:
+    """
+    Starting from `block`, it walks up its chain until it either reaches `stop_at`, a block that is in the ancestry index,
+    or a block whose parent is not in `node_state`.
+    As a block is in the ancestry index as soon as its parent is, this walks only across blocks not part of a complete chain.
+    """
+    return iterate_while(
+        lambda b:
+            b != stop_at and
+            not has_ancestry_index_entry(block_hash(b), node_state) and
+            has_parent(b, node_state),
+        lambda b: get_parent(b, node_state),
+        block
+    )
 
 
 def is_ancestor_descendant_relationship(ancestor: Block, descendant: Block, node_state: NodeState) -> bool:
     """
     It determines whether there is an ancestor-descendant relationship between two blocks.
+    For blocks in the ancestry index, this amounts to comparing `ancestor` with the ancestor of `descendant` at the depth of `ancestor`.
     """
-    if ancestor == descendant:
+    closest = get_closest_indexed_block_or_ancestor(descendant, ancestor, node_state)
+
+    if closest == ancestor:
         return True
-    elif descendant == node_state.configuration.genesis:
+    elif not has_ancestry_index_entry(block_hash(closest), node_state) or not has_ancestry_index_entry(block_hash(ancestor), node_state):
         return False
     else:
         return (
-            has_parent(descendant, node_state) and
-            is_ancestor_descendant_relationship(
-                ancestor,
-                get_parent(descendant, node_state),
+            get_block_depth(block_hash(ancestor), node_state) <= get_block_depth(block_hash(closest), node_state) and
+            get_ancestor_at_depth(
+                block_hash(closest),
+                get_block_depth(block_hash(ancestor), node_state),
                 node_state
-            )
+            ) == block_hash(ancestor)
         )
 
 
 def validator_set_weight(validators: PSet[NodeIdentity], validatorBalances: ValidatorBalances) -> int:
     """
     It calculates the total weight (or sum of `validatorBalances`) of a specified set of `validators` within a blockchain.
+    Nodes in `validators` that are not validators according to `validatorBalances` do not contribute to the weight.
     """
-    return pset_sum(
-        pset_map(
-            lambda v: pmap_get(validatorBalances, v),
-            pset_intersection(
-                pmap_keys(validatorBalances),
-                validators
-            )
-        )
-    )
+    return pmap_sum_values_of_keys(validatorBalances, validators)
+
+
+def total_validator_set_weight(validatorBalances: ValidatorBalances) -> int:
+    """
+    It calculates the total weight of all the validators in `validatorBalances`, i.e.
+    `validator_set_weight(pmap_keys(validatorBalances), validatorBalances)`.
+    """
+    return pmap_sum_values(validatorBalances)
 
 
 def get_set_FFG_targets(votes: PSet[SignedVoteMessage]) -> PSet[Checkpoint]:
@@ -156,40 +367,100 @@ def get_set_FFG_targets(votes: PSet[SignedVoteMessage]) -> PSet[Checkpoint]:
     )
 
 
-def is_FFG_vote_in_support_of_checkpoint_justification(vote: SignedVoteMessage, checkpoint: Checkpoint, node_state: NodeState) -> bool:
+def get_FFG_targets_for_slot(chkp_slot: int, node_state: NodeState) -> PMap[Checkpoint, PSet[SignedVoteMessage]]:
     """
-    It determines whether a given `vote` supports the justification of a specified `checkpoint`.
+    It retrieves, from the index `node_state.ffg_votes_by_target`, all the FFG targets with checkpoint slot `chkp_slot`
+    of the votes in `node_state.view_votes`, each one mapped to the votes that have it as target.
+    """
+    if pmap_has(node_state.ffg_votes_by_target, chkp_slot):
+        return pmap_get(node_state.ffg_votes_by_target, chkp_slot)
+    else:
+        return pmap_get_empty()
+
+
+def get_FFG_votes_for_target(checkpoint: Checkpoint, node_state: NodeState) -> PSet[SignedVoteMessage]:
+    """
+    It retrieves all the votes in `node_state.view_votes` whose FFG target is `checkpoint`.
+    """
+    if pmap_has(get_FFG_targets_for_slot(checkpoint.chkp_slot, node_state), checkpoint):
+        return pmap_get(get_FFG_targets_for_slot(checkpoint.chkp_slot, node_state), checkpoint)
+    else:
+        return pset_get_empty()
+
+
+def get_FFG_votes_for_target_slot(chkp_slot: int, node_state: NodeState) -> PSet[SignedVoteMessage]:
+    """
+    It retrieves all the votes in `node_state.view_votes` whose FFG target has checkpoint slot `chkp_slot`.
+    These are the only votes that can support the justification of a checkpoint with checkpoint slot `chkp_slot`.
+    """
+    return pset_merge_flatten(pmap_values(get_FFG_targets_for_slot(chkp_slot, node_state)))
+
+
+def get_FFG_votes_from_source(checkpoint: Checkpoint, node_state: NodeState) -> PSet[SignedVoteMessage]:
+    """
+    It retrieves, from the index `node_state.ffg_votes_by_source`, all the votes in `node_state.view_votes` whose FFG source is `checkpoint`.
+    """
+    if pmap_has(node_state.ffg_votes_by_source, checkpoint):
+        return pmap_get(node_state.ffg_votes_by_source, checkpoint)
+    else:
+        return pset_get_empty()
+
+
+def get_all_FFG_targets(node_state: NodeState) -> PSet[Checkpoint]:
+    """
+    It retrieves all the FFG targets of the votes in `node_state.view_votes`, i.e. `get_set_FFG_targets(node_state.view_votes)`.
+    """
+    targets: PSet[Checkpoint] = pset_get_empty()
+
+    for chkp_slot in pmap_keys(node_state.ffg_votes_by_target):
+        targets = pset_merge(targets, pmap_keys(get_FFG_targets_for_slot(chkp_slot, node_state)))
+
+    return targets
+
+
+def is_FFG_vote_message_in_support_of_checkpoint_justification(message: VoteMessage, checkpoint: Checkpoint, node_state: NodeState) -> bool:
+    """
+    It determines whether a valid vote carrying `message` supports the justification of a specified `checkpoint`.
     """
     return (
-        valid_vote(vote, node_state) and
-        vote.message.ffg_target.chkp_slot == checkpoint.chkp_slot and
+        valid_vote_message(message, node_state) and
+        message.ffg_target.chkp_slot == checkpoint.chkp_slot and
         is_ancestor_descendant_relationship(
             get_block_from_hash(checkpoint.block_hash, node_state),
-            get_block_from_hash(vote.message.ffg_target.block_hash, node_state),
+            get_block_from_hash(message.ffg_target.block_hash, node_state),
             node_state) and
         is_ancestor_descendant_relationship(
-            get_block_from_hash(vote.message.ffg_source.block_hash, node_state),
+            get_block_from_hash(message.ffg_source.block_hash, node_state),
             get_block_from_hash(checkpoint.block_hash, node_state),
             node_state) and
-        is_justified_checkpoint(vote.message.ffg_source, node_state)
+        is_justified_checkpoint(message.ffg_source, node_state)
     )
 
 
-def filter_out_FFG_votes_not_in_FFG_support_of_checkpoint_justification(votes: PSet[SignedVoteMessage], checkpoint: Checkpoint, node_state: NodeState) -> PSet[SignedVoteMessage]:
+def is_FFG_vote_in_support_of_checkpoint_justification(vote: SignedVoteMessage, checkpoint: Checkpoint, node_state: NodeState) -> bool:
     """
-    It filters out ffg votes that do not support the justification of a specified `checkpoint`.
+    It determines whether a given `vote` supports the justification of a specified `checkpoint`.
     """
-    return pset_filter(lambda vote: is_FFG_vote_in_support_of_checkpoint_justification(vote, checkpoint, node_state), votes)
+    return (
+        valid_vote(vote, node_state) and
+        is_FFG_vote_message_in_support_of_checkpoint_justification(vote.message, checkpoint, node_state)
+    )
 
 
 def get_validators_in_FFG_support_of_checkpoint_justification(votes: PSet[SignedVoteMessage], checkpoint: Checkpoint, node_state: NodeState) -> PSet[NodeIdentity]:
     """
-    It identifies and returns the set of validators that have cast `votes` in support of the justification of a specified `checkpoint`.
+    It identifies and returns the set of validators that have cast `votes` in support of the justification of a specified `checkpoint`,
+    i.e. the senders of the votes satisfying `is_FFG_vote_in_support_of_checkpoint_justification`.
+    The votes are grouped by message so that the conditions that only depend on the message are checked once per distinct message.
     """
-    return pset_map(
-        lambda vote: vote.sender,
-        filter_out_FFG_votes_not_in_FFG_support_of_checkpoint_justification(votes, checkpoint, node_state)
-    )
+    validators: PSet[NodeIdentity] = pset_get_empty()
+    votes_by_message = pset_group_by(lambda vote: vote.message, votes)
+
+    for message in pmap_keys(votes_by_message):
+        if is_FFG_vote_message_in_support_of_checkpoint_justification(message, checkpoint, node_state):
+            validators = pset_merge(validators, get_senders_of_valid_votes(message, pmap_get(votes_by_message, message), node_state))
+
+    return validators
 
 
 def is_justified_checkpoint(checkpoint: Checkpoint, node_state: NodeState) -> bool:
@@ -197,9 +468,11 @@ def is_justified_checkpoint(checkpoint: Checkpoint, node_state: NodeState) -> bo
     It checks whether a `checkpoint` if justified, specifically a `checkpoint` is justified if at least 
     two-thirds of the total validator set weight is in support. This is evaluated by checking if 
     `FFG_support_weight * 3 >= tot_validator_set_weight * 2`.
+    As justification only depends on the votes and blocks in the view, which are only removed by `prune_view_on_finality` once
+    they can no longer affect justification, a checkpoint in the cache `node_state.justified_checkpoints` is justified.
     """
 
-    if checkpoint == genesis_checkpoint(node_state):
+    if checkpoint == genesis_checkpoint(node_state) or pset_has(node_state.justified_checkpoints, checkpoint):
         return True
     else:
         if not has_block_hash(checkpoint.block_hash, node_state) or not is_complete_chain(get_block_from_hash(checkpoint.block_hash, node_state), node_state):
@@ -207,29 +480,19 @@ def is_justified_checkpoint(checkpoint: Checkpoint, node_state: NodeState) -> bo
 
         validatorBalances = get_validator_set_for_slot(get_block_from_hash(checkpoint.block_hash, node_state), checkpoint.block_slot, node_state)
 
-        FFG_support_weight = validator_set_weight(get_validators_in_FFG_support_of_checkpoint_justification(node_state.view_votes, checkpoint, node_state), validatorBalances)
-        tot_validator_set_weight = validator_set_weight(pmap_keys(validatorBalances), validatorBalances)
+        FFG_support_weight = validator_set_weight(get_validators_in_FFG_support_of_checkpoint_justification(get_FFG_votes_for_target_slot(checkpoint.chkp_slot, node_state), checkpoint, node_state), validatorBalances)
+        tot_validator_set_weight = total_validator_set_weight(validatorBalances)
 
         return FFG_support_weight * 3 >= tot_validator_set_weight * 2
 
 
-def filter_out_non_justified_checkpoint(checkpoints: PSet[Checkpoint], node_state: NodeState) -> PSet[Checkpoint]:
-    """
-    It filters out `checkpoints` that are not justified.
-    """
-    return pset_filter(lambda checkpoint: is_justified_checkpoint(checkpoint, node_state), checkpoints)
-
-
 def get_justified_checkpoints(node_state: NodeState) -> PSet[Checkpoint]:
     """
-    It retrieves all the justified checkpoints from a `note_state`. First it extracts all ffg target checkpoints from 
-    the set of votes in the `node_state`. Then it filter out these checkpoints to keep only those that are justified.
-    The `genesis_checkpoint` is automatically considered justified.
+    It retrieves all the justified checkpoints from a `note_state`, that is, all the ffg target checkpoints of the votes
+    in the `node_state` that are justified, plus the `genesis_checkpoint` which is automatically considered justified.
+    These are cached in `node_state.justified_checkpoints` by `update_FFG_checkpoints` every time that the view changes.
     """
-    return pset_add(
-        filter_out_non_justified_checkpoint(get_set_FFG_targets(node_state.view_votes), node_state),
-        genesis_checkpoint(node_state)
-    )
+    return node_state.justified_checkpoints
 
 
 def get_greatest_justified_checkpoint(node_state: NodeState) -> Checkpoint:
@@ -242,32 +505,41 @@ def get_greatest_justified_checkpoint(node_state: NodeState) -> Checkpoint:
     )
 
 
-def is_FFG_vote_linking_to_a_checkpoint_in_next_slot(vote: SignedVoteMessage, checkpoint: Checkpoint, node_state: NodeState) -> bool:
+def is_FFG_vote_message_linking_to_a_checkpoint_in_next_slot(message: VoteMessage, checkpoint: Checkpoint, node_state: NodeState) -> bool:
     """
-    It evaluates whether a given `vote` represents a link from a specified `checkpoint` to a checkpoint in the immediately following slot.
+    It evaluates whether a valid vote carrying `message` represents a link from a specified `checkpoint` to a checkpoint in the immediately following slot.
     """
     return (
-        valid_vote(vote, node_state) and
-        vote.message.ffg_source == checkpoint and
-        vote.message.ffg_target.chkp_slot == checkpoint.chkp_slot + 1
+        valid_vote_message(message, node_state) and
+        message.ffg_source == checkpoint and
+        message.ffg_target.chkp_slot == checkpoint.chkp_slot + 1
     )
 
 
-def filter_out_FFG_vote_not_linking_to_a_checkpoint_in_next_slot(checkpoint: Checkpoint, node_state: NodeState) -> PSet[SignedVoteMessage]:  
+def is_FFG_vote_linking_to_a_checkpoint_in_next_slot(vote: SignedVoteMessage, checkpoint: Checkpoint, node_state: NodeState) -> bool:
     """
-    It filters and retains only those votes from a `node_state` that are linking to a `checkpoint` in the next slot.
+    It evaluates whether a given `vote` represents a link from a specified `checkpoint` to a checkpoint in the immediately following slot.
     """
-    return pset_filter(lambda vote: is_FFG_vote_linking_to_a_checkpoint_in_next_slot(vote, checkpoint, node_state), node_state.view_votes)
+    return (
+        valid_vote(vote, node_state) and
+        is_FFG_vote_message_linking_to_a_checkpoint_in_next_slot(vote.message, checkpoint, node_state)
+    )
 
 
 def get_validators_in_FFG_votes_linking_to_a_checkpoint_in_next_slot(checkpoint: Checkpoint, node_state) -> PSet[NodeIdentity]:
     """
-    It retrieves the identities of validators who have cast ffg votes that support linking a specified `checkpoint` to its immediate successor.
+    It retrieves the identities of validators who have cast ffg votes that support linking a specified `checkpoint` to its immediate successor,
+    i.e. the senders of the votes satisfying `is_FFG_vote_linking_to_a_checkpoint_in_next_slot`, checking the conditions that
+    only depend on the message once per distinct message.
     """
-    return pset_map(
-        lambda vote: vote.sender,
-        filter_out_FFG_vote_not_linking_to_a_checkpoint_in_next_slot(checkpoint, node_state)
-    )
+    validators: PSet[NodeIdentity] = pset_get_empty()
+    votes_by_message = pset_group_by(lambda vote: vote.message, get_FFG_votes_from_source(checkpoint, node_state))
+
+    for message in pmap_keys(votes_by_message):
+        if is_FFG_vote_message_linking_to_a_checkpoint_in_next_slot(message, checkpoint, node_state):
+            validators = pset_merge(validators, get_senders_of_valid_votes(message, pmap_get(votes_by_message, message), node_state))
+
+    return validators
 
 
 def is_finalized_checkpoint(checkpoint: Checkpoint, node_state: NodeState) -> bool:
@@ -278,13 +550,18 @@ def is_finalized_checkpoint(checkpoint: Checkpoint, node_state: NodeState) -> bo
     This is done through `get_validator_set_for_slot`. Then it calculates the total weight (stake) of validators who have cast votes 
     linking the `checkpoint` to the next slot, using `get_validators_in_FFG_votes_linking_to_a_checkpoint_in_next_slot` to identify these validators
     and `validator_set_weight` to sum their stakes. Finally it checks if `FFG_support_weight * 3 >= tot_validator_set_weight * 2` to finalize `checkpoint`.
+    Like justification, finalization is never undone and hence a checkpoint in the cache `node_state.finalized_checkpoints` is finalized.
+    A justified checkpoint whose block has been dropped by `prune_view_on_finality`, as conflicting with a finalized one, is not finalized.
     """
-    if not is_justified_checkpoint(checkpoint, node_state):
+    if pset_has(node_state.finalized_checkpoints, checkpoint):
+        return True
+
+    if not is_justified_checkpoint(checkpoint, node_state) or not has_block_hash(checkpoint.block_hash, node_state):
         return False
 
     validatorBalances = get_validator_set_for_slot(get_block_from_hash(checkpoint.block_hash, node_state), checkpoint.block_slot, node_state)
     FFG_support_weight = validator_set_weight(get_validators_in_FFG_votes_linking_to_a_checkpoint_in_next_slot(checkpoint, node_state), validatorBalances)
-    tot_validator_set_weight = validator_set_weight(pmap_keys(validatorBalances), validatorBalances)
+    tot_validator_set_weight = total_validator_set_weight(validatorBalances)
 
     return FFG_support_weight * 3 >= tot_validator_set_weight * 2
 
@@ -298,11 +575,32 @@ def filter_out_non_finalized_checkpoint(checkpoints: PSet[Checkpoint], node_stat
 
 def get_finalized_checkpoints(node_state: NodeState) -> PSet[Checkpoint]:
     """
-    It retrieves from `node_state` all the checkpoints that have been finalized.
+    It retrieves from `node_state` all the checkpoints that have been finalized, that is, all the ffg target checkpoints of the votes
+    in the `node_state` that are finalized, plus the `genesis_checkpoint`.
+    These are cached in `node_state.finalized_checkpoints` by `update_FFG_checkpoints` every time that the view changes.
+    """
+    return node_state.finalized_checkpoints
+
+
+def update_FFG_checkpoints(node_state: NodeState) -> NodeState:
     """
-    return pset_add(
-        filter_out_non_finalized_checkpoint(get_set_FFG_targets(node_state.view_votes), node_state),
-        genesis_checkpoint(node_state)
+    It brings the caches `node_state.justified_checkpoints` and `node_state.finalized_checkpoints` in sync with the view.
+    As checkpoints never stop being justified or finalized, only the ffg targets not yet in the caches need to be checked.
+    Targets are checked by increasing checkpoint slot so that the sources of the votes supporting them, which have a strictly lower
+    checkpoint slot, are already in the cache if justified.
+    """
+    for checkpoint in pset_sort(pset_difference(get_all_FFG_targets(node_state), node_state.justified_checkpoints), lambda c: c.chkp_slot):
+        if is_justified_checkpoint(checkpoint, node_state):
+            node_state = node_state.set(justified_checkpoints=pset_add(node_state.justified_checkpoints, checkpoint))
+
+    return node_state.set(
+        finalized_checkpoints=pset_merge(
+            node_state.finalized_checkpoints,
+            filter_out_non_finalized_checkpoint(
+                pset_difference(node_state.justified_checkpoints, node_state.finalized_checkpoints),
+                node_state
+            )
+        )
     )
 
 
@@ -316,6 +614,13 @@ def get_greatest_finalized_checkpoint(node_state: NodeState) -> Checkpoint:
     )
 
 
+def get_greatest_finalized_block(node_state: NodeState) -> Block:
+    """
+    It retrieves the block of the greatest finalized checkpoint, i.e. the head of the finalized chain.
+    """
+    return get_block_from_hash(get_greatest_finalized_checkpoint(node_state).block_hash, node_state)
+
+
 def filter_out_blocks_non_ancestor_of_block(block: Block, blocks: PSet[Block], node_state: NodeState) -> PSet[Block]:
     """
     It filters a set of `blocks`, retaining only those that are ancestors of a specified `block`.
@@ -329,16 +634,24 @@ def filter_out_blocks_non_ancestor_of_block(block: Block, blocks: PSet[Block], n
 def filter_out_GHOST_votes_non_descendant_of_block(block: Block, votes: PSet[SignedVoteMessage], node_state: NodeState) -> PSet[SignedVoteMessage]:
     """
     It filters a set of `votes`, retaining only those that are for blocks which are descendants of a specified `block`.
+    The votes are grouped by head so that whether a head descends from `block` is checked once per distinct head.
     """
-    return pset_filter(
-        lambda vote:
-            has_block_hash(vote.message.head_hash, node_state) and
-            is_ancestor_descendant_relationship(
-                block,
-                get_block_from_hash(vote.message.head_hash, node_state),
-                node_state
-            ),
-        votes
+    votes_by_head = pset_group_by(lambda vote: vote.message.head_hash, votes)
+
+    return pset_merge_flatten(
+        pset_map(
+            lambda head_hash: pmap_get(votes_by_head, head_hash),
+            pset_filter(
+                lambda head_hash:
+                    has_block_hash(head_hash, node_state) and
+                    is_ancestor_descendant_relationship(
+                        block,
+                        get_block_from_hash(head_hash, node_state),
+                        node_state
+                    ),
+                pmap_keys(votes_by_head)
+            )
+        )
     )
 
 
@@ -387,7 +700,7 @@ def filter_out_expired_GHOST_votes(votes: PSet[SignedVoteMessage], node_state: N
     It filters out from `votes` all the expired votes.
     """
     return pset_filter(
-        lambda vote: is_GHOST_vote_expired(vote, node_state),
+        lambda vote: not is_GHOST_vote_expired(vote, node_state),
         votes
     )
 
@@ -402,6 +715,18 @@ def filter_out_non_LMD_GHOST_votes(votes: PSet[SignedVoteMessage]) -> PSet[Signe
     return pmap_values(lmd)
 
 
+def get_voted_heads(sender: NodeIdentity, slot: int, node_state: NodeState) -> PSet[Hash]:
+    """
+    It retrieves, from the index `node_state.view_vote_heads`, the head hashes of all the votes in `node_state.view_votes`
+    cast by `sender` for `slot`.
+    The entries of expired slots may have been dropped by `prune_view_on_finality`, as equivocations only matter for non-expired votes.
+    """
+    if pmap_has(node_state.view_vote_heads, SenderAndSlot(sender=sender, slot=slot)):
+        return pmap_get(node_state.view_vote_heads, SenderAndSlot(sender=sender, slot=slot))
+    else:
+        return pset_get_empty()
+
+
 def is_equivocating_GHOST_vote(vote: SignedVoteMessage, node_state: NodeState) -> bool:
     """
     It checks if the given `vote` is part of an equivocation by comparing it against all other `vote`s from the same sender 
@@ -409,12 +734,9 @@ def is_equivocating_GHOST_vote(vote: SignedVoteMessage, node_state: NodeState) -
     violating the protocol's rules.
     """
     return not pset_is_empty(
-        pset_filter(
-            lambda vote_check:
-                vote_check.message.slot == vote.message.slot and
-                vote_check.sender == vote.sender and
-                vote_check.message.head_hash != vote.message.head_hash,
-            node_state.view_votes
+        pset_difference(
+            get_voted_heads(vote.sender, vote.message.slot, node_state),
+            pset_get_singleton(vote.message.head_hash)
         )
     )
 
@@ -429,103 +751,459 @@ def filter_out_GHOST_equivocating_votes(votes: PSet[SignedVoteMessage], node_sta
     )
 
 
+def has_blocks_referenced_by_vote_message(message: VoteMessage, node_state: NodeState) -> bool:
+    """
+    It checks whether the head block of `message` is part of a complete chain within `node_state` and whether both the
+    source and target blocks of `message` are in `node_state`.
+    Until this is the case, a vote is invalid and pending, as it may become valid once the missing blocks are received.
+    Once this is the case, the validity of the vote no longer depends on the view as blocks are identified by their hash.
+    """
+    return (
+        has_ancestry_index_entry(message.head_hash, node_state) and
+        has_block_hash(message.ffg_source.block_hash, node_state) and
+        has_block_hash(message.ffg_target.block_hash, node_state)
+    )
+
+
+def has_blocks_referenced_by_vote(vote: SignedVoteMessage, node_state: NodeState) -> bool:
+    return has_blocks_referenced_by_vote_message(vote.message, node_state)
+
+
 def valid_vote(vote: SignedVoteMessage, node_state: NodeState) -> bool:
     """
-    A vote is valid if:
-    - it has a valid signature;
+    A vote is valid if all the blocks that it references are within the view of `node_state`, see `has_blocks_referenced_by_vote`,
+    and if it satisfies `valid_vote_with_referenced_blocks`.
+    """
+    return (
+        has_blocks_referenced_by_vote(vote, node_state) and
+        valid_vote_with_referenced_blocks(vote, node_state)
+    )
+
+
+def valid_vote_message(message: VoteMessage, node_state: NodeState) -> bool:
+    """
+    It checks the conditions of `valid_vote` that only depend on the message of a vote, and not on its sender or signature,
+    so that they can be checked once for all the votes carrying the same `message`.
+    """
+    return (
+        has_blocks_referenced_by_vote_message(message, node_state) and
+        valid_vote_message_with_referenced_blocks(message, node_state)
+    )
+
+
+def has_valid_vote_signature(vote: SignedVoteMessage) -> bool:
+    """
+    It checks the signature of `vote`. As the result only depends on `vote`, it can be memoized per vote, see `memoization.py`.
+    """
+    return verify_vote_signature(vote)
+
+
+def verify_vote_signatures_in_batch(votes: PSet[SignedVoteMessage]) -> PSet[SignedVoteMessage]:
+    """
+    It retrieves the votes in `votes` that have a valid signature, see `has_valid_vote_signature`, with a single call to
+    `verify_vote_signatures`, so that the signatures of many votes can be verified together.
+    """
+    return verify_vote_signatures(votes)
+
+
+def valid_vote_message_with_referenced_blocks(message: VoteMessage, node_state: NodeState) -> bool:
+    """
+    As the result only depends on `message` and on the genesis block of the configuration when
+    `has_blocks_referenced_by_vote_message(message, node_state)` holds, it can be memoized per message and configuration.
+    A vote message is valid if:
     - the block hash associated with the voted head block exists within a validator's view of blocks;
     - the head block associated with the vote is part of a complete chain that leads back to the genesis block within a validator's state;
-    - the sender is a validator;
-    - `vote.message.ffg_source.block_hash` is an ancestor of `vote.message.ffg_target.block_hash`;
-    - `vote.message.ffg_target.block_hash` is an ancestor of `vote.message.head_hash`;
-    - the checkpoint slot of `vote.message.ffg_source` is strictly less than checkpoint slot of `vote.message.ffg_target`;   
-    - the block associated with `vote.message.ffg_source.block_hash` has a slot number that matches the slot number specified in the same vote message;
-    - the block associated with `vote.message.ffg_target.block_hash` has a slot number that matches the slot number specified in the same vote message;
+    - `message.ffg_source.block_hash` is an ancestor of `message.ffg_target.block_hash`;
+    - `message.ffg_target.block_hash` is an ancestor of `message.head_hash`;
+    - the checkpoint slot of `message.ffg_source` is strictly less than checkpoint slot of `message.ffg_target`;   
+    - the block associated with `message.ffg_source.block_hash` has a slot number that matches the slot number specified in the same vote message;
+    - the block associated with `message.ffg_target.block_hash` has a slot number that matches the slot number specified in the same vote message;
     - the block hash associated the source exists within a validator's view of blocks; and
     - the block hash associated the target exists within a validator's view of blocks.
     """
+    Requires(has_blocks_referenced_by_vote_message(message, node_state))
     return (
-        verify_vote_signature(vote) and
-        has_block_hash(vote.message.head_hash, node_state) and
-        is_complete_chain(get_block_from_hash(vote.message.head_hash, node_state), node_state) and
-        is_validator(
-            vote.sender,
-            get_validator_set_for_slot(get_block_from_hash(vote.message.head_hash, node_state), vote.message.slot, node_state)) and
+        has_block_hash(message.head_hash, node_state) and
+        is_complete_chain(get_block_from_hash(message.head_hash, node_state), node_state) and
         is_ancestor_descendant_relationship(
-            get_block_from_hash(vote.message.ffg_source.block_hash, node_state),
-            get_block_from_hash(vote.message.ffg_target.block_hash, node_state),
+            get_block_from_hash(message.ffg_source.block_hash, node_state),
+            get_block_from_hash(message.ffg_target.block_hash, node_state),
             node_state) and
         is_ancestor_descendant_relationship(
-            get_block_from_hash(vote.message.ffg_target.block_hash, node_state),
-            get_block_from_hash(vote.message.head_hash, node_state),
+            get_block_from_hash(message.ffg_target.block_hash, node_state),
+            get_block_from_hash(message.head_hash, node_state),
             node_state) and
-        vote.message.ffg_source.chkp_slot < vote.message.ffg_target.chkp_slot and
-        has_block_hash(vote.message.ffg_source.block_hash, node_state) and
-        get_block_from_hash(vote.message.ffg_source.block_hash, node_state).slot == vote.message.ffg_source.block_slot and
-        has_block_hash(vote.message.ffg_target.block_hash, node_state) and
-        get_block_from_hash(vote.message.ffg_target.block_hash, node_state).slot == vote.message.ffg_target.block_slot
+        message.ffg_source.chkp_slot < message.ffg_target.chkp_slot and
+        has_block_hash(message.ffg_source.block_hash, node_state) and
+        get_block_from_hash(message.ffg_source.block_hash, node_state).slot == message.ffg_source.block_slot and
+        has_block_hash(message.ffg_target.block_hash, node_state) and
+        get_block_from_hash(message.ffg_target.block_hash, node_state).slot == message.ffg_target.block_slot
     )
 
 
-def filter_out_invalid_votes(votes: PSet[SignedVoteMessage], node_state: NodeState) -> PSet[SignedVoteMessage]:
-    return pset_filter(
-        lambda vote: valid_vote(vote, node_state),
-        votes
-    )
+def get_validator_set_for_vote_message(message: VoteMessage, node_state: NodeState) -> ValidatorBalances:
+    """
+    It retrieves the validator set that may sign `message`, that is, the validator set of the voted head block for the slot of `message`.
+    """
+    Requires(is_complete_chain(get_block_from_hash(message.head_hash, node_state), node_state))
+    return get_validator_set_for_slot(get_block_from_hash(message.head_hash, node_state), message.slot, node_state)
+
 
+def is_vote_from_aggregated_vote(vote: SignedVoteMessage) -> bool:
+    """
+    It checks whether `vote` was extracted from an aggregated vote, see `get_votes_from_aggregated_vote`, in which case it carries
+    the aggregated vote in place of a signature of its own.
+    """
+    return is_instance_of(vote.signature, AggregatedVoteSignature)
 
-def get_votes_included_in_blockchain(block: Block, node_state: NodeState) -> PSet[SignedVoteMessage]:
-    if block == node_state.configuration.genesis or not has_block_hash(block.parent_hash, node_state):
-        return block.votes
+
+def has_valid_signature(vote: SignedVoteMessage, validatorBalances: ValidatorBalances) -> bool:
+    """
+    It checks the signature of `vote`, see `has_valid_vote_signature`, or, if `vote` was extracted from an aggregated vote, the
+    aggregate signature covering it, see `is_valid_participant_of_aggregated_vote`, where `validatorBalances` is the validator
+    set that may sign the message of `vote`.
+    """
+    if is_vote_from_aggregated_vote(vote):
+        return is_valid_participant_of_aggregated_vote(vote.sender, vote.message, vote.signature.aggregate, validatorBalances)
     else:
-        return pset_merge(block.votes, get_votes_included_in_blockchain(get_block_from_hash(block.parent_hash, node_state), node_state))
+        return has_valid_vote_signature(vote)
 
 
-def get_votes_included_in_blocks(blocks: PSet[Block]) -> PSet[SignedVoteMessage]:
-    return pset_merge_flatten(
-        pset_map(
-            lambda b: b.votes,
-            blocks
-        )
+def is_valid_vote_signer(vote: SignedVoteMessage, node_state: NodeState) -> bool:
+    """
+    It checks the conditions of `valid_vote` that depend on the sender of `vote`, namely that `vote` has a valid signature
+    and that its sender is a validator.
+    """
+    Requires(has_blocks_referenced_by_vote(vote, node_state))
+    return is_valid_vote_signer_in_validator_set(vote, get_validator_set_for_vote_message(vote.message, node_state))
+
+
+def is_valid_vote_signer_in_validator_set(vote: SignedVoteMessage, validatorBalances: ValidatorBalances) -> bool:
+    """
+    It checks `is_valid_vote_signer` given `validatorBalances`, the validator set that may sign the message of `vote`.
+    """
+    return (
+        has_valid_signature(vote, validatorBalances) and
+        is_validator(vote.sender, validatorBalances)
     )
 
 
-def votes_to_include_in_proposed_block(node_state: NodeState) -> PSet[SignedVoteMessage]:
+def valid_vote_with_referenced_blocks(vote: SignedVoteMessage, node_state: NodeState) -> bool:
     """
-    The votes to include in a proposed block are all those with a GHOST vote for a block in the chain
-    of the proposed block that have not already been included in such a chain
+    As the result only depends on `vote`, on the configuration and on `get_validator_set_for_vote_message(vote.message, node_state)`
+    when `has_blocks_referenced_by_vote(vote, node_state)` holds, it can be memoized per vote, configuration and validator set.
+    A vote is valid if its message is valid, see `valid_vote_message_with_referenced_blocks`, and if:
+    - it has a valid signature; and
+    - the sender is a validator.
     """
-    head_block = get_head(node_state)
-    votes_for_blocks_in_canonical_chain = filter_out_GHOST_votes_not_for_blocks_in_blockchain(
-        filter_out_invalid_votes(node_state.view_votes, node_state),
-        head_block,
-        node_state
+    Requires(has_blocks_referenced_by_vote(vote, node_state))
+    return (
+        valid_vote_message_with_referenced_blocks(vote.message, node_state) and
+        is_valid_vote_signer(vote, node_state)
     )
 
-    return pset_difference(
-        votes_for_blocks_in_canonical_chain,
-        get_votes_included_in_blockchain(head_block, node_state)
+
+def get_senders_of_valid_votes(message: VoteMessage, votes: PSet[SignedVoteMessage], node_state: NodeState) -> PSet[NodeIdentity]:
+    """
+    It retrieves the senders of the valid votes among `votes`, which all carry the same valid `message`.
+    """
+    validatorBalances = get_validator_set_for_vote_message(message, node_state)
+    return pset_map(
+        lambda vote: vote.sender,
+        pset_filter(lambda vote: is_valid_vote_signer_in_validator_set(vote, validatorBalances), votes)
     )
 
 
-def get_new_block(node_state: NodeState) -> Block:
+def get_sorted_validators(validatorBalances: ValidatorBalances) -> PVector[NodeIdentity]:
+    """
+    It sorts the validators of `validatorBalances`.
+    """
+    return pset_sort(pmap_keys(validatorBalances), lambda validator: validator)
+
+
+def get_aggregation_committee(message: VoteMessage, node_state: NodeState) -> PVector[NodeIdentity]:
+    """
+    It retrieves the validators that may sign `message`, sorted, which the bits of an `AggregatedVoteMessage` refer to.
+    """
+    Requires(is_complete_chain(get_block_from_hash(message.head_hash, node_state), node_state))
+    return get_sorted_validators(get_validator_set_for_vote_message(message, node_state))
+
+
+def get_aggregated_vote_participants(aggregate: AggregatedVoteMessage, validatorBalances: ValidatorBalances) -> PSet[NodeIdentity]:
+    """
+    It retrieves the participants of `aggregate`, whose bits refer to the sorted validators of `validatorBalances`, the validator
+    set that may sign its message, see `get_aggregation_committee`.
+    """
+    return bitfield_members(get_sorted_validators(validatorBalances), aggregate.participation_bits)
+
+
+def has_valid_aggregated_vote_signature(aggregate: AggregatedVoteMessage, validatorBalances: ValidatorBalances) -> bool:
+    """
+    It checks the aggregate signature of `aggregate` against its participants, where `validatorBalances` is the validator
+    set that may sign its message.
+    """
+    return verify_aggregated_vote_signature(aggregate, get_aggregated_vote_participants(aggregate, validatorBalances))
+
+
+def verify_aggregated_vote_signatures_in_batch(aggregates: PMap[AggregatedVoteMessage, ValidatorBalances]) -> PSet[AggregatedVoteMessage]:
+    """
+    It retrieves the aggregated votes among the keys of `aggregates` that have a valid aggregate signature, see
+    `has_valid_aggregated_vote_signature`, where each is mapped to the validator set that may sign its message, with a
+    single call to `verify_aggregated_vote_signatures`, so that the signatures of many aggregated votes can be verified together.
+    """
+    return verify_aggregated_vote_signatures(
+        pset_to_pmap(
+            lambda aggregate: get_aggregated_vote_participants(aggregate, pmap_get(aggregates, aggregate)),
+            pmap_keys(aggregates)
+        )
+    )
+
+
+def get_validator_sets_of_aggregated_votes(aggregates: PSet[AggregatedVoteMessage], node_state: NodeState) -> PMap[AggregatedVoteMessage, ValidatorBalances]:
+    """
+    It maps each of the `aggregates` whose referenced blocks are within the view of `node_state` to the validator set that
+    may sign its message.
+    """
+    return pset_to_pmap(
+        lambda aggregate: get_validator_set_for_vote_message(aggregate.message, node_state),
+        pset_filter(lambda aggregate: has_blocks_referenced_by_vote_message(aggregate.message, node_state), aggregates)
+    )
+
+
+def valid_aggregated_vote(aggregate: AggregatedVoteMessage, node_state: NodeState) -> bool:
+    """
+    An aggregated vote is valid if all the blocks that its message references are within the view of `node_state` and if its
+    aggregate signature is valid for its participants.
+    The validity of its message is checked, as for any vote, on the votes extracted from it, see `valid_vote`.
+    """
+    return (
+        has_blocks_referenced_by_vote_message(aggregate.message, node_state) and
+        has_valid_aggregated_vote_signature(aggregate, get_validator_set_for_vote_message(aggregate.message, node_state))
+    )
+
+
+def is_valid_participant_of_aggregated_vote(sender: NodeIdentity, message: VoteMessage, aggregate: AggregatedVoteMessage, validatorBalances: ValidatorBalances) -> bool:
+    """
+    A vote extracted from `aggregate` is covered by its aggregate signature if it carries the message of `aggregate`, if its
+    `sender` participates in `aggregate` and if the aggregate signature is valid, where `validatorBalances` is the validator
+    set that may sign `message`.
+    """
+    return (
+        message == aggregate.message and
+        pset_has(get_aggregated_vote_participants(aggregate, validatorBalances), sender) and
+        has_valid_aggregated_vote_signature(aggregate, validatorBalances)
+    )
+
+
+def aggregate_votes_with_same_message(message: VoteMessage, votes: PSet[SignedVoteMessage], node_state: NodeState) -> PSet[AggregatedVoteMessage]:
+    """
+    It aggregates the valid votes among `votes`, which all carry the same valid `message`.
+    The votes signed individually are aggregated together with the aggregated votes that the other votes were extracted from.
+    The latter can only be aggregated as a whole, so an aggregated vote is only included if each of its participants has a vote
+    among `votes` extracted from it, and only if its participants are disjoint from those already aggregated; otherwise, it is
+    kept as it is.
+    """
+    Requires(valid_vote_message(message, node_state))
+    validatorBalances = get_validator_set_for_vote_message(message, node_state)
+    valid_votes = pset_filter(lambda vote: is_valid_vote_signer_in_validator_set(vote, validatorBalances), votes)
+    signed_votes = pset_filter(lambda vote: not is_vote_from_aggregated_vote(vote), valid_votes)
+    votes_by_aggregate = pset_group_by(
+        lambda vote: vote.signature.aggregate,
+        pset_filter(lambda vote: is_vote_from_aggregated_vote(vote), valid_votes)
+    )
+
+    aggregates: PSet[AggregatedVoteMessage] = pset_get_empty()
+    senders = pset_map(lambda vote: vote.sender, signed_votes)
+    signatures = from_set_to_pvector(pset_map(lambda vote: vote.signature, signed_votes))
+
+    for aggregate in pset_sort(pmap_keys(votes_by_aggregate), lambda aggregate: aggregate.participation_bits):
+        if pset_size(pmap_get(votes_by_aggregate, aggregate)) == pset_size(get_aggregated_vote_participants(aggregate, validatorBalances)):
+            if pset_is_empty(pset_intersection(senders, get_aggregated_vote_participants(aggregate, validatorBalances))):
+                senders = pset_merge(senders, get_aggregated_vote_participants(aggregate, validatorBalances))
+                signatures = pvector_concat(signatures, pvector_of_one_element(aggregate.signature))
+            else:
+                aggregates = pset_add(aggregates, aggregate)
+
+    if pset_is_empty(senders):
+        return aggregates
+    else:
+        return pset_add(
+            aggregates,
+            AggregatedVoteMessage(
+                message=message,
+                participation_bits=bitfield_from_members(get_aggregation_committee(message, node_state), senders),
+                signature=aggregate_vote_signatures(signatures)
+            )
+        )
+
+
+def aggregate_votes(votes: PSet[SignedVoteMessage], node_state: NodeState) -> PSet[AggregatedVoteMessage]:
+    """
+    It aggregates the valid votes among `votes` by message, see `aggregate_votes_with_same_message`.
+    Invalid votes, including those referencing blocks not in `node_state`, are left out.
+    """
+    aggregates: PSet[AggregatedVoteMessage] = pset_get_empty()
+    votes_by_message = pset_group_by(lambda vote: vote.message, votes)
+
+    for message in pmap_keys(votes_by_message):
+        if valid_vote_message(message, node_state):
+            aggregates = pset_merge(aggregates, aggregate_votes_with_same_message(message, pmap_get(votes_by_message, message), node_state))
+
+    return aggregates
+
+
+def get_votes_from_aggregated_vote(aggregate: AggregatedVoteMessage, validatorBalances: ValidatorBalances) -> PSet[SignedVoteMessage]:
+    """
+    It extracts from `aggregate` one vote per participant, carrying `aggregate` in place of its own signature, see `has_valid_signature`,
+    where `validatorBalances` is the validator set that may sign its message.
+    """
+    return pset_map(
+        lambda sender: SignedVoteMessage(message=aggregate.message, signature=AggregatedVoteSignature(aggregate=aggregate), sender=sender),
+        get_aggregated_vote_participants(aggregate, validatorBalances)
+    )
+
+
+def get_votes_from_valid_aggregated_votes(aggregates: PSet[AggregatedVoteMessage], node_state: NodeState) -> PSet[SignedVoteMessage]:
+    """
+    It extracts the votes of all the valid aggregated votes among `aggregates`, see `valid_aggregated_vote`.
+    """
+    return pset_merge_flatten(
+        pset_map(
+            lambda aggregate: get_votes_from_aggregated_vote(aggregate, get_validator_set_for_vote_message(aggregate.message, node_state)),
+            pset_filter(lambda aggregate: valid_aggregated_vote(aggregate, node_state), aggregates)
+        )
+    )
+
+
+def filter_out_invalid_votes(votes: PSet[SignedVoteMessage], node_state: NodeState) -> PSet[SignedVoteMessage]:
+    return pset_filter(
+        lambda vote: valid_vote(vote, node_state),
+        votes
+    )
+
+
+def get_aggregated_votes_included_in_blockchain(block: Block, node_state: NodeState) -> PSet[AggregatedVoteMessage]:
+    return get_aggregated_votes_included_in_blocks(
+        from_pvector_to_pset(get_chain_up_to_missing_parent(block, node_state))
+    )
+
+
+def get_aggregated_votes_included_in_blocks(blocks: PSet[Block]) -> PSet[AggregatedVoteMessage]:
+    return pset_merge_flatten(
+        pset_map(
+            lambda b: b.votes,
+            blocks
+        )
+    )
+
+
+def get_aggregated_votes_in_proposer_views(proposes: PSet[SignedProposeMessage]) -> PSet[AggregatedVoteMessage]:
+    return pset_merge_flatten(
+        pset_map(
+            lambda p: from_pvector_to_pset(p.message.proposer_view),
+            proposes
+        )
+    )
+
+
+def get_senders_included_in_blockchain_by_message(block: Block, node_state: NodeState) -> PMap[VoteMessage, PSet[NodeIdentity]]:
+    """
+    It maps each message voted in the aggregated votes included in the chain of `block` to the participants of such aggregated
+    votes, leaving out the aggregated votes that reference blocks not in `node_state`.
+    """
+    senders_by_message: PMap[VoteMessage, PSet[NodeIdentity]] = pmap_get_empty()
+
+    for aggregate in get_aggregated_votes_included_in_blockchain(block, node_state):
+        if has_blocks_referenced_by_vote_message(aggregate.message, node_state):
+            if pmap_has(senders_by_message, aggregate.message):
+                senders_by_message = pmap_set(
+                    senders_by_message,
+                    aggregate.message,
+                    pset_merge(
+                        pmap_get(senders_by_message, aggregate.message),
+                        get_aggregated_vote_participants(aggregate, get_validator_set_for_vote_message(aggregate.message, node_state))
+                    )
+                )
+            else:
+                senders_by_message = pmap_set(
+                    senders_by_message,
+                    aggregate.message,
+                    get_aggregated_vote_participants(aggregate, get_validator_set_for_vote_message(aggregate.message, node_state))
+                )
+
+    return senders_by_message
+
+
+def get_votes_not_in_view_or_buffer(votes: PSet[SignedVoteMessage], node_state: NodeState) -> PSet[SignedVoteMessage]:
+    """
+    It retrieves the `votes` that are neither in the local view of votes `node_state.view_votes` nor in the buffer
+    `node_state.buffer_votes`.
+    """
+    return pset_difference(
+        pset_difference(votes, node_state.view_votes),
+        node_state.buffer_votes
+    )
+
+
+def get_blocks_not_in_view_or_buffer(blocks: PSet[Block], node_state: NodeState) -> PMap[Hash, Block]:
+    """
+    It retrieves, by hash, the `blocks` that are neither in `node_state`, see `has_block_hash`, nor in the buffer
+    `node_state.buffer_blocks`.
+    """
+    new_blocks: PMap[Hash, Block] = pmap_get_empty()
+
+    for block in blocks:
+        if not has_block_hash(block_hash(block), node_state) and not pmap_has(node_state.buffer_blocks, block_hash(block)):
+            new_blocks = pmap_set(new_blocks, block_hash(block), block)
+
+    return new_blocks
+
+
+def votes_to_include_in_proposed_block(node_state: NodeState) -> PSet[SignedVoteMessage]:
+    """
+    The votes to include in a proposed block are all those with a GHOST vote for a block in the chain
+    of the proposed block that have not already been included in such a chain.
+    A vote is already included if its sender participates in an aggregated vote for the same message included in the chain,
+    as the votes extracted from such an aggregated vote differ from the votes received on their own only by their signature.
+    """
+    head_block = get_head(node_state)
+    votes_for_blocks_in_canonical_chain = filter_out_GHOST_votes_not_for_blocks_in_blockchain(
+        filter_out_invalid_votes(node_state.view_votes, node_state),
+        head_block,
+        node_state
+    )
+    included_senders = get_senders_included_in_blockchain_by_message(head_block, node_state)
+
+    return pset_filter(
+        lambda vote:
+            not pmap_has(included_senders, vote.message) or
+            not pset_has(pmap_get(included_senders, vote.message), vote.sender),
+        votes_for_blocks_in_canonical_chain
+    )
+
+
+def get_new_block(node_state: NodeState) -> Block:
+    """
+    The votes of the new block are aggregated by message, see `aggregate_votes`.
+    """
     head_block = get_head(node_state)
     return Block(
         parent_hash=block_hash(head_block),
         body=get_block_body(node_state),
         slot=node_state.current_slot,
-        votes=votes_to_include_in_proposed_block(node_state)
+        votes=aggregate_votes(votes_to_include_in_proposed_block(node_state), node_state)
     )
 
 
-def get_votes_to_include_in_propose_message_view(node_state: NodeState) -> PVector[SignedVoteMessage]:
+def get_votes_to_include_in_propose_message_view(node_state: NodeState) -> PVector[AggregatedVoteMessage]:
     """
     The votes to include in the view shared via a Propose message are all valid, non-expired GHOST votes
     for a block descendant of the greatest justified checkpoint but that are not in the chain of the proposed block
-    (as those in the chain of the proposed block are already included in the proposed block itself via, see `votes_to_include_in_proposed_block`)
+    (as those in the chain of the proposed block are already included in the proposed block itself via, see `votes_to_include_in_proposed_block`),
+    aggregated by message, see `aggregate_votes`.
     """
     head_block = get_head(node_state)
-    return from_set_to_pvector(
+    return from_set_to_pvector(aggregate_votes(
         filter_out_GHOST_votes_for_blocks_in_blockchain(
             filter_out_GHOST_votes_non_descendant_of_block(
                 get_block_from_hash(get_greatest_justified_checkpoint(node_state).block_hash, node_state),
@@ -537,45 +1215,108 @@ def get_votes_to_include_in_propose_message_view(node_state: NodeState) -> PVect
             ),
             head_block,
             node_state
-        )
-    )
+        ),
+        node_state
+    ))
 
 
 def get_GHOST_weight(block: Block, votes: PSet[SignedVoteMessage], node_state: NodeState, validatorBalances: ValidatorBalances) -> int:
     """
     The GHOST weight of a `block` is determined by the total stake supporting the branch that ends with this `block` as its tip. 
     Validators vote with associated stakes, and the collective stake behind these votes establishes the block's GHOST weight.
+    The stake of a validator is counted once, no matter how many of its `votes` support the `block`.
+    The votes are grouped by head so that whether a head descends from `block` is checked once per distinct head.
     """    
-    return pset_sum(
-        pset_map(
-            lambda vote: validatorBalances[vote.sender],
-            pset_filter(
-                lambda vote:
-                    has_block_hash(vote.message.head_hash, node_state) and  # Perhaps not needed
-                    is_ancestor_descendant_relationship(
-                        block,
-                        get_block_from_hash(vote.message.head_hash, node_state),
-                        node_state) and
-                    is_validator(vote.sender, validatorBalances),
-                votes
+    votes_by_head = pset_group_by(lambda vote: vote.message.head_hash, votes)
+
+    return validator_set_weight(
+        pset_merge_flatten(
+            pset_map(
+                lambda head_hash: pset_map(lambda vote: vote.sender, pmap_get(votes_by_head, head_hash)),
+                pset_filter(
+                    lambda head_hash:
+                        has_block_hash(head_hash, node_state) and  # Perhaps not needed
+                        is_ancestor_descendant_relationship(
+                            block,
+                            get_block_from_hash(head_hash, node_state),
+                            node_state),
+                    pmap_keys(votes_by_head)
+                )
             )
-        )
+        ),
+        validatorBalances
+    )
+
+
+def get_view_votes_for_head(head_hash: Hash, node_state: NodeState) -> PSet[SignedVoteMessage]:
+    """
+    It retrieves, from the index `node_state.view_votes_by_head`, all the votes in `node_state.view_votes` whose head hash is `head_hash`.
+    """
+    if pmap_has(node_state.view_votes_by_head, head_hash):
+        return pmap_get(node_state.view_votes_by_head, head_hash)
+    else:
+        return pset_get_empty()
+
+
+def get_view_GHOST_weight(block: Block, node_state: NodeState, validatorBalances: ValidatorBalances) -> int:
+    """
+    It computes `get_GHOST_weight(block, node_state.view_votes, node_state, validatorBalances)` from the index
+    `node_state.view_votes_by_head`, so that only the votes for descendants of `block` are looked at.
+    """
+    return validator_set_weight(
+        pset_merge_flatten(
+            pset_map(
+                lambda head_hash: pset_map(lambda vote: vote.sender, get_view_votes_for_head(head_hash, node_state)),
+                pset_filter(
+                    lambda head_hash:
+                        has_block_hash(head_hash, node_state) and
+                        is_ancestor_descendant_relationship(
+                            block,
+                            get_block_from_hash(head_hash, node_state),
+                            node_state),
+                    pmap_keys(node_state.view_votes_by_head)
+                )
+            )
+        ),
+        validatorBalances
     )
 
 
+def get_children_hashes(block_hash: Hash, node_state: NodeState) -> PSet[Hash]:
+    """
+    It retrieves, from the children index `node_state.view_children`, the hashes of all the blocks in `node_state.view_blocks`
+    whose parent hash is `block_hash`.
+    """
+    if pmap_has(node_state.view_children, block_hash):
+        return pmap_get(node_state.view_children, block_hash)
+    else:
+        return pset_get_empty()
+
+
 def get_children(block: Block, node_state: NodeState) -> PSet[Block]:
     """
     Returns all the children of a given `block`.
     """ 
-    return pset_filter(
-        lambda b: b.parent_hash == block_hash(block),
-        get_all_blocks(node_state)
+    return pset_map(
+        lambda child_hash: get_block_from_hash(child_hash, node_state),
+        get_children_hashes(block_hash(block), node_state)
     )
 
 
-def find_head_from(block: Block, votes: PSet[SignedVoteMessage], node_state: NodeState, validatorBalances: ValidatorBalances) -> Block:
+def get_fork_choice_weight(block: Block, node_state: NodeState) -> int:
+    """
+    It retrieves from the fork-choice store the GHOST weight of a `block` descendant of the greatest justified checkpoint,
+    which is equal to `get_GHOST_weight(block, get_GHOST_relevant_votes(node_state), node_state, node_state.fork_choice_store.validator_balances)`.
     """
-    For a given `block`, it uses `get_GHOST_weight` to determine the chain's tip with the largest associated total stake.    
+    if pmap_has(node_state.fork_choice_store.weights, block_hash(block)):
+        return pmap_get(node_state.fork_choice_store.weights, block_hash(block))
+    else:
+        return 0
+
+
+def find_head_from(block: Block, node_state: NodeState) -> Block:
+    """
+    For a given `block`, it uses `get_fork_choice_weight` to determine the chain's tip with the largest associated total stake.    
     """ 
     children = get_children(block, node_state)
 
@@ -584,27 +1325,34 @@ def find_head_from(block: Block, votes: PSet[SignedVoteMessage], node_state: Nod
     else:
         best_child = pset_max(
             children,
-            lambda child: get_GHOST_weight(child, votes, node_state, validatorBalances)
+            lambda child: get_fork_choice_weight(child, node_state)
         )
 
-        return find_head_from(best_child, votes, node_state, validatorBalances)
+        return find_head_from(best_child, node_state)
 
 
-def get_head(node_state: NodeState) -> Block:
+def get_non_expired_GHOST_votes(node_state: NodeState) -> PSet[SignedVoteMessage]:
     """
-    It defines the fork-choice function. It starts from the greatest justified checkpoint, it considers 
-    the latest (non equivocating) votes cast by validators that are not older than `node_state.current_slot` - `node_state.configuration.eta` slots,
-    and it outputs the head of the canonical chain with the largest associated total stake among such `relevant_votes`.
+    It retrieves, from the latest-message table `node_state.latest_messages`, all the votes in `node_state.view_votes` that are not expired,
+    i.e. `filter_out_expired_GHOST_votes(node_state.view_votes, node_state)`.
+    """
+    return pset_merge_flatten(pmap_values(node_state.latest_messages))
+
+
+def get_GHOST_relevant_votes(node_state: NodeState) -> PSet[SignedVoteMessage]:
     """
-    relevant_votes: PSet[SignedVoteMessage] = filter_out_GHOST_votes_non_descendant_of_block(  # Do we really need this given that we start find_head from GJ?
+    It retrieves the votes considered by the fork-choice function, that is, the latest (non equivocating) votes cast by validators
+    that are not older than `node_state.current_slot` - `node_state.configuration.eta` slots, and that are for descendants of
+    the greatest justified checkpoint.
+    As only non-expired votes are considered, the cost of this depends on the number of validators rather than on
+    the size of `node_state.view_votes`.
+    """
+    return filter_out_GHOST_votes_non_descendant_of_block(  # Do we really need this given that we start find_head from GJ?
         get_block_from_hash(get_greatest_justified_checkpoint(node_state).block_hash, node_state),
         filter_out_non_LMD_GHOST_votes(
-            filter_out_expired_GHOST_votes(
-                filter_out_GHOST_equivocating_votes(
-                    filter_out_invalid_votes(
-                        node_state.view_votes,
-                        node_state
-                    ),
+            filter_out_GHOST_equivocating_votes(
+                filter_out_invalid_votes(
+                    get_non_expired_GHOST_votes(node_state),
                     node_state
                 ),
                 node_state
@@ -613,37 +1361,623 @@ def get_head(node_state: NodeState) -> Block:
         node_state
     )
 
-    validatorBalances = get_validator_set_for_slot(
+
+def get_GHOST_relevant_votes_of_senders(senders: PSet[NodeIdentity], node_state: NodeState) -> PSet[SignedVoteMessage]:
+    """
+    It retrieves, for each of `senders`, a vote of `get_GHOST_relevant_votes(node_state)` cast by it, if any, which has
+    the same head as any other such vote. As whether a vote is relevant only depends on the other votes of its sender,
+    this only looks at the latest messages of `senders`. As `filter_out_non_LMD_GHOST_votes` keeps the vote with the
+    highest slot among the valid and non-equivocating ones, they are checked from the most recent one, stopping at the
+    first one that is valid and non-equivocating.
+    """
+    return filter_out_GHOST_votes_non_descendant_of_block(
         get_block_from_hash(get_greatest_justified_checkpoint(node_state).block_hash, node_state),
-        node_state.current_slot,
+        pset_merge_flatten(
+            pset_map(
+                lambda sender: from_pvector_to_pset(
+                    pvector_find_first(
+                        lambda vote: valid_vote(vote, node_state) and not is_equivocating_GHOST_vote(vote, node_state),
+                        pset_sort(get_latest_messages_of_sender(sender, node_state), lambda vote: -vote.message.slot)
+                    )
+                ),
+                senders
+            )
+        ),
         node_state
     )
 
+
+def get_head(node_state: NodeState) -> Block:
+    """
+    It defines the fork-choice function. It starts from the greatest justified checkpoint, it considers 
+    the latest (non equivocating) votes cast by validators that are not older than `node_state.current_slot` - `node_state.configuration.eta` slots,
+    and it outputs the head of the canonical chain with the largest associated total stake among such votes.
+    The weight of each block is read from `node_state.fork_choice_store`, which `update_fork_choice_store` keeps in sync with
+    `get_GHOST_relevant_votes` every time that the view of the node or its current slot change.
+    """
     return find_head_from(
-        get_block_from_hash(get_greatest_justified_checkpoint(node_state).block_hash, node_state),
-        relevant_votes,
-        node_state,
-        validatorBalances
+        get_block_from_hash(node_state.fork_choice_store.justified_hash, node_state),
+        node_state
+    )
+
+
+def get_fork_choice_latest_heads(votes: PSet[SignedVoteMessage], validatorBalances: ValidatorBalances, node_state: NodeState) -> PMap[NodeIdentity, Hash]:
+    """
+    It maps each validator that has cast a GHOST vote in `votes` to the head hash of such a vote.
+    Requires that `votes` contains at most one vote per sender.
+    """
+    latest_heads: PMap[NodeIdentity, Hash] = pmap_get_empty()
+
+    for vote in votes:
+        if has_block_hash(vote.message.head_hash, node_state) and is_validator(vote.sender, validatorBalances):
+            latest_heads = pmap_set(latest_heads, vote.sender, vote.message.head_hash)
+
+    return latest_heads
+
+
+def add_weight_delta(deltas: PMap[Hash, int], block_hash: Hash, delta: int) -> PMap[Hash, int]:
+    if pmap_has(deltas, block_hash):
+        return pmap_set(deltas, block_hash, pmap_get(deltas, block_hash) + delta)
+    else:
+        return pmap_set(deltas, block_hash, delta)
+
+
+def get_fork_choice_weight_deltas(old_heads: PMap[NodeIdentity, Hash], new_heads: PMap[NodeIdentity, Hash], validatorBalances: ValidatorBalances) -> PMap[Hash, int]:
+    """
+    For each block voted by a validator in either `old_heads` or `new_heads`, it computes the change in the weight directly
+    attributed to such a block when moving from counting `old_heads` to counting `new_heads`.
+    """
+    deltas: PMap[Hash, int] = pmap_get_empty()
+
+    for validator in pset_merge(pmap_keys(old_heads), pmap_keys(new_heads)):
+        if not (pmap_has(old_heads, validator) and pmap_has(new_heads, validator) and pmap_get(old_heads, validator) == pmap_get(new_heads, validator)):
+            if pmap_has(old_heads, validator):
+                deltas = add_weight_delta(deltas, pmap_get(old_heads, validator), -pmap_get(validatorBalances, validator))
+            if pmap_has(new_heads, validator):
+                deltas = add_weight_delta(deltas, pmap_get(new_heads, validator), pmap_get(validatorBalances, validator))
+
+    return deltas
+
+
+def get_empty_fork_choice_store(justified_hash: Hash, validatorBalances: ValidatorBalances) -> ForkChoiceStore:
+    return ForkChoiceStore(
+        justified_hash=justified_hash,
+        validator_balances=validatorBalances,
+        latest_heads=pmap_get_empty(),
+        weights=pmap_get_empty(),
+        stale_senders=pset_get_empty()
+    )
+
+
+def mark_fork_choice_stale(senders: PSet[NodeIdentity], node_state: NodeState) -> NodeState:
+    """
+    It records that the latest messages of `senders` changed, so that `update_fork_choice_store` recomputes their counted heads.
+    """
+    return node_state.set(
+        fork_choice_store=node_state.fork_choice_store.set(
+            stale_senders=pset_merge(node_state.fork_choice_store.stale_senders, senders)
+        )
+    )
+
+
+def has_latest_message_waiting_for_blocks(sender: NodeIdentity, node_state: NodeState) -> bool:
+    """
+    It checks whether a latest message of `sender` lacks some of the blocks it references, in which case it may become
+    relevant to the fork choice once they are received, see `has_blocks_referenced_by_vote`.
+    """
+    return not pset_is_empty(
+        pset_filter(
+            lambda vote: not has_blocks_referenced_by_vote(vote, node_state),
+            get_latest_messages_of_sender(sender, node_state)
+        )
+    )
+
+
+def restrict_latest_heads(latest_heads: PMap[NodeIdentity, Hash], senders: PSet[NodeIdentity]) -> PMap[NodeIdentity, Hash]:
+    restricted: PMap[NodeIdentity, Hash] = pmap_get_empty()
+
+    for sender in senders:
+        if pmap_has(latest_heads, sender):
+            restricted = pmap_set(restricted, sender, pmap_get(latest_heads, sender))
+
+    return restricted
+
+
+def update_fork_choice_store(node_state: NodeState) -> NodeState:
+    """
+    It brings `node_state.fork_choice_store` in sync with `get_GHOST_relevant_votes(node_state)`.
+    As whether a vote is relevant only depends on the other votes of its sender, only the counted heads of the senders in
+    `stale_senders` are recomputed. These are the senders whose latest messages changed, see `mark_fork_choice_stale`, and
+    those that have a latest message still waiting for the blocks it references.
+    Only the validators whose counted head changed contribute to the update, and their weight deltas are propagated
+    once along the union of their paths up to the greatest justified checkpoint.
+    If either the greatest justified checkpoint or the validator balances changed, the store is rebuilt from scratch.
+    """
+    justified_hash = get_greatest_justified_checkpoint(node_state).block_hash
+    validatorBalances = get_validator_set_for_slot(
+        get_block_from_hash(justified_hash, node_state),
+        node_state.current_slot,
+        node_state
+    )
+
+    store = node_state.fork_choice_store
+    if store.justified_hash != justified_hash or store.validator_balances != validatorBalances:
+        store = get_empty_fork_choice_store(justified_hash, validatorBalances)
+        stale_senders = pmap_keys(node_state.latest_messages)
+    else:
+        stale_senders = store.stale_senders
+
+    old_heads = restrict_latest_heads(store.latest_heads, stale_senders)
+    new_heads = get_fork_choice_latest_heads(get_GHOST_relevant_votes_of_senders(stale_senders, node_state), validatorBalances, node_state)
+
+    latest_heads = store.latest_heads
+    for sender in pmap_keys(old_heads):
+        latest_heads = pmap_remove(latest_heads, sender)
+    latest_heads = pmap_merge(latest_heads, new_heads)
+
+    propagated_deltas = pmap_propagate_to_ancestors(
+        get_fork_choice_weight_deltas(old_heads, new_heads, validatorBalances),
+        lambda hash: get_block_depth(hash, node_state),
+        lambda hash: get_block_from_hash(hash, node_state).parent_hash,
+        lambda hash: hash == justified_hash
+    )
+
+    weights = store.weights
+    for hash in pmap_keys(propagated_deltas):
+        weights = add_weight_delta(weights, hash, pmap_get(propagated_deltas, hash))
+
+    return node_state.set(
+        fork_choice_store=store.set(
+            latest_heads=latest_heads,
+            weights=weights,
+            stale_senders=pset_filter(lambda sender: has_latest_message_waiting_for_blocks(sender, node_state), stale_senders)
+        )
+    )
+
+
+def add_block_to_ancestry_index(block: Block, node_state: NodeState) -> NodeState:
+    """
+    It records a `block` whose parent is in the ancestry index into the ancestry index `node_state.view_ancestry`.
+    """
+    return node_state.set(
+        view_ancestry=pmap_set(
+            node_state.view_ancestry,
+            block_hash(block),
+            get_new_ancestry_index_entry(block, node_state)
+        )
+    )
+
+
+def add_block_to_view(block: Block, node_state: NodeState) -> NodeState:
+    """
+    It adds `block` to the local view of blocks `node_state.view_blocks` and records it under its parent hash
+    in the children index `node_state.view_children`.
+    If `block` completes a chain, then `block` and all of its descendants in `node_state.view_blocks`, which
+    up to now were not part of a complete chain, are added to the ancestry index `node_state.view_ancestry`.
+    """
+    Requires(not has_block_hash(block_hash(block), node_state))
+    node_state = node_state.set(
+        view_blocks=pmap_set(node_state.view_blocks, block_hash(block), block),
+        view_children=pmap_set(
+            node_state.view_children,
+            block.parent_hash,
+            pset_add(get_children_hashes(block.parent_hash, node_state), block_hash(block))
+        )
+    )
+
+    if is_genesis_block(block, node_state) or has_ancestry_index_entry(block.parent_hash, node_state):
+        return pset_traverse(
+            pset_get_singleton(block),
+            lambda b, ns: get_children(b, ns),
+            lambda b, ns: add_block_to_ancestry_index(b, ns),
+            node_state
+        )
+    else:
+        return node_state
+
+
+def add_blocks_to_view(blocks: PMap[Hash, Block], node_state: NodeState) -> NodeState:
+    """
+    It adds to the local view of blocks all the `blocks` that are not already part of it.
+    """
+    for block in pmap_values(blocks):
+        if not has_block_hash(block_hash(block), node_state):
+            node_state = add_block_to_view(block, node_state)
+
+    return node_state
+
+
+def get_latest_messages_of_sender(sender: NodeIdentity, node_state: NodeState) -> PSet[SignedVoteMessage]:
+    """
+    It retrieves the non-expired votes cast by `sender` from the latest-message table `node_state.latest_messages`.
+    """
+    if pmap_has(node_state.latest_messages, sender):
+        return pmap_get(node_state.latest_messages, sender)
+    else:
+        return pset_get_empty()
+
+
+def add_vote_to_view(vote: SignedVoteMessage, node_state: NodeState) -> NodeState:
+    """
+    It adds `vote` to the local view of votes `node_state.view_votes`, records its head hash in the index `node_state.view_vote_heads` used to
+    detect equivocations, records it in the index by head `node_state.view_votes_by_head`, records it in the FFG indexes `node_state.ffg_votes_by_target` and `node_state.ffg_votes_by_source` and,
+    unless it is expired, adds it to the latest-message table `node_state.latest_messages`.
+    The table keeps all the non-expired votes of a sender, rather than just the one with the highest slot, as the latter
+    may be invalid or equivocating, in which case the fork-choice function falls back to an earlier vote of the same sender.
+    The sender is not marked as stale for the fork choice, which `add_votes_to_view` does once for all the votes it adds.
+    """
+    node_state = node_state.set(
+        view_votes=pset_add(node_state.view_votes, vote),
+        view_vote_heads=pmap_set(
+            node_state.view_vote_heads,
+            SenderAndSlot(sender=vote.sender, slot=vote.message.slot),
+            pset_add(get_voted_heads(vote.sender, vote.message.slot, node_state), vote.message.head_hash)
+        ),
+        view_votes_by_head=pmap_set(
+            node_state.view_votes_by_head,
+            vote.message.head_hash,
+            pset_add(get_view_votes_for_head(vote.message.head_hash, node_state), vote)
+        ),
+        ffg_votes_by_target=pmap_set(
+            node_state.ffg_votes_by_target,
+            vote.message.ffg_target.chkp_slot,
+            pmap_set(
+                get_FFG_targets_for_slot(vote.message.ffg_target.chkp_slot, node_state),
+                vote.message.ffg_target,
+                pset_add(get_FFG_votes_for_target(vote.message.ffg_target, node_state), vote)
+            )
+        ),
+        ffg_votes_by_source=pmap_set(
+            node_state.ffg_votes_by_source,
+            vote.message.ffg_source,
+            pset_add(get_FFG_votes_from_source(vote.message.ffg_source, node_state), vote)
+        )
+    )
+
+    if is_GHOST_vote_expired(vote, node_state):
+        return node_state
+    else:
+        return node_state.set(
+            latest_messages=pmap_set(
+                node_state.latest_messages,
+                vote.sender,
+                pset_add(get_latest_messages_of_sender(vote.sender, node_state), vote)
+            )
+        )
+
+
+def add_votes_to_view(votes: PSet[SignedVoteMessage], node_state: NodeState) -> NodeState:
+    """
+    It adds to the local view of votes all the `votes` that are not already part of it, except for those that
+    would be immediately dropped by `prune_view_on_finality`, and marks the senders of the non-expired ones as stale
+    for the fork choice, see `mark_fork_choice_stale`.
+    """
+    stale_senders: PSet[NodeIdentity] = pset_get_empty()
+
+    for vote in votes:
+        if not pset_has(node_state.view_votes, vote) and not is_prunable_vote(vote, node_state.pruning_anchor, node_state):
+            node_state = add_vote_to_view(vote, node_state)
+            if not is_GHOST_vote_expired(vote, node_state):
+                stale_senders = pset_add(stale_senders, vote.sender)
+
+    return mark_fork_choice_stale(stale_senders, node_state)
+
+
+def filter_out_expired_latest_messages(node_state: NodeState) -> NodeState:
+    """
+    It drops from the latest-message table `node_state.latest_messages` all the votes that are expired in the current slot.
+    The senders whose head counted by the fork-choice store is the head of one of their expired votes are marked as stale,
+    see `mark_fork_choice_stale`: as the counted vote of a sender is its latest valid and non-equivocating vote, the
+    counted votes of the other senders are not expired, and expiring their older votes does not change them.
+    """
+    latest_messages = node_state.latest_messages
+    stale_senders: PSet[NodeIdentity] = pset_get_empty()
+
+    for sender in pmap_keys(node_state.latest_messages):
+        non_expired = filter_out_expired_GHOST_votes(get_latest_messages_of_sender(sender, node_state), node_state)
+        if pset_size(non_expired) < pset_size(get_latest_messages_of_sender(sender, node_state)):
+            if is_counted_head_expired(sender, node_state):
+                stale_senders = pset_add(stale_senders, sender)
+            if pset_is_empty(non_expired):
+                latest_messages = pmap_remove(latest_messages, sender)
+            else:
+                latest_messages = pmap_set(latest_messages, sender, non_expired)
+
+    return mark_fork_choice_stale(stale_senders, node_state.set(latest_messages=latest_messages))
+
+
+def is_counted_head_expired(sender: NodeIdentity, node_state: NodeState) -> bool:
+    """
+    It checks whether the head counted for `sender` by the fork-choice store is the head of an expired vote of `sender`.
+    """
+    return (
+        pmap_has(node_state.fork_choice_store.latest_heads, sender) and
+        not pset_is_empty(
+            pset_filter(
+                lambda vote:
+                    is_GHOST_vote_expired(vote, node_state) and
+                    vote.message.head_hash == pmap_get(node_state.fork_choice_store.latest_heads, sender),
+                get_latest_messages_of_sender(sender, node_state)
+            )
+        )
+    )
+
+
+def add_aggregated_votes_to_view(aggregates: PSet[AggregatedVoteMessage], node_state: NodeState) -> NodeState:
+    """
+    It adds to the local view of votes the votes extracted from the valid `aggregates`, see `get_votes_from_valid_aggregated_votes`.
+    The `aggregates` referencing blocks that are not in the view yet are kept in `node_state.pending_aggregates`, as the committee
+    that their participation bits refer to is only known once such blocks are, unless they would be immediately dropped by
+    `prune_view_on_finality`. The other invalid `aggregates` are dropped.
+    The aggregate signatures of the `aggregates` whose committee is known are verified in a single batch.
+    """
+    verify_aggregated_vote_signatures_in_batch(get_validator_sets_of_aggregated_votes(aggregates, node_state))
+    return add_votes_to_view(
+        get_votes_from_valid_aggregated_votes(aggregates, node_state),
+        node_state.set(
+            pending_aggregates=pset_merge(
+                node_state.pending_aggregates,
+                pset_filter(
+                    lambda aggregate:
+                        not has_blocks_referenced_by_vote_message(aggregate.message, node_state) and
+                        not is_prunable_vote_message(aggregate.message, node_state.pruning_anchor, node_state),
+                    aggregates
+                )
+            )
+        )
     )
 
 
 def execute_view_merge(node_state: NodeState) -> NodeState:
     """
     It merges a validator's buffer with its local view, specifically merging the buffer of blocks `node_state.buffer_blocks` 
-    into the local view of blocks `node_state.view_blocks` and the buffer of votes `node_state.buffer_votes` into the 
-    local view of votes `node_state.view_votes`.
+    into the local view of blocks `node_state.view_blocks` and the buffer of votes `node_state.buffer_votes`, together with
+    the votes extracted from the aggregated votes included in the buffered blocks, into the local view of votes `node_state.view_votes`.
+    As the votes included in the blocks already in `node_state.view_blocks` have been merged when such blocks were, only the
+    votes included in the buffered blocks need to be merged, together with those of the aggregated votes that were pending
+    in `node_state.pending_aggregates`, see `add_aggregated_votes_to_view`.
+    The signatures of the buffered votes are verified in a single batch, and so are those of the aggregated votes, see
+    `add_aggregated_votes_to_view`.
     """ 
-    node_state = node_state.set(blocks=pmap_merge(node_state.view_blocks, node_state.buffer_blocks))
-    node_state = node_state.set(view_vote=pset_merge(
-        pset_merge(
-            node_state.view_votes,
-            node_state.buffer_votes
-        ),
-        get_votes_included_in_blocks(get_all_blocks(node_state)))
+    aggregates_to_merge = pset_merge(
+        node_state.pending_aggregates,
+        get_aggregated_votes_included_in_blocks(pmap_values(node_state.buffer_blocks))
     )
-    node_state = node_state.set(buffer_vote=pset_get_empty())
+    verify_vote_signatures_in_batch(node_state.buffer_votes)
+    node_state = add_blocks_to_view(node_state.buffer_blocks, node_state)
+    node_state = add_votes_to_view(node_state.buffer_votes, node_state)
+    node_state = add_aggregated_votes_to_view(aggregates_to_merge, node_state.set(pending_aggregates=pset_get_empty()))
+    node_state = node_state.set(buffer_votes=pset_get_empty())
     node_state = node_state.set(buffer_blocks=pmap_get_empty())
-    return node_state
+    return update_fork_choice_store(prune_view_on_finality(update_FFG_checkpoints(node_state)))
+
+
+def remove_votes_from_index(index: PMap[T1, PSet[SignedVoteMessage]], votes_by_key: PMap[T1, PSet[SignedVoteMessage]]) -> PMap[T1, PSet[SignedVoteMessage]]:
+    """
+    It removes from `index`, an index over `node_state.view_votes`, the votes `votes_by_key` grouped by the key of `index`,
+    dropping the entries that are left empty.
+    The votes are removed one at a time, as they are usually few compared to the votes of their entry.
+    """
+    for key in pmap_keys(votes_by_key):
+        if pmap_has(index, key):
+            remaining_votes = pmap_get(index, key)
+            for vote in pmap_get(votes_by_key, key):
+                remaining_votes = pset_remove(remaining_votes, vote)
+            if pset_is_empty(remaining_votes):
+                index = pmap_remove(index, key)
+            else:
+                index = pmap_set(index, key, remaining_votes)
+
+    return index
+
+
+def is_prunable_vote_message(message: VoteMessage, anchor: Checkpoint, node_state: NodeState) -> bool:
+    """
+    When pruning is enabled, a vote can be dropped from the view once it can no longer affect either GHOST, because it is expired,
+    or FFG, because its target checkpoint is not later than the finalized checkpoint `anchor`, which only depends on its `message`.
+    """
+    return (
+        node_state.configuration.prune_on_finality and
+        message.slot + node_state.configuration.eta < node_state.current_slot and
+        message.ffg_target.chkp_slot <= anchor.chkp_slot
+    )
+
+
+def is_prunable_vote(vote: SignedVoteMessage, anchor: Checkpoint, node_state: NodeState) -> bool:
+    return is_prunable_vote_message(vote.message, anchor, node_state)
+
+
+def prune_votes(anchor: Checkpoint, node_state: NodeState) -> NodeState:
+    """
+    It drops from the local view of votes, and from its indexes, all the votes that `is_prunable_vote` with respect to `anchor`,
+    as well as the pending aggregated votes `node_state.pending_aggregates` whose message is prunable.
+    Only the votes targeting a checkpoint slot not later than `anchor` need to be checked, and these are found through the FFG index.
+    Expired votes are not in the latest-message table, so the table is not affected.
+    """
+    prunable_votes = pset_merge_flatten(
+        pset_map(
+            lambda chkp_slot: pset_filter(
+                lambda vote: is_prunable_vote(vote, anchor, node_state),
+                get_FFG_votes_for_target_slot(chkp_slot, node_state)
+            ),
+            pset_filter(lambda chkp_slot: chkp_slot <= anchor.chkp_slot, pmap_keys(node_state.ffg_votes_by_target))
+        )
+    )
+
+    ffg_votes_by_target = node_state.ffg_votes_by_target
+    prunable_votes_by_target = pset_group_by(lambda vote: vote.message.ffg_target, prunable_votes)
+    for chkp_slot in pset_map(lambda target: target.chkp_slot, pmap_keys(prunable_votes_by_target)):
+        remaining_targets = remove_votes_from_index(get_FFG_targets_for_slot(chkp_slot, node_state), prunable_votes_by_target)
+        if pmap_size(remaining_targets) == 0:
+            ffg_votes_by_target = pmap_remove(ffg_votes_by_target, chkp_slot)
+        else:
+            ffg_votes_by_target = pmap_set(ffg_votes_by_target, chkp_slot, remaining_targets)
+
+    view_votes = node_state.view_votes
+    for vote in prunable_votes:
+        view_votes = pset_remove(view_votes, vote)
+
+    node_state = node_state.set(
+        view_votes=view_votes,
+        view_votes_by_head=remove_votes_from_index(
+            node_state.view_votes_by_head,
+            pset_group_by(lambda vote: vote.message.head_hash, prunable_votes)
+        ),
+        ffg_votes_by_target=ffg_votes_by_target,
+        ffg_votes_by_source=remove_votes_from_index(
+            node_state.ffg_votes_by_source,
+            pset_group_by(lambda vote: vote.message.ffg_source, prunable_votes)
+        )
+    )
+
+    view_vote_heads = node_state.view_vote_heads
+    for sender_and_slot in pmap_keys(node_state.view_vote_heads):
+        if sender_and_slot.slot + node_state.configuration.eta < node_state.current_slot:
+            view_vote_heads = pmap_remove(view_vote_heads, sender_and_slot)
+
+    return node_state.set(
+        view_vote_heads=view_vote_heads,
+        pending_aggregates=pset_filter(
+            lambda aggregate: not is_prunable_vote_message(aggregate.message, anchor, node_state),
+            node_state.pending_aggregates
+        )
+    )
+
+
+def is_block_to_keep_on_pruning(block: Block, finalized_block: Block, node_state: NodeState) -> bool:
+    """
+    It checks whether `block` may still be part of the chains of a node once `finalized_block` is finalized, that is, whether it is
+    an ancestor or a descendant of `finalized_block`, an ancestor of the available chain `node_state.chava` or of the block of the
+    greatest justified checkpoint, or whether it is not part of a complete chain yet but it may still become a descendant of `finalized_block`.
+    """
+    if not has_ancestry_index_entry(block_hash(block), node_state):
+        return block.slot > finalized_block.slot
+    else:
+        return (
+            is_ancestor_descendant_relationship(block, finalized_block, node_state) or
+            is_ancestor_descendant_relationship(finalized_block, block, node_state) or
+            is_ancestor_descendant_relationship(block, node_state.chava, node_state) or
+            is_ancestor_descendant_relationship(
+                block,
+                get_block_from_hash(get_greatest_justified_checkpoint(node_state).block_hash, node_state),
+                node_state
+            )
+        )
+
+
+def remove_block_from_children_of_parent(block: Block, node_state: NodeState) -> NodeState:
+    if pmap_has(node_state.view_children, block.parent_hash):
+        return node_state.set(
+            view_children=pmap_set(
+                node_state.view_children,
+                block.parent_hash,
+                pset_remove(get_children_hashes(block.parent_hash, node_state), block_hash(block))
+            )
+        )
+    else:
+        return node_state
+
+
+def remove_block_children_entry(block: Block, node_state: NodeState) -> NodeState:
+    if pmap_has(node_state.view_children, block_hash(block)):
+        return node_state.set(view_children=pmap_remove(node_state.view_children, block_hash(block)))
+    else:
+        return node_state
+
+
+def remove_block_from_view(block: Block, node_state: NodeState) -> NodeState:
+    """
+    It drops `block` from the local view of blocks together with its entries in the children and ancestry indexes.
+    """
+    node_state = remove_block_children_entry(block, remove_block_from_children_of_parent(block, node_state))
+
+    if has_ancestry_index_entry(block_hash(block), node_state):
+        node_state = node_state.set(view_ancestry=pmap_remove(node_state.view_ancestry, block_hash(block)))
+
+    return node_state.set(view_blocks=pmap_remove(node_state.view_blocks, block_hash(block)))
+
+
+def archive_block(block: Block, node_state: NodeState) -> NodeState:
+    """
+    It moves a `block` of the finalized chain from the local view of blocks to `node_state.archived_blocks`, keeping only
+    its header, see `get_block_header`: its votes have been merged into the local view of votes when it was added to the
+    local view of blocks, and are no longer needed.
+    The ancestry index entry of `block` is kept, as the jump pointers of its descendants may lead to it.
+    """
+    return remove_block_children_entry(block, node_state).set(
+        view_blocks=pmap_remove(node_state.view_blocks, block_hash(block)),
+        archived_blocks=pmap_set(node_state.archived_blocks, block_hash(block), get_block_header(block))
+    )
+
+
+def prune_blocks(finalized_block: Block, node_state: NodeState) -> NodeState:
+    """
+    It drops from the local view of blocks all the blocks that conflict with `finalized_block`, see `is_block_to_keep_on_pruning`,
+    and archives all the strict ancestors of `finalized_block`, which becomes the oldest block of the local view of blocks.
+    The blocks to drop and to archive are determined before any of them is, as the ancestry index of the blocks to drop
+    is used to determine the others.
+    The candidate blocks `node_state.s_cand` and the available chain `node_state.chava` that are archived are replaced by
+    their headers, so that the votes of archived blocks are not kept through them.
+    """
+    blocks_to_drop = pset_filter(
+        lambda block: not is_block_to_keep_on_pruning(block, finalized_block, node_state),
+        get_all_blocks(node_state)
+    )
+    blocks_to_archive = pset_filter(
+        lambda block:
+            block != finalized_block and
+            has_ancestry_index_entry(block_hash(block), node_state) and
+            is_ancestor_descendant_relationship(block, finalized_block, node_state),
+        get_all_blocks(node_state)
+    )
+
+    for block in blocks_to_drop:
+        node_state = remove_block_from_view(block, node_state)
+
+    for block in blocks_to_archive:
+        node_state = archive_block(block, node_state)
+
+    return node_state.set(
+        s_cand=pset_map(
+            lambda b: get_block_from_hash(block_hash(b), node_state),
+            pset_filter(lambda b: has_block_hash(block_hash(b), node_state), node_state.s_cand)
+        ),
+        chava=get_block_from_hash(block_hash(node_state.chava), node_state)
+    )
+
+
+def prune_view_on_finality(node_state: NodeState) -> NodeState:
+    """
+    If `node_state.configuration.prune_on_finality` is set, every time that the greatest finalized checkpoint advances past
+    `node_state.pruning_anchor`, it drops the blocks that conflict with the finalized block, it archives the blocks preceding it
+    and it drops the votes that can no longer affect either GHOST or FFG.
+    The finalized chain stays available through `node_state.archived_blocks`, and the justified and finalized checkpoints stay
+    available through their caches `node_state.justified_checkpoints` and `node_state.finalized_checkpoints`.
+    """
+    finalized_checkpoint = get_greatest_finalized_checkpoint(node_state)
+
+    if not node_state.configuration.prune_on_finality or finalized_checkpoint.chkp_slot <= node_state.pruning_anchor.chkp_slot:
+        return node_state
+    else:
+        return prune_blocks(
+            get_block_from_hash(finalized_checkpoint.block_hash, node_state),
+            prune_votes(finalized_checkpoint, node_state)
+        ).set(pruning_anchor=finalized_checkpoint)
+
+
+def set_current_slot(slot: int, node_state: NodeState) -> NodeState:
+    """
+    It sets the current slot of a node, dropping the votes that expire from the latest-message table and updating
+    the fork-choice store accordingly.
+    """
+    if slot == node_state.current_slot:
+        return node_state
+    else:
+        return update_fork_choice_store(
+            filter_out_expired_latest_messages(
+                node_state.set(current_slot=slot)
+            )
+        )
 
 
 def get_block_k_deep(blockHead: Block, k: int, node_state: NodeState) -> Block:
@@ -651,10 +1985,21 @@ def get_block_k_deep(blockHead: Block, k: int, node_state: NodeState) -> Block:
     It identifies the block that is `k` blocks back from the tip of the canonical chain, or the genesis block `node_state.configuration.genesis`.
     """ 
     Requires(is_complete_chain(blockHead, node_state))
-    if k <= 0 or blockHead == node_state.configuration.genesis:
+    if k <= 0 or is_genesis_block(blockHead, node_state):
         return blockHead
-    else:
+    elif not has_ancestry_index_entry(block_hash(blockHead), node_state):
         return get_block_k_deep(get_parent(blockHead, node_state), k - 1, node_state)
+    elif get_block_depth(block_hash(blockHead), node_state) <= k:
+        return node_state.configuration.genesis
+    else:
+        return get_block_from_hash(
+            get_ancestor_at_depth(
+                block_hash(blockHead),
+                get_block_depth(block_hash(blockHead), node_state) - k,
+                node_state
+            ),
+            node_state
+        )
 
 
 def is_confirmed(block: Block, node_state: NodeState) -> bool:
@@ -666,11 +2011,11 @@ def is_confirmed(block: Block, node_state: NodeState) -> bool:
         node_state
     )
 
-    tot_validator_set_weight = validator_set_weight(pmap_keys(validatorBalances), validatorBalances)
+    tot_validator_set_weight = total_validator_set_weight(validatorBalances)
 
     return (
         is_ancestor_descendant_relationship(block, head_block, node_state) and
-        get_GHOST_weight(block, node_state.view_votes, node_state, validatorBalances) * 3 >= tot_validator_set_weight * 2
+        get_view_GHOST_weight(block, node_state, validatorBalances) * 3 >= tot_validator_set_weight * 2
     )
 
 
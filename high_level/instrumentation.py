@@ -0,0 +1,206 @@
+"""
+Opt-in instrumentation of the functions of the specification, attributing their cost to the enclosing event and slot.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+`enable` replaces every function defined in `helpers.py` and `3sf_high_level.py`, in all the modules of the
+specification that import it, by a wrapper recording its calls; `disable` puts the original functions back, so that
+instrumentation costs nothing while it is disabled. The functions of `pythonic_code_generic.py` are only instrumented
+if asked for, as they are both very small and very frequently called.
+
+For each function, and for each slot and innermost enclosing event handler, it records:
+- the number of calls;
+- the cumulative time, i.e. including the callees, counted once for recursive calls;
+- the self time, i.e. excluding the callees;
+- the maximum recursion depth.
+The slot is the `current_slot` of the `NodeState` passed to the event handler. Calls outside of any event handler are
+attributed to no slot and no event.
+
+Example:
+
+    with instrumented() as instrumentation:
+        simulation.run(10)
+    print(instrumentation.format_report(top=10))
+"""
+import importlib
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import wraps
+from inspect import isfunction
+from types import ModuleType
+from typing import Any, Callable, Iterator, Optional
+
+import helpers
+import pythonic_code_generic
+from data_structures import NodeState
+
+spec = importlib.import_module('3sf_high_level')
+
+EVENTS = frozenset({
+    'on_tick', 'on_propose', 'on_vote', 'on_confirm', 'on_merge',
+    'on_received_propose', 'on_block_received', 'on_vote_received',
+    'on_received_proposes', 'on_blocks_received', 'on_votes_received',
+})
+
+Key = tuple[Optional[int], Optional[str], str]  # Slot, event, function
+
+
+@dataclass
+class FunctionStats:
+    calls: int = 0
+    cumulative_seconds: float = 0.0
+    self_seconds: float = 0.0
+    max_depth: int = 0
+
+
+class Instrumentation:
+    def __init__(self) -> None:
+        self.stats: dict[Key, FunctionStats] = {}
+        self.children_seconds: list[float] = []  # Time spent in the callees of each active call, innermost last
+        self.depths: dict[str, int] = {}
+        self.events: list[tuple[Optional[int], str]] = []  # Active event handlers, innermost last
+        self.patches: list[tuple[ModuleType, str, Callable]] = []
+
+    def wrap(self, name: str, function: Callable) -> Callable:
+        is_event = name in EVENTS
+        stats = self.stats
+        children_seconds = self.children_seconds
+        depths = self.depths
+        events = self.events
+
+        @wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if is_event:
+                node_state = next((a for a in args if isinstance(a, NodeState)), None)
+                events.append((None if node_state is None else node_state.current_slot, name))
+            depth = depths.get(name, 0) + 1
+            depths[name] = depth
+            children_seconds.append(0.0)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                own_children_seconds = children_seconds.pop()
+                if len(children_seconds) > 0:
+                    children_seconds[-1] += elapsed
+                depths[name] = depth - 1
+                slot, event = events[-1] if len(events) > 0 else (None, None)
+                key = (slot, event, name)
+                entry = stats.get(key)
+                if entry is None:
+                    entry = stats[key] = FunctionStats()
+                entry.calls += 1
+                entry.self_seconds += elapsed - own_children_seconds
+                if depth == 1:
+                    entry.cumulative_seconds += elapsed
+                if depth > entry.max_depth:
+                    entry.max_depth = depth
+                if is_event:
+                    events.pop()
+
+        return wrapper
+
+    def patch(self, include_generic: bool = False) -> None:
+        defining_modules = {helpers.__name__, spec.__name__}
+        if include_generic:
+            defining_modules.add(pythonic_code_generic.__name__)
+        wrappers: dict[int, Callable] = {}
+        for module in (pythonic_code_generic, helpers, spec):
+            for name, value in list(vars(module).items()):
+                if isfunction(value) and value.__module__ in defining_modules:
+                    # The same function is bound in every module importing it, and gets the same wrapper in all of them.
+                    if id(value) not in wrappers:
+                        wrappers[id(value)] = self.wrap(name, value)
+                    self.patches.append((module, name, value))
+                    setattr(module, name, wrappers[id(value)])
+
+    def unpatch(self) -> None:
+        for module, name, original in reversed(self.patches):
+            setattr(module, name, original)
+        self.patches = []
+
+    def reset(self) -> None:
+        self.stats.clear()
+
+    def slots(self) -> list[Optional[int]]:
+        return sorted({slot for slot, _, _ in self.stats}, key=lambda slot: -1 if slot is None else slot)
+
+    def report(self, slot: Optional[int] = None) -> list[dict[str, Any]]:
+        """
+        One row per slot, event and function, by slot and decreasing self time, restricted to `slot` if given.
+        """
+        rows = [
+            {"slot": s, "event": event, "function": function, **asdict(entry)}
+            for (s, event, function), entry in self.stats.items()
+            if slot is None or s == slot
+        ]
+        return sorted(rows, key=lambda row: (-1 if row["slot"] is None else row["slot"], -row["self_seconds"]))
+
+    def totals(self) -> dict[str, FunctionStats]:
+        """
+        The statistics of each function over all the slots and events.
+        """
+        totals: dict[str, FunctionStats] = {}
+        for (_, _, function), entry in self.stats.items():
+            total = totals.setdefault(function, FunctionStats())
+            total.calls += entry.calls
+            total.cumulative_seconds += entry.cumulative_seconds
+            total.self_seconds += entry.self_seconds
+            total.max_depth = max(total.max_depth, entry.max_depth)
+        return totals
+
+    def format_report(self, top: int = 10) -> str:
+        """
+        For each slot, the `top` slot, event and function rows with the greatest self time.
+        """
+        lines = []
+        for slot in self.slots():
+            lines.append(f"slot {slot}")
+            lines.append(f"  {'event':<20} {'function':<55} {'calls':>9} {'self s':>10} {'cum s':>10} {'depth':>5}")
+            for row in self.report(slot)[:top]:
+                lines.append(
+                    f"  {str(row['event']):<20} {row['function']:<55} {row['calls']:>9} "
+                    f"{row['self_seconds']:>10.4f} {row['cumulative_seconds']:>10.4f} {row['max_depth']:>5}"
+                )
+        return "\n".join(lines)
+
+    def dump_json(self, path: str) -> None:
+        with open(path, "w") as output:
+            json.dump(self.report(), output, indent=2)
+
+
+_active: Optional[Instrumentation] = None
+
+
+def enable(include_generic: bool = False) -> Instrumentation:
+    """
+    It instruments the functions of the specification, and returns the `Instrumentation` recording their calls.
+    """
+    global _active
+    if _active is None:
+        _active = Instrumentation()
+        _active.patch(include_generic)
+    return _active
+
+
+def disable() -> Optional[Instrumentation]:
+    """
+    It restores the original functions, and returns the `Instrumentation` that was recording their calls, if any.
+    """
+    global _active
+    instrumentation = _active
+    if instrumentation is not None:
+        instrumentation.unpatch()
+        _active = None
+    return instrumentation
+
+
+@contextmanager
+def instrumented(include_generic: bool = False) -> Iterator[Instrumentation]:
+    instrumentation = enable(include_generic)
+    try:
+        yield instrumentation
+    finally:
+        disable()
@@ -0,0 +1,409 @@
+"""
+Append-only journal of the events received by a node, for recovering its exact state after a crash.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+A `JournaledNode` records every event before handing it to the corresponding `@Event` handler of the specification.
+As the handlers are deterministic, the state of the node is that obtained by replaying the recorded events on its
+initial state, or on the latest snapshot taken by `JournaledNode.take_snapshot`, see `snapshot.py`.
+Ticks that leave the slot and the phase unchanged do not change the state and are not recorded.
+
+A journal is a directory of segments and snapshots. Each record of a segment is length-prefixed and checksummed:
+
+    u32 length | u32 CRC-32 of the body | body = u64 sequence number | u8 kind | u64 time or encoded message
+
+where messages are encoded by `message_codec.py`. Records are appended in groups: `Journal.append` buffers them, and
+a group is written and synced to disk with a single `fsync` once it holds `group_size` records, once its oldest record
+is `group_interval` seconds old, or on `Journal.commit`. Only committed records survive a crash, so the messages
+output by the handlers should only be sent after a commit. Taking a snapshot starts a new segment; a record torn by a
+crash ends the journal and is truncated away on reopening.
+
+`recover` loads the latest snapshot and replays only the records after it. With `fast=True`, the fork-choice store is
+only brought in sync when `get_head` reads it after a change of the view or of the slot, and once at the end, rather
+than on every call of `update_fork_choice_store`; `check_fast_replay` checks that both replays agree, and
+`python simulator.py --check-fast-replay` runs it on the events of every simulated node.
+"""
+import os
+import struct
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Callable, Iterator, Optional, Sequence, Union
+
+from pyrsistent import PMap, PSet, pmap, pset
+
+import helpers
+import memoization
+import importlib
+from data_structures import *
+from message_codec import MessageCodec
+from snapshot import load_snapshot, save_snapshot
+
+spec = importlib.import_module('3sf_high_level')
+memoization.enable()
+
+_FRAME = struct.Struct("<II")  # length, CRC-32 of the body
+_RECORD = struct.Struct("<QB")  # sequence number, kind
+_TIME = struct.Struct("<Q")
+
+
+class RecordKind(IntEnum):
+    TICK = 0
+    PROPOSE = 1
+    BLOCK = 2
+    VOTE = 3
+
+
+@dataclass(frozen=True)
+class JournalRecord:
+    sequence: int
+    kind: RecordKind
+    payload: Union[int, SignedProposeMessage, Block, SignedVoteMessage]  # The time of a tick, or the message received
+
+
+def _segment_name(first_sequence: int) -> str:
+    return f"journal-{first_sequence:016d}.log"
+
+
+def _snapshot_name(last_sequence: int) -> str:
+    return f"snapshot-{last_sequence:016d}.snap"
+
+
+def _numbered_files(directory: str, prefix: str, suffix: str) -> list[tuple[int, str]]:
+    return sorted(
+        (int(name[len(prefix):-len(suffix)]), os.path.join(directory, name))
+        for name in os.listdir(directory)
+        if name.startswith(prefix) and name.endswith(suffix)
+    )
+
+
+class Journal:
+    """
+    The journal stored in `directory`, created if needed.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        group_size: int = 256,
+        group_interval: float = 0.01,
+        sync: bool = True,
+        codec: Optional[MessageCodec] = None
+    ):
+        self.directory = directory
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.sync = sync
+        self.codec = codec if codec is not None else MessageCodec()
+        self.pending: list[bytes] = []
+        self.pending_since = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+        self.next_sequence = 0
+        snapshot = self.latest_snapshot()
+        if snapshot is not None:
+            self.next_sequence = snapshot[0] + 1
+        segments = self.segments()
+        if len(segments) == 0:
+            self.output = open(os.path.join(directory, _segment_name(self.next_sequence)), "ab")
+        else:
+            path = segments[-1][1]
+            end = segments[-1][0]
+            valid_length = 0
+            for record, offset in self._read_segment(path):
+                end = record.sequence + 1
+                valid_length = offset
+            if valid_length < os.path.getsize(path):
+                os.truncate(path, valid_length)
+            self.next_sequence = max(self.next_sequence, end)
+            self.output = open(path, "ab")
+
+    def segments(self) -> list[tuple[int, str]]:
+        return _numbered_files(self.directory, "journal-", ".log")
+
+    def snapshots(self) -> list[tuple[int, str]]:
+        return _numbered_files(self.directory, "snapshot-", ".snap")
+
+    def latest_snapshot(self) -> Optional[tuple[int, str]]:
+        """
+        The sequence number of the last record included in the latest snapshot, and the path of the snapshot.
+        """
+        snapshots = self.snapshots()
+        return snapshots[-1] if len(snapshots) > 0 else None
+
+    def encode(self, kind: RecordKind, payload: Any) -> bytes:
+        body = _RECORD.pack(self.next_sequence, kind) + (
+            _TIME.pack(payload) if kind == RecordKind.TICK else self.codec.encode_batch([(payload, [])])
+        )
+        return _FRAME.pack(len(body), zlib.crc32(body)) + body
+
+    def append(self, kind: RecordKind, payload: Any) -> int:
+        """
+        It appends a record to the current group, writing the group if it is full or old enough, and returns the
+        sequence number of the record.
+        """
+        if len(self.pending) == 0:
+            self.pending_since = time.monotonic()
+        self.pending.append(self.encode(kind, payload))
+        sequence = self.next_sequence
+        self.next_sequence += 1
+        if len(self.pending) >= self.group_size or time.monotonic() - self.pending_since >= self.group_interval:
+            self.commit()
+        return sequence
+
+    def commit(self) -> None:
+        """
+        It writes the records appended so far and waits for them to be on disk.
+        """
+        if len(self.pending) > 0:
+            self.output.write(b"".join(self.pending))
+            self.pending = []
+        self.output.flush()
+        if self.sync:
+            os.fsync(self.output.fileno())
+
+    def decode(self, body: bytes) -> JournalRecord:
+        sequence, kind = _RECORD.unpack_from(body)
+        data = body[_RECORD.size:]
+        if kind == RecordKind.TICK:
+            payload: Any = _TIME.unpack(data)[0]
+        else:
+            payload = self.codec.decode_batch(data)[0][0]
+        return JournalRecord(sequence, RecordKind(kind), payload)
+
+    def _read_segment(self, path: str) -> Iterator[tuple[JournalRecord, int]]:
+        """
+        The records of the segment at `path`, each with the offset of its end, up to the first torn or corrupt record.
+        """
+        with open(path, "rb") as segment:
+            data = segment.read()
+        offset = 0
+        while offset + _FRAME.size <= len(data):
+            length, checksum = _FRAME.unpack_from(data, offset)
+            body = data[offset + _FRAME.size:offset + _FRAME.size + length]
+            if len(body) < length or zlib.crc32(body) != checksum:
+                return
+            offset += _FRAME.size + length
+            yield self.decode(body), offset
+
+    def records(self, after: int = -1) -> Iterator[JournalRecord]:
+        """
+        The committed records with a sequence number greater than `after`, in order.
+        """
+        segments = self.segments()
+        for index, (first, path) in enumerate(segments):
+            if index + 1 < len(segments) and segments[index + 1][0] <= after + 1:
+                continue
+            for record, _ in self._read_segment(path):
+                if record.sequence > after:
+                    yield record
+
+    def snapshot(self, node_state: NodeState, last_sequence: int) -> None:
+        """
+        It stores `node_state`, which must be the state after the record `last_sequence`, and starts a new segment.
+        """
+        self.commit()
+        path = os.path.join(self.directory, _snapshot_name(last_sequence))
+        save_snapshot(node_state, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self.output.close()
+        self.output = open(os.path.join(self.directory, _segment_name(self.next_sequence)), "ab")
+
+    def discard_before_latest_snapshot(self) -> None:
+        """
+        It deletes the snapshots older than the latest one and the segments only holding records included in it.
+        """
+        latest = self.latest_snapshot()
+        if latest is None:
+            return
+        for sequence, path in self.snapshots():
+            if sequence < latest[0]:
+                os.remove(path)
+        segments = self.segments()
+        for index, (_, path) in enumerate(segments[:-1]):
+            if segments[index + 1][0] <= latest[0] + 1:
+                os.remove(path)
+
+    def close(self) -> None:
+        self.commit()
+        self.output.close()
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def apply_record(record: JournalRecord, node_state: NodeState) -> NewNodeStateAndMessagesToTx:
+    if record.kind == RecordKind.TICK:
+        return spec.on_tick(node_state, record.payload)
+    elif record.kind == RecordKind.PROPOSE:
+        return spec.on_received_propose(record.payload, node_state)
+    elif record.kind == RecordKind.BLOCK:
+        return spec.on_block_received(record.payload, node_state)
+    else:
+        return spec.on_vote_received(record.payload, node_state)
+
+
+class JournaledNode:
+    """
+    A node whose events are recorded in `journal` before being handled. `node_state` must be the state after the last
+    record of `journal`, as returned by `recover`.
+    """
+
+    def __init__(self, journal: Journal, node_state: NodeState):
+        self.journal = journal
+        self.node_state = node_state
+        self.last_sequence = journal.next_sequence - 1
+
+    def handle(self, kind: RecordKind, payload: Any) -> NewNodeStateAndMessagesToTx:
+        record = JournalRecord(self.journal.append(kind, payload), kind, payload)
+        output = apply_record(record, self.node_state)
+        self.node_state = output.state
+        self.last_sequence = record.sequence
+        return output
+
+    def on_tick(self, time: int) -> NewNodeStateAndMessagesToTx:
+        if (
+            helpers.get_slot_from_time(time, self.node_state) == self.node_state.current_slot and
+            helpers.get_phase_from_time(time, self.node_state) == self.node_state.current_phase
+        ):
+            return spec.on_tick(self.node_state, time)
+        return self.handle(RecordKind.TICK, time)
+
+    def on_received_propose(self, propose: SignedProposeMessage) -> NewNodeStateAndMessagesToTx:
+        return self.handle(RecordKind.PROPOSE, propose)
+
+    def on_block_received(self, block: Block) -> NewNodeStateAndMessagesToTx:
+        return self.handle(RecordKind.BLOCK, block)
+
+    def on_vote_received(self, vote: SignedVoteMessage) -> NewNodeStateAndMessagesToTx:
+        return self.handle(RecordKind.VOTE, vote)
+
+    def commit(self) -> None:
+        self.journal.commit()
+
+    def take_snapshot(self) -> None:
+        self.journal.snapshot(self.node_state, self.last_sequence)
+
+
+def _fork_choice_inputs(node_state: NodeState) -> tuple[Any, ...]:
+    # The fields that `update_fork_choice_store` reads, which are shared by the successive states of a node as long
+    # as they are not modified.
+    return (
+        node_state.view_blocks,
+        node_state.view_votes,
+        node_state.latest_messages,
+        node_state.current_slot,
+        node_state.configuration
+    )
+
+
+def _changed_senders(old: PMap[NodeIdentity, PSet[SignedVoteMessage]], new: PMap[NodeIdentity, PSet[SignedVoteMessage]]) -> PSet[NodeIdentity]:
+    # The entries of a latest-message table that are not modified are shared by the successive states of a node.
+    return pset(sender for sender in {*old.keys(), *new.keys()} if old.get(sender) is not new.get(sender))
+
+
+class _DeferredForkChoice:
+    """
+    The store of the last node state read by `get_head`, and the inputs it was brought in sync with.
+    """
+
+    def __init__(self, update_fork_choice_store: Callable[[NodeState], NodeState]):
+        self.update_fork_choice_store = update_fork_choice_store
+        self.inputs: tuple[Any, ...] = ()
+        self.latest_messages: PMap[NodeIdentity, PSet[SignedVoteMessage]] = pmap()
+        self.store: Optional[ForkChoiceStore] = None
+
+    def synced(self, node_state: NodeState) -> NodeState:
+        """
+        `node_state` with its fork-choice store brought in sync. The handlers mark senders as stale by reading the store
+        of the state they are given, which is not in sync within `deferred_fork_choice`: `filter_out_expired_latest_messages`
+        in particular misses the senders whose counted head expired since the last sync. Every sender whose entry in
+        `node_state.latest_messages` changed since the last sync is therefore marked as stale, besides those marked by the
+        handlers.
+        """
+        inputs = _fork_choice_inputs(node_state)
+        if self.store is None or any(a is not b for a, b in zip(inputs, self.inputs)):
+            if self.store is not None:
+                node_state = helpers.mark_fork_choice_stale(
+                    helpers.pset_merge(
+                        node_state.fork_choice_store.stale_senders,
+                        _changed_senders(self.latest_messages, node_state.latest_messages)
+                    ),
+                    node_state.set(fork_choice_store=self.store)
+                )
+            self.store = self.update_fork_choice_store(node_state).fork_choice_store
+            self.inputs = inputs
+            self.latest_messages = node_state.latest_messages
+        return node_state.set(fork_choice_store=self.store)
+
+
+@contextmanager
+def deferred_fork_choice() -> Iterator[_DeferredForkChoice]:
+    """
+    Within this context, `update_fork_choice_store` leaves the store as it is, and `get_head` computes the head from the
+    store brought in sync with the node state it is given, which is only updated when the fields of the node state it
+    depends on change. As the store is a cache of `get_GHOST_relevant_votes`, this does not change the result of any
+    function but the value of `fork_choice_store` itself, which `_DeferredForkChoice.synced` brings in sync.
+    """
+    update_fork_choice_store = helpers.update_fork_choice_store
+    get_head = helpers.get_head
+    deferred = _DeferredForkChoice(update_fork_choice_store)
+    modules = (helpers, spec)
+    for module in modules:
+        module.update_fork_choice_store = lambda node_state: node_state
+        module.get_head = lambda node_state: get_head(deferred.synced(node_state))
+    try:
+        yield deferred
+    finally:
+        for module in modules:
+            module.update_fork_choice_store = update_fork_choice_store
+            module.get_head = get_head
+
+
+def replay(records: Iterator[JournalRecord], node_state: NodeState, fast: bool = False) -> NodeState:
+    """
+    It applies `records` in order to `node_state`. See `deferred_fork_choice` for `fast`.
+    """
+    if not fast:
+        for record in records:
+            node_state = apply_record(record, node_state).state
+        return node_state
+
+    with deferred_fork_choice() as deferred:
+        for record in records:
+            node_state = apply_record(record, node_state).state
+    return deferred.synced(node_state)
+
+
+def check_fast_replay(records: Sequence[JournalRecord], node_state: NodeState) -> NodeState:
+    """
+    It replays `records` on `node_state` with and without `fast`, checks that both replays agree on the state after
+    every tick, once the fork-choice store of the fast one is brought in sync, and returns the state after `records`.
+    """
+    slow = [node_state]
+    for record in records:
+        slow.append(apply_record(record, slow[-1]).state)
+
+    with deferred_fork_choice() as deferred:
+        fast = node_state
+        for index, record in enumerate(records):
+            fast = apply_record(record, fast).state
+            if record.kind == RecordKind.TICK or index == len(records) - 1:
+                assert deferred.synced(fast) == slow[index + 1], \
+                    f"{node_state.identity}: the fast replay diverges from the replay at record {record.sequence}"
+    return slow[-1]
+
+
+def recover(journal: Journal, initial_state: Callable[[], NodeState], fast: bool = False) -> NodeState:
+    """
+    It rebuilds the state after the last committed record of `journal`, from its latest snapshot if any, or else from
+    `initial_state()`.
+    """
+    snapshot = journal.latest_snapshot()
+    if snapshot is None:
+        return replay(journal.records(), initial_state(), fast)
+    return replay(journal.records(after=snapshot[0]), load_snapshot(snapshot[1]), fast)
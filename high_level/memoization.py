@@ -0,0 +1,123 @@
+"""
+Memoization of the functions of the specification whose result is fully determined by a key of their arguments.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+`enable` replaces each function listed in `MEMOIZED`, in `helpers.py` and in `3sf_high_level.py`, by a wrapper
+memoizing it in a `BoundedCache` under the key computed from its arguments, see `pythonic_code_generic.memoize_bounded`;
+`disable` puts the original functions back. The key of each function holds everything its result depends on, e.g. the
+validator set that may sign the message of a vote, so that the caches never need to be cleared for the results to be
+correct, whatever the implementation of `get_validator_set_for_slot`; `clear_memo_caches` only empties them, e.g. to
+time cold calls.
+
+The verifications in batch `verify_vote_signatures_in_batch` and `verify_aggregated_vote_signatures_in_batch` are
+wrapped too: they only verify the votes and aggregated votes whose signature is not cached yet, and record the verdicts
+in the caches of `has_valid_vote_signature` and `has_valid_aggregated_vote_signature`.
+
+The simulator and the journal enable it when imported, as the specification runs much slower without it.
+
+Example:
+
+    with memoized():
+        node_state = execute_view_merge(node_state)
+        print(get_memo_cache(helpers.valid_vote_with_referenced_blocks).stats())
+"""
+import importlib
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Any, Callable, Iterator
+
+from pyrsistent import PMap, PSet, pmap, pset
+
+import helpers
+from data_structures import AggregatedVoteMessage, NodeState, SignedVoteMessage, ValidatorBalances, VoteMessage
+from pythonic_code_generic import get_memo_cache, memo_prime_in_batch, memoize_bounded
+
+spec = importlib.import_module('3sf_high_level')
+
+
+def _vote_validity_key(vote: SignedVoteMessage, node_state: NodeState) -> tuple[Any, ...]:
+    return (vote, node_state.configuration, helpers.get_validator_set_for_vote_message(vote.message, node_state))
+
+
+def _vote_message_validity_key(message: VoteMessage, node_state: NodeState) -> tuple[Any, ...]:
+    return (message, node_state.configuration)
+
+
+MEMOIZED: dict[str, tuple[int, Callable[..., Any]]] = {  # Name -> size of the cache and key of the arguments
+    "has_valid_vote_signature": (1 << 20, lambda vote: vote),
+    "valid_vote_message_with_referenced_blocks": (1 << 20, _vote_message_validity_key),
+    "valid_vote_with_referenced_blocks": (1 << 20, _vote_validity_key),
+    "get_sorted_validators": (64, lambda validatorBalances: validatorBalances),
+    "get_aggregated_vote_participants": (1 << 16, lambda aggregate, validatorBalances: (aggregate, validatorBalances)),
+    "has_valid_aggregated_vote_signature": (1 << 16, lambda aggregate, validatorBalances: (aggregate, validatorBalances)),
+    "get_votes_from_aggregated_vote": (1 << 16, lambda aggregate, validatorBalances: (aggregate, validatorBalances)),
+}
+
+BATCHES = ("verify_vote_signatures_in_batch", "verify_aggregated_vote_signatures_in_batch")
+
+_originals: dict[str, Callable] = {name: getattr(helpers, name) for name in [*MEMOIZED, *BATCHES]}
+_wrappers: dict[str, Callable] = {
+    name: memoize_bounded(maxsize, key)(_originals[name]) for name, (maxsize, key) in MEMOIZED.items()
+}
+
+
+def _verify_vote_signatures_in_batch(votes: PSet[SignedVoteMessage]) -> PSet[SignedVoteMessage]:
+    return memo_prime_in_batch(
+        get_memo_cache(_wrappers["has_valid_vote_signature"]),
+        votes,
+        _originals["verify_vote_signatures_in_batch"]
+    )
+
+
+def _verify_aggregated_vote_signatures_in_batch(aggregates: PMap[AggregatedVoteMessage, ValidatorBalances]) -> PSet[AggregatedVoteMessage]:
+    def batch(keys: PSet[tuple[AggregatedVoteMessage, ValidatorBalances]]) -> PSet[tuple[AggregatedVoteMessage, ValidatorBalances]]:
+        accepted = _originals["verify_aggregated_vote_signatures_in_batch"](pmap(keys))
+        return pset(key for key in keys if key[0] in accepted)
+
+    keys = memo_prime_in_batch(get_memo_cache(_wrappers["has_valid_aggregated_vote_signature"]), pset(aggregates.items()), batch)
+    return pset(aggregate for aggregate, _ in keys)
+
+
+_wrappers["verify_vote_signatures_in_batch"] = _verify_vote_signatures_in_batch
+_wrappers["verify_aggregated_vote_signatures_in_batch"] = _verify_aggregated_vote_signatures_in_batch
+
+_patches: list[tuple[ModuleType, str, Callable]] = []
+
+
+def is_enabled() -> bool:
+    return len(_patches) > 0
+
+
+def enable() -> None:
+    """
+    It memoizes the functions of the specification listed in `MEMOIZED`, unless they already are.
+    """
+    if not is_enabled():
+        for name, wrapper in _wrappers.items():
+            for module in (helpers, spec):
+                if vars(module).get(name) is _originals[name]:
+                    _patches.append((module, name, _originals[name]))
+                    setattr(module, name, wrapper)
+
+
+def disable() -> None:
+    """
+    It restores the original functions. The caches are kept, and used again if memoization is enabled again.
+    """
+    for module, name, original in reversed(_patches):
+        setattr(module, name, original)
+    _patches.clear()
+
+
+@contextmanager
+def memoized() -> Iterator[None]:
+    """
+    It memoizes the functions of the specification while in the context, and restores their previous state on exit.
+    """
+    was_enabled = is_enabled()
+    enable()
+    try:
+        yield
+    finally:
+        if not was_enabled:
+            disable()
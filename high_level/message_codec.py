@@ -0,0 +1,216 @@
+"""
+Compact binary encoding of batches of `SignedVoteMessage`s, `SignedProposeMessage`s and `Block`s.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+A batch starts with tables of the strings, checkpoints, votes, aggregated votes and blocks it refers to, each value
+stored once however many messages refer to it: an aggregated vote typically appears in a block and in several proposer
+views, and the votes of a slot share their head and checkpoints. The participation bits of an aggregated vote are
+stored as a hexadecimal string, as they have one bit per validator.
+Integers are little-endian; slots are 64-bit, table indices 32-bit.
+Each message carries a list of (receiver, arrival time) deliveries, used by `parallel_simulator.py` to route it.
+Block bodies are not encoded, as `BlockBody` carries no data in this specification.
+"""
+import struct
+from typing import Any, Callable, Hashable, Iterable, Union
+
+from pyrsistent import pset, pvector
+
+from data_structures import *
+from stubs import ReferenceSignature
+
+Message = Union[SignedVoteMessage, SignedProposeMessage, Block]
+Delivery = tuple[int, int]
+
+VOTE_MESSAGE = 0
+PROPOSE_MESSAGE = 1
+BLOCK_MESSAGE = 2
+
+_U8 = struct.Struct("<B")
+_U32 = struct.Struct("<I")
+_VOTE = struct.Struct("<qIIIII")  # slot, head, source, target, sender, signature
+_AGGREGATE = struct.Struct("<qIIIII")  # slot, head, source, target, participation bits, signature
+_CHECKPOINT = struct.Struct("<Iqq")  # block hash, checkpoint slot, block slot
+_BLOCK = struct.Struct("<IqI")  # parent hash, slot, number of aggregated votes
+_PROPOSE = struct.Struct("<III")  # block, signature, view length
+_DELIVERY = struct.Struct("<Iq")  # receiver, arrival
+
+
+def reference_signature_to_str(signature: Signature) -> str:
+    return signature.digest
+
+
+def reference_signature_from_str(encoded: str) -> Signature:
+    return ReferenceSignature(digest=encoded)
+
+
+class _Table:
+    def __init__(self) -> None:
+        self.values: list[Any] = []
+        self.indices: dict[Hashable, int] = {}
+
+    def index(self, value: Hashable, add: Callable[[], Any]) -> int:
+        found = self.indices.get(value)
+        if found is None:
+            found = len(self.values)
+            self.indices[value] = found
+            self.values.append(add())
+        return found
+
+
+class MessageCodec:
+    """
+    It encodes and decodes batches of messages, see `encode_batch`. Signatures are converted to and from strings by
+    `signature_to_str` and `signature_from_str`, which default to the signatures of `stubs.py`.
+    """
+
+    def __init__(
+        self,
+        signature_to_str: Callable[[Signature], str] = reference_signature_to_str,
+        signature_from_str: Callable[[str], Signature] = reference_signature_from_str
+    ):
+        self.signature_to_str = signature_to_str
+        self.signature_from_str = signature_from_str
+
+    def encode_batch(self, batch: Iterable[tuple[Message, Iterable[Delivery]]]) -> bytes:
+        """
+        It encodes the messages of `batch`, each with its deliveries.
+        """
+        strings = _Table()
+        checkpoints = _Table()
+        votes = _Table()
+        aggregates = _Table()
+        blocks = _Table()
+
+        def string(value: str) -> int:
+            return strings.index(value, lambda: value.encode())
+
+        def checkpoint(value: Checkpoint) -> int:
+            return checkpoints.index(value, lambda: _CHECKPOINT.pack(string(value.block_hash), value.chkp_slot, value.block_slot))
+
+        def vote(value: SignedVoteMessage) -> int:
+            return votes.index(value, lambda: _VOTE.pack(
+                value.message.slot,
+                string(value.message.head_hash),
+                checkpoint(value.message.ffg_source),
+                checkpoint(value.message.ffg_target),
+                string(value.sender),
+                string(self.signature_to_str(value.signature))
+            ))
+
+        def aggregate(value: AggregatedVoteMessage) -> int:
+            return aggregates.index(value, lambda: _AGGREGATE.pack(
+                value.message.slot,
+                string(value.message.head_hash),
+                checkpoint(value.message.ffg_source),
+                checkpoint(value.message.ffg_target),
+                string(f"{value.participation_bits:x}"),
+                string(self.signature_to_str(value.signature))
+            ))
+
+        def block(value: Block) -> int:
+            return blocks.index(value, lambda: _BLOCK.pack(string(value.parent_hash), value.slot, len(value.votes)) + b"".join(
+                _U32.pack(aggregate(a)) for a in value.votes
+            ))
+
+        messages = []
+        for message, deliveries in batch:
+            if isinstance(message, SignedVoteMessage):
+                encoded = _U8.pack(VOTE_MESSAGE) + _U32.pack(vote(message))
+            elif isinstance(message, Block):
+                encoded = _U8.pack(BLOCK_MESSAGE) + _U32.pack(block(message))
+            else:
+                view = message.message.proposer_view
+                encoded = _U8.pack(PROPOSE_MESSAGE) + _PROPOSE.pack(
+                    block(message.message.block),
+                    string(self.signature_to_str(message.signature)),
+                    len(view)
+                ) + b"".join(_U32.pack(aggregate(a)) for a in view)
+            deliveries = list(deliveries)
+            messages.append(encoded + _U32.pack(len(deliveries)) + b"".join(_DELIVERY.pack(*d) for d in deliveries))
+
+        out = bytearray()
+        out += _U32.pack(len(strings.values))
+        for encoded in strings.values:
+            out += _U32.pack(len(encoded))
+            out += encoded
+        for table in (checkpoints, votes, aggregates, blocks):
+            out += _U32.pack(len(table.values))
+        for table in (checkpoints, votes, aggregates, blocks):
+            for encoded in table.values:
+                out += encoded
+        out += _U32.pack(len(messages))
+        for encoded in messages:
+            out += encoded
+        return bytes(out)
+
+    def decode_batch(self, data: bytes) -> list[tuple[Message, list[Delivery]]]:
+        """
+        It decodes a batch encoded by `encode_batch`. Messages equal in the batch are decoded to the same object.
+        """
+        view = memoryview(data)
+        offset = 0
+
+        def read(fmt: struct.Struct) -> tuple:
+            nonlocal offset
+            values = fmt.unpack_from(view, offset)
+            offset += fmt.size
+            return values
+
+        def read_u32() -> int:
+            return read(_U32)[0]
+
+        strings: list[str] = []
+        for _ in range(read_u32()):
+            length = read_u32()
+            strings.append(str(view[offset:offset + length], "utf-8"))
+            offset += length
+        checkpoint_count, vote_count, aggregate_count, block_count = read_u32(), read_u32(), read_u32(), read_u32()
+
+        checkpoints = []
+        for _ in range(checkpoint_count):
+            block_hash, chkp_slot, block_slot = read(_CHECKPOINT)
+            checkpoints.append(Checkpoint(block_hash=Hash(strings[block_hash]), chkp_slot=chkp_slot, block_slot=block_slot))
+
+        votes = []
+        for _ in range(vote_count):
+            slot, head, source, target, sender, signature = read(_VOTE)
+            votes.append(SignedVoteMessage(
+                message=VoteMessage(slot=slot, head_hash=Hash(strings[head]), ffg_source=checkpoints[source], ffg_target=checkpoints[target]),
+                signature=self.signature_from_str(strings[signature]),
+                sender=NodeIdentity(strings[sender])
+            ))
+
+        aggregates = []
+        for _ in range(aggregate_count):
+            slot, head, source, target, bits, signature = read(_AGGREGATE)
+            aggregates.append(AggregatedVoteMessage(
+                message=VoteMessage(slot=slot, head_hash=Hash(strings[head]), ffg_source=checkpoints[source], ffg_target=checkpoints[target]),
+                participation_bits=int(strings[bits], 16),
+                signature=self.signature_from_str(strings[signature])
+            ))
+
+        blocks = []
+        for _ in range(block_count):
+            parent_hash, slot, count = read(_BLOCK)
+            blocks.append(Block(
+                parent_hash=Hash(strings[parent_hash]),
+                slot=slot,
+                votes=pset(aggregates[read_u32()] for _ in range(count)),
+                body=BlockBody()
+            ))
+
+        messages: list[tuple[Message, list[Delivery]]] = []
+        for _ in range(read_u32()):
+            kind, = read(_U8)
+            if kind == VOTE_MESSAGE:
+                message: Message = votes[read_u32()]
+            elif kind == BLOCK_MESSAGE:
+                message = blocks[read_u32()]
+            else:
+                block, signature, count = read(_PROPOSE)
+                message = SignedProposeMessage(
+                    message=ProposeMessage(block=blocks[block], proposer_view=pvector(aggregates[read_u32()] for _ in range(count))),
+                    signature=self.signature_from_str(strings[signature])
+                )
+            messages.append((message, [read(_DELIVERY) for _ in range(read_u32())]))
+        return messages
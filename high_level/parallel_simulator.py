@@ -0,0 +1,258 @@
+"""
+Process-parallel version of the simulator of `simulator.py`, sharding the nodes across a pool of worker processes.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+Each worker runs the nodes of its shard as a `ShardSimulation`. The workers advance in lock-step by windows of `delta`
+time units, i.e. one phase per window, and at each window boundary every worker sends the messages for the nodes of
+each other shard, encoded by `message_codec.py`, directly to the worker of that shard over a pipe between the two,
+which also keeps the workers in lock-step. The parent process only starts a run and collects the results, so that the
+exchange is not serialised through it.
+To make this possible, a message sent to another node during a window is delivered no earlier than the end of the
+window. As the arrival time is only ever delayed to a phase boundary, a message sent at time `t` with a latency of at
+most `delta` still arrives by `t + delta`. Results do not depend on the number of workers, but may differ from those of
+`Simulation`, which delivers messages as soon as their latency has elapsed.
+
+Scaling with the number of cores has not been measured, as this was only run on a machine with a single core. There,
+8 nodes with 16 validators each take 9.7 seconds for 6 slots with `Simulation`, and 8.8, 10.0, 10.0 and 11.0 seconds
+with 1, 2, 4 and 8 workers, which puts the cost of encoding and exchanging the messages at up to a quarter of that of
+running the nodes. The speedup on a machine with enough cores is therefore bounded by about the number of workers
+divided by 1.25, and further by the shard with the most validators.
+
+Example:
+
+    python parallel_simulator.py --workers 8 --nodes 64 --validators-per-node 16 --slots 100
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Optional, Sequence
+
+from data_structures import *
+from message_codec import Message, MessageCodec
+from simulator import EventKind, NetworkModel, Simulation, SimulationReport, SimulationStats, make_report
+
+
+class ShardSimulation(Simulation):
+    """
+    The part of a simulation running the nodes `i` such that `shard_of[i] == shard`.
+    """
+
+    def __init__(self, shard_of: Sequence[int], shard: int, codec: Optional[MessageCodec] = None, **options: Any):
+        super().__init__(len(shard_of), hosted_nodes=[i for i, s in enumerate(shard_of) if s == shard], **options)
+        self.shard_of = shard_of
+        self.shard = shard
+        self.shards = max(shard_of) + 1
+        self.codec = codec if codec is not None else MessageCodec()
+        self.window_end = 0
+        self.outbox: list[dict[int, tuple[Message, list[tuple[int, int]]]]] = [{} for _ in range(self.shards)]
+
+    def deliver(self, sender: int, receiver: int, at: int, kind: EventKind, message: Any) -> None:
+        if receiver != sender:
+            at = max(at, self.window_end)
+        if receiver in self.nodes:
+            self.schedule(at, kind, receiver, message)
+        else:
+            # Messages are keyed by identity, so that a broadcast message is encoded once per shard.
+            entry = self.outbox[self.shard_of[receiver]].setdefault(id(message), (message, []))
+            entry[1].append((receiver, at))
+
+    def step(self, start: int, inbound: Sequence[bytes]) -> list[bytes]:
+        """
+        It delivers the encoded messages `inbound`, processes the window starting at `start` and returns, for each shard,
+        the encoded messages sent to its nodes, or `b""` if there are none.
+        """
+        for data in inbound:
+            for message, deliveries in self.codec.decode_batch(data):
+                kind = EventKind.PROPOSE if isinstance(message, SignedProposeMessage) else EventKind.VOTE
+                for receiver, at in deliveries:
+                    self.schedule(at, kind, receiver, message)
+
+        started = time.perf_counter()
+        self.window_end = start + self.delta
+        self.schedule_ticks(start, self.window_end)
+        self.advance(self.window_end)
+        self.stats.wall_seconds += time.perf_counter() - started
+
+        outbound = [self.codec.encode_batch(batch.values()) if len(batch) > 0 else b"" for batch in self.outbox]
+        self.outbox = [{} for _ in range(self.shards)]
+        return outbound
+
+
+def _exchange(shard: int, peers: dict[int, Connection], outbound: Sequence[bytes]) -> list[bytes]:
+    """
+    It sends to every other shard the encoded messages for its nodes, as returned by `ShardSimulation.step`, and returns
+    those received for the nodes of `shard`. The two shards of a pair exchange with the lower one sending first, and
+    every shard goes through its peers in increasing order, so that no two shards ever wait on each other, whatever the
+    size of the messages.
+    """
+    inbound: list[bytes] = []
+    for peer in sorted(peers):
+        if shard < peer:
+            peers[peer].send_bytes(outbound[peer])
+            data = peers[peer].recv_bytes()
+        else:
+            data = peers[peer].recv_bytes()
+            peers[peer].send_bytes(outbound[peer])
+        if len(data) > 0:
+            inbound.append(data)
+    return inbound
+
+
+def _serve_shard(connection: Connection, peers: dict[int, Connection], shard_of: Sequence[int], shard: int, options: dict[str, Any]) -> None:
+    simulation = ShardSimulation(shard_of, shard, **options)
+    # Messages still in flight at the end of a run, delivered at the start of the next one.
+    inbound: list[bytes] = []
+    exchanged_bytes = 0
+    while True:
+        command, argument = connection.recv()
+        if command == "run":
+            start, end = argument
+            for window in range(start, end, simulation.delta):
+                outbound = simulation.step(window, inbound)
+                exchanged_bytes += sum(len(data) for data in outbound)
+                inbound = _exchange(shard, peers, outbound)
+            connection.send(None)
+        elif command == "summary":
+            connection.send((simulation.stats, simulation.node_summaries(), exchanged_bytes))
+        else:
+            for peer in peers.values():
+                peer.close()
+            connection.close()
+            return
+
+
+class ParallelSimulation:
+    """
+    A simulation of `nodes` nodes run by `workers` processes, by default one per core. The other arguments are those of
+    `Simulation`; with a start method other than fork, `network` must be picklable.
+    """
+
+    def __init__(
+        self,
+        nodes: int,
+        workers: Optional[int] = None,
+        validators_per_node: int = 1,
+        network: Optional[NetworkModel] = None,
+        delta: int = 10,
+        eta: int = 2,
+        k: int = 2,
+        balance: int = 1,
+        prune_on_finality: bool = True,
+        seed: int = 0,
+        start_method: Optional[str] = None
+    ):
+        self.node_count = nodes
+        self.validators = nodes * validators_per_node
+        self.delta = delta
+        self.now = 0
+        self.workers = max(1, min(workers if workers is not None else os.cpu_count() or 1, nodes))
+        self.exchanged_bytes = 0
+        shard_of = [index % self.workers for index in range(nodes)]
+        options = dict(
+            validators_per_node=validators_per_node, network=network, delta=delta, eta=eta, k=k,
+            balance=balance, prune_on_finality=prune_on_finality, seed=seed
+        )
+        context = multiprocessing.get_context(start_method)
+        # A pipe between every two workers, over which they exchange the messages for each other's nodes.
+        peers: list[dict[int, Connection]] = [{} for _ in range(self.workers)]
+        for shard in range(self.workers):
+            for peer in range(shard + 1, self.workers):
+                peers[shard][peer], peers[peer][shard] = context.Pipe()
+        self.connections: list[Connection] = []
+        self.processes = []
+        for shard in range(self.workers):
+            parent, child = context.Pipe()
+            process = context.Process(target=_serve_shard, args=(child, peers[shard], shard_of, shard, options), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+        for shard_peers in peers:
+            for connection in shard_peers.values():
+                connection.close()
+
+    def run(self, slots: int) -> SimulationReport:
+        """
+        It runs the simulation from its current time until the end of slot `slots - 1`.
+        """
+        started = time.perf_counter()
+        end = max(self.now, slots * 4 * self.delta)
+        for connection in self.connections:
+            connection.send(("run", (self.now, end)))
+        for connection in self.connections:
+            connection.recv()
+        self.now = end
+        wall_seconds = time.perf_counter() - started
+
+        stats = SimulationStats()
+        summaries: dict[int, tuple[int, int, int]] = {}
+        self.exchanged_bytes = 0
+        for connection in self.connections:
+            connection.send(("summary", None))
+        for connection in self.connections:
+            shard_stats, shard_summaries, exchanged_bytes = connection.recv()
+            stats.add(shard_stats)
+            summaries.update(shard_summaries)
+            self.exchanged_bytes += exchanged_bytes
+        stats.wall_seconds = wall_seconds
+        return make_report(slots, self.node_count, self.validators, stats, summaries)
+
+    def close(self) -> None:
+        for connection in self.connections:
+            connection.send(("close", None))
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self) -> "ParallelSimulation":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of cores")
+    parser.add_argument("--nodes", type=int, default=8)
+    parser.add_argument("--validators-per-node", type=int, default=1)
+    parser.add_argument("--slots", type=int, default=20)
+    parser.add_argument("--delta", type=int, default=10)
+    parser.add_argument("--eta", type=int, default=2)
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--min-latency", type=int, default=0)
+    parser.add_argument("--max-latency", type=int, default=None, help="defaults to half of delta")
+    parser.add_argument("--drop-probability", type=float, default=0.0)
+    parser.add_argument("--no-pruning", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    network = NetworkModel(
+        min_latency=args.min_latency,
+        max_latency=args.delta // 2 if args.max_latency is None else args.max_latency,
+        drop_probability=args.drop_probability,
+    )
+    with ParallelSimulation(
+        nodes=args.nodes,
+        workers=args.workers,
+        validators_per_node=args.validators_per_node,
+        network=network,
+        delta=args.delta,
+        eta=args.eta,
+        k=args.k,
+        prune_on_finality=not args.no_pruning,
+        seed=args.seed,
+    ) as simulation:
+        report = simulation.run(args.slots).to_json()
+        report["workers"] = simulation.workers
+        report["exchanged_bytes"] = simulation.exchanged_bytes
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
-from typing import TypeVar
+from typing import Any, TypeVar, Iterator
+from itertools import islice, takewhile
+from collections import deque, OrderedDict
+from heapq import heappush, heappop
 
 from pyrsistent import PSet, PMap, PVector, pset, pmap, pvector
 from formal_verification_annotations import *
-from functools import reduce
+from validator_registry import ValidatorRegistry
+from collection_backends import BACKENDS, selected_backend
+from functools import wraps
 
 T1 = TypeVar('T1')
 T2 = TypeVar('T2')
@@ -12,6 +17,10 @@ def pvector_of_one_element(e: T1) -> PVector[T1]:
     return pvector([e])
 
 
+def pvector_get_empty() -> PVector[T1]:
+    return pvector()
+
+
 def pvector_concat(a: PVector[T1], b: PVector[T1]) -> PVector[T1]:
     return a.extend(b)
 
@@ -29,10 +38,7 @@ def pset_merge(a: PSet[T1], b: PSet[T1]) -> PSet[T1]:
 
 
 def pset_merge_flatten(s: PSet[PSet[T1]]) -> PSet[T1]:
-    return reduce(
-        lambda a, b: a.union(b),
-        pset()
-    )
+    return pset(e for a in s for e in a)
 
 
 def pset_intersection(s1: PSet[T1], s2: PSet[T1]) -> PSet[T1]:
@@ -51,6 +57,18 @@ def pset_add(s: PSet[T1], e: T1) -> PSet[T1]:
     return s.add(e)
 
 
+def pset_has(s: PSet[T1], e: T1) -> bool:
+    return e in s
+
+
+def pset_remove(s: PSet[T1], e: T1) -> PSet[T1]:
+    return s.discard(e)
+
+
+def pset_sort(s: PSet[T1], a: Callable[[T1], int]) -> PVector[T1]:
+    return pvector(sorted(s, key=a))
+
+
 def pset_pick_element(s: PSet[T1]) -> T1:
     Requires(len(s) > 0)
     return list(s)[0]
@@ -72,14 +90,132 @@ def pset_max(s: PSet[T1], a: Callable[[T1], int]) -> T1:
     return max(s, key=a)
 
 
+def pset_traverse(roots: PSet[T1], successors: Callable[[T1, T2], PSet[T1]], visit: Callable[[T1, T2], T2], acc: T2) -> T2:
+    """
+    Visits iteratively, in breadth-first order, all the elements reachable from `roots`, threading `acc` through
+    each call to `visit`. The successors of an element are computed right after visiting it.
+    """
+    visited: set[T1] = set()
+    queue: deque[T1] = deque(roots)
+
+    while queue:
+        e = queue.popleft()
+        if e not in visited:
+            visited.add(e)
+            acc = visit(e, acc)
+            queue.extend(successors(e, acc))
+
+    return acc
+
+
+def iterate_while(p: Callable[[T1], bool], f: Callable[[T1], T1], e: T1) -> T1:
+    """
+    Iteratively applies `f` to `e` for as long as `p` holds and returns the first value for which `p` does not hold.
+    """
+    while p(e):
+        e = f(e)
+
+    return e
+
+
+def pvector_iterate_while(p: Callable[[T1], bool], f: Callable[[T1], T1], e: T1) -> PVector[T1]:
+    """
+    Like `iterate_while`, but it returns all the values taken by `e`, i.e. `e`, `f(e)`, `f(f(e))`, ..., up to and
+    including the first value for which `p` does not hold.
+    """
+    values = [e]
+    while p(e):
+        e = f(e)
+        values.append(e)
+
+    return pvector(values)
+
+
+def iterator_iterate_while(p: Callable[[T1], bool], f: Callable[[T1], T1], e: T1) -> Iterator[T1]:
+    """
+    Lazy counterpart of `pvector_iterate_while`: the values are only computed as they are consumed.
+    """
+    yield e
+    while p(e):
+        e = f(e)
+        yield e
+
+
+def iterator_take(n: int, it: Iterator[T1]) -> PVector[T1]:
+    return pvector(islice(it, max(n, 0)))
+
+
+def iterator_take_while(p: Callable[[T1], bool], it: Iterator[T1]) -> PVector[T1]:
+    return pvector(takewhile(p, it))
+
+
+def pvector_find_first(p: Callable[[T1], bool], v: PVector[T1]) -> PVector[T1]:
+    """
+    Returns the first element of `v` for which `p` holds, as a vector of one element, or an empty vector if there is none.
+    `p` is not called on the elements after it.
+    """
+    return pvector(islice((e for e in v if p(e)), 1))
+
+
+def int_find_last(p: Callable[[int], bool], low: int, high: int) -> int:
+    """
+    Returns the greatest `i` in [`low`, `high`] for which `p(i)` holds, assuming that `p` holds for `low` and that
+    there is no `i` for which `p(i)` does not hold while `p(i + 1)` does.
+    """
+    Requires(low <= high)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if p(middle):
+            low = middle
+        else:
+            high = middle - 1
+
+    return low
+
+
 def pset_sum(s: PSet[int]) -> int:
     return sum(s)
 
 
+def pmap_propagate_to_ancestors(values: PMap[T1, int], rank: Callable[[T1], int], parent: Callable[[T1], T1], is_root: Callable[[T1], bool]) -> PMap[T1, int]:
+    """
+    Given the `values` associated to some nodes of a tree, where `rank` strictly decreases when moving to the `parent`,
+    it returns, for each key of `values` and each of their ancestors up to the first one for which `is_root` holds,
+    the sum of the values associated to it and to its descendants.
+    Each node is visited once, in decreasing `rank` order.
+    """
+    sums: dict[T1, int] = dict(values.items())
+    heap: list[tuple[int, int, T1]] = []
+
+    for n, e in enumerate(sums):
+        heappush(heap, (-rank(e), n, e))
+
+    n = len(sums)
+    while heap:
+        _, _, e = heappop(heap)
+        if not is_root(e):
+            p = parent(e)
+            if p not in sums:
+                sums[p] = 0
+                heappush(heap, (-rank(p), n, p))
+                n += 1
+            sums[p] += sums[e]
+
+    return pmap(sums)
+
+
 def pset_is_empty(s: PSet[T1]) -> bool:
     return len(s) == 0
 
 
+def pset_size(s: PSet[T1]) -> int:
+    return len(s)
+
+
+def pvector_size(v: PVector[T1]) -> int:
+    return len(v)
+
+
 def from_pvector_to_pset(v: PVector[T1]) -> PSet[T1]:
     return pset(v)
 
@@ -93,6 +229,45 @@ def pset_map(p: Callable[[T1], T2], s: PSet[T1]) -> PSet[T2]:
     return r
 
 
+def pset_group_by(f: Callable[[T1], T2], s: PSet[T1]) -> PMap[T2, PSet[T1]]:
+    """
+    Partitions `s` according to the value of `f` on each element.
+    """
+    groups: dict[T2, list[T1]] = {}
+    for e in s:
+        groups.setdefault(f(e), []).append(e)
+
+    return pmap({k: pset(v) for k, v in groups.items()})
+
+
+def is_instance_of(e: Any, t: type) -> bool:
+    """
+    Checks whether `e` is an instance of `t` or of one of its subclasses.
+    """
+    return isinstance(e, t)
+
+
+def pset_to_pmap(f: Callable[[T1], T2], s: PSet[T1]) -> PMap[T1, T2]:
+    """
+    Maps each element `e` of `s` to `f(e)`.
+    """
+    return pmap({e: f(e) for e in s})
+
+
+def bitfield_from_members(v: PVector[T1], s: PSet[T1]) -> int:
+    """
+    Returns the bitfield whose `i`-th bit is set iff `v[i]` is in `s`.
+    """
+    return sum(1 << i for i, e in enumerate(v) if e in s)
+
+
+def bitfield_members(v: PVector[T1], bits: int) -> PSet[T1]:
+    """
+    Returns the elements `v[i]` whose `i`-th bit is set in `bits`. Bits beyond the length of `v` are ignored.
+    """
+    return pset(e for i, e in enumerate(v) if (bits >> i) & 1)
+
+
 def pmap_has(pm: PMap[T1, T2], k: T1) -> bool:
     return k in pm
 
@@ -110,13 +285,146 @@ def pmap_set(pm: PMap[T1, T2], k: T1, v: T2) -> PMap[T1, T2]:
     return pm.set(k, v)
 
 
+def pmap_remove(pm: PMap[T1, T2], k: T1) -> PMap[T1, T2]:
+    Requires(pmap_has(pm, k))
+    return pm.remove(k)
+
+
 def pmap_merge(a: PMap[T1, T2], b: PMap[T1, T2]) -> PMap[T1, T2]:
     return a.update(b)
 
 
+def pmap_size(pm: PMap[T1, T2]) -> int:
+    return len(pm)
+
+
 def pmap_keys(d: PMap[T1, T2]) -> PSet[T1]:
     return pset(d.keys())
 
 
 def pmap_values(d: PMap[T1, T2]) -> PSet[T2]:
     return pset(d.values())
+
+
+class BoundedCache:
+    """
+    A least-recently-used cache holding at most `maxsize` entries, which counts the lookups that hit and miss.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, key):
+        """
+        Returns `(True, value)` if `key` is cached and `(False, None)` otherwise.
+        """
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return True, self.entries[key]
+        else:
+            self.misses += 1
+            return False, None
+
+    def store(self, key, value) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.maxsize}
+
+
+_memo_caches: list[BoundedCache] = []
+
+
+def memoize_bounded(maxsize: int, key: Callable) -> Callable[[C], C]:
+    """
+    Memoizes the decorated function in a `BoundedCache` of size `maxsize`, using `key(*args)` as the cache key.
+    The cache is available via `get_memo_cache`, and is cleared by `clear_memo_caches`.
+    This is only meant to be applied to functions whose result is fully determined by `key(*args)`.
+    The functions of the specification are not decorated, but memoized by `memoization.py`.
+    """
+    def decorator(f):
+        cache = BoundedCache(maxsize)
+        _memo_caches.append(cache)
+
+        @wraps(f)
+        def wrapper(*args):
+            k = key(*args)
+            found, value = cache.lookup(k)
+            if not found:
+                value = f(*args)
+                cache.store(k, value)
+            return value
+
+        wrapper.memo_cache = cache  # type: ignore[attr-defined]
+        return wrapper
+
+    return decorator
+
+
+def get_memo_cache(f: Callable) -> BoundedCache:
+    return f.memo_cache  # type: ignore[attr-defined]
+
+
+def clear_memo_caches() -> None:
+    """
+    It clears the caches of all the functions memoized via `memoize_bounded`, e.g. to time cold calls.
+    """
+    for cache in _memo_caches:
+        cache.clear()
+
+
+def memo_prime_in_batch(cache: BoundedCache, keys: PSet[T1], batch: Callable[[PSet[T1]], PSet[T1]]) -> PSet[T1]:
+    """
+    It records in `cache`, the cache of a predicate memoized via `memoize_bounded`, the result of the predicate for all
+    the `keys` that are not cached yet, by calling `batch` once on them, and returns the `keys` for which it holds.
+    `batch` must return the subset of its argument for which the predicate holds.
+    """
+    verdicts = {k: cache.entries[k] for k in keys if k in cache.entries}
+    missing = pset([k for k in keys if k not in verdicts])
+    if len(missing) > 0:
+        accepted = batch(missing)
+        for k in missing:
+            verdicts[k] = k in accepted
+            cache.store(k, verdicts[k])
+    return pset([k for k, verdict in verdicts.items() if verdict])
+
+
+@memoize_bounded(maxsize=64, key=lambda pm: pm)
+def get_registry_of_pmap(pm: PMap[T1, int]) -> ValidatorRegistry:
+    return ValidatorRegistry(pm)
+
+
+def pmap_sum_values(pm: PMap[T1, int]) -> int:
+    """
+    Sums all the values of `pm`. The sum is computed once per map, see `get_registry_of_pmap`.
+    """
+    return get_registry_of_pmap(pm).total_weight
+
+
+def pmap_sum_values_of_keys(pm: PMap[T1, int], keys: PSet[T1]) -> int:
+    """
+    Sums the values of `pm` associated to the elements of `keys` that are keys of `pm`.
+    The keys are mapped to dense indices once per map, so that the sum is a single vectorized masked sum.
+    """
+    return get_registry_of_pmap(pm).weight_of(keys)
+
+
+# The helpers above define the semantics of the collections of the specification. The backend selected at startup may
+# replace some of them by faster implementations returning equal collections, see `collection_backends.py`.
+COLLECTIONS_BACKEND = selected_backend()
+globals().update(BACKENDS[COLLECTIONS_BACKEND])
@@ -0,0 +1,363 @@
+"""
+Asyncio runtime running a node of the specification in real time, connected to other nodes by a pluggable transport.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+A `NodeRunner` owns the state of one node. It calls `on_tick` at each phase boundary, i.e. at each time at which
+`get_slot_from_time` or `get_phase_from_time` changes, passing the exact time of the boundary. Times of the
+specification are mapped to the clock of the event loop by `time_unit`, the number of seconds per unit of time, from
+`genesis_time`, the time of the clock at which the time of the specification is 0.
+Received votes, blocks and proposals are delivered to a bounded queue, from which a receiving task moves them to a
+bounded buffer of the runner as they arrive, so that a transport delivering faster than a node consumes is slowed down
+rather than buffering without bound. The buffered messages are handed in batches to `on_votes_received`,
+`on_blocks_received` and `on_received_proposes`. The messages output by `on_tick` are broadcast by a separate task, so
+that a node waiting for room in the queue of another node keeps consuming its own.
+
+The functions of the specification run in an executor rather than on the event loop. By default, all the runners of a
+process share an executor with a single thread, as the caches of the specification are shared and not thread safe, so
+a node may wait for the work of the other nodes before running its own. The receiving task runs on the event loop and
+does not go through the executor, so that messages keep being received, rather than waiting in the queues of the
+transport, while the executor computes, for example, the fork choice of this node or of another one.
+
+`LoopbackTransport` connects the runners of a process, e.g. for tests:
+
+    python runtime.py --nodes 4 --slots 8 --time-unit 0.005
+"""
+import argparse
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Optional, Sequence
+
+from pyrsistent import pmap, pvector
+
+import helpers
+import importlib
+import pythonic_code_generic
+import stubs
+from data_structures import *
+from message_codec import Message
+from simulator import make_genesis, make_validator_identities
+
+spec = importlib.import_module('3sf_high_level')
+
+
+class Transport(ABC):
+    """
+    The network between the nodes run by `NodeRunner`s. It delivers each message broadcast by a node to the inbound
+    queue of every registered node, the sender included, waiting for room in the queues that are full.
+    """
+
+    @abstractmethod
+    def register(self, identity: NodeIdentity, inbound: "asyncio.Queue[Message]") -> None:
+        ...
+
+    @abstractmethod
+    def unregister(self, identity: NodeIdentity) -> None:
+        ...
+
+    @abstractmethod
+    async def broadcast(self, sender: NodeIdentity, message: Message) -> None:
+        ...
+
+
+class LoopbackTransport(Transport):
+    """
+    A transport between the nodes run on the same event loop, delivering the messages themselves.
+    """
+
+    def __init__(self) -> None:
+        self.inbounds: dict[NodeIdentity, asyncio.Queue[Message]] = {}
+        self.deliveries = 0
+
+    def register(self, identity: NodeIdentity, inbound: "asyncio.Queue[Message]") -> None:
+        self.inbounds[identity] = inbound
+
+    def unregister(self, identity: NodeIdentity) -> None:
+        self.inbounds.pop(identity, None)
+
+    async def broadcast(self, sender: NodeIdentity, message: Message) -> None:
+        for inbound in list(self.inbounds.values()):
+            await inbound.put(message)
+            self.deliveries += 1
+
+
+def next_phase_boundary(time: int, node_state: NodeState) -> int:
+    """
+    The first time after `time` at which the slot or the phase changes. As a phase lasts `delta`, it is at most `delta`
+    after `time`.
+    """
+    slot = helpers.get_slot_from_time(time, node_state)
+    phase = helpers.get_phase_from_time(time, node_state)
+    return pythonic_code_generic.int_find_last(
+        lambda t: helpers.get_slot_from_time(t, node_state) == slot and helpers.get_phase_from_time(t, node_state) == phase,
+        time,
+        time + node_state.configuration.delta
+    ) + 1
+
+
+_shared_executor: Optional[Executor] = None
+
+
+def shared_executor() -> Executor:
+    global _shared_executor
+    if _shared_executor is None:
+        _shared_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="specification")
+    return _shared_executor
+
+
+@dataclass
+class RunnerStats:
+    ticks: int = 0
+    received: int = 0
+    batches: int = 0
+    new_blocks: int = 0
+    duplicate_blocks: int = 0
+    new_votes: int = 0
+    duplicate_votes: int = 0
+    proposes_sent: int = 0
+    votes_sent: int = 0
+    max_tick_lateness: float = 0.0  # Seconds between a phase boundary and the call of `on_tick` for it
+    max_inbound: int = 0  # Greatest number of messages waiting in the buffer and the inbound queue before a batch
+    received_during_tick: int = 0  # Messages buffered while `on_tick` was running
+
+
+_INGEST: dict[type, Callable[[Any, NodeState], NewNodeStateAndIngestionCounts]] = {
+    SignedVoteMessage: spec.on_votes_received,
+    Block: spec.on_blocks_received,
+    SignedProposeMessage: spec.on_received_proposes,
+}
+
+
+class NodeRunner:
+    """
+    The runner of the node whose initial state is `node_state`, connected to `transport`. `genesis_time` defaults to
+    the time at which `run` is first called. At most `queue_size` messages wait in the inbound queue, and as many in
+    the buffer of the runner.
+    """
+
+    def __init__(
+        self,
+        node_state: NodeState,
+        transport: Transport,
+        time_unit: float = 0.01,
+        genesis_time: Optional[float] = None,
+        queue_size: int = 1024,
+        batch_size: int = 256,
+        executor: Optional[Executor] = None
+    ):
+        self.node_state = node_state
+        self.transport = transport
+        self.time_unit = time_unit
+        self.genesis_time = genesis_time
+        self.batch_size = batch_size
+        self.buffer_size = queue_size
+        self.executor = executor if executor is not None else shared_executor()
+        self.inbound: asyncio.Queue[Message] = asyncio.Queue(maxsize=queue_size)
+        self.outbound: asyncio.Queue[Message] = asyncio.Queue()
+        self.buffer: deque[Message] = deque()
+        self.buffered = asyncio.Event()  # Set when a message is appended to `buffer`
+        self.buffer_room = asyncio.Event()  # Set while `buffer` holds fewer than `buffer_size` messages
+        self.buffer_room.set()
+        self.ticking = False
+        self.stats = RunnerStats()
+        transport.register(node_state.identity, self.inbound)
+
+    @property
+    def identity(self) -> NodeIdentity:
+        return self.node_state.identity
+
+    def clock_of(self, time: int) -> float:
+        assert self.genesis_time is not None
+        return self.genesis_time + time * self.time_unit
+
+    def time_of(self, clock: float) -> int:
+        assert self.genesis_time is not None
+        return int((clock - self.genesis_time) // self.time_unit)
+
+    async def call(self, function: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def tick(self, time: int) -> None:
+        self.stats.ticks += 1
+        self.stats.max_tick_lateness = max(self.stats.max_tick_lateness, asyncio.get_running_loop().time() - self.clock_of(time))
+        self.ticking = True
+        try:
+            output: NewNodeStateAndMessagesToTx = await self.call(spec.on_tick, self.node_state, time)
+        finally:
+            self.ticking = False
+        self.node_state = output.state
+        for propose in output.proposeMessagesToTx:
+            self.stats.proposes_sent += 1
+            self.outbound.put_nowait(propose)
+        for vote in output.voteMessagesToTx:
+            self.stats.votes_sent += 1
+            self.outbound.put_nowait(vote)
+
+    async def ingest(self, messages: list[Message]) -> None:
+        """
+        It hands `messages` to the batch handlers, one batch per run of consecutive messages of the same type.
+        """
+        self.stats.received += len(messages)
+        start = 0
+        while start < len(messages):
+            end = start + 1
+            while end < len(messages) and type(messages[end]) is type(messages[start]):
+                end += 1
+            result: NewNodeStateAndIngestionCounts = await self.call(
+                _INGEST[type(messages[start])], pvector(messages[start:end]), self.node_state
+            )
+            self.node_state = result.state
+            self.stats.batches += 1
+            self.stats.new_blocks += result.counts.new_blocks
+            self.stats.duplicate_blocks += result.counts.duplicate_blocks
+            self.stats.new_votes += result.counts.new_votes
+            self.stats.duplicate_votes += result.counts.duplicate_votes
+            start = end
+
+    async def receive(self) -> None:
+        """
+        It moves the messages of the inbound queue to the buffer as they arrive, waiting while the buffer is full.
+        """
+        while True:
+            await self.buffer_room.wait()
+            message = await self.inbound.get()
+            self.buffer.append(message)
+            if self.ticking:
+                self.stats.received_during_tick += 1
+            if len(self.buffer) >= self.buffer_size:
+                self.buffer_room.clear()
+            self.buffered.set()
+
+    def take_batch(self) -> list[Message]:
+        """
+        It removes up to `batch_size` messages from the buffer.
+        """
+        self.stats.max_inbound = max(self.stats.max_inbound, len(self.buffer) + self.inbound.qsize())
+        messages = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+        self.buffer_room.set()
+        return messages
+
+    async def send(self) -> None:
+        while True:
+            message = await self.outbound.get()
+            await self.transport.broadcast(self.identity, message)
+
+    async def run(self, until: int) -> NodeState:
+        """
+        It runs the node from the current time up to time `until`, and returns its state.
+        """
+        loop = asyncio.get_running_loop()
+        if self.genesis_time is None:
+            self.genesis_time = loop.time()
+        receiver = asyncio.create_task(self.receive())
+        sender = asyncio.create_task(self.send())
+        next_tick = max(self.time_of(loop.time()), 0)
+        try:
+            while next_tick < until:
+                if loop.time() >= self.clock_of(next_tick):
+                    await self.tick(next_tick)
+                    next_tick = next_phase_boundary(next_tick, self.node_state)
+                    continue
+                if not self.buffer:
+                    self.buffered.clear()
+                    try:
+                        await asyncio.wait_for(self.buffered.wait(), timeout=self.clock_of(next_tick) - loop.time())
+                    except asyncio.TimeoutError:
+                        continue
+                await self.ingest(self.take_batch())
+        finally:
+            receiver.cancel()
+            sender.cancel()
+        return self.node_state
+
+    def close(self) -> None:
+        self.transport.unregister(self.identity)
+
+
+def node_summary(node_state: NodeState) -> tuple[int, int, int]:
+    """
+    The greatest finalized and justified checkpoint slots and the length of the available chain of `node_state`.
+    """
+    return (
+        spec.get_greatest_finalized_checkpoint(node_state).chkp_slot,
+        spec.get_greatest_justified_checkpoint(node_state).chkp_slot,
+        spec.get_block_depth(spec.block_hash(node_state.chava), node_state) + 1
+    )
+
+
+def runner_report(runner: NodeRunner) -> dict[str, Any]:
+    finalized_slot, justified_slot, available_chain_length = node_summary(runner.node_state)
+    return {
+        "identity": runner.identity,
+        "finalized_slot": finalized_slot,
+        "justified_slot": justified_slot,
+        "available_chain_length": available_chain_length,
+        "stats": asdict(runner.stats),
+    }
+
+
+async def run_local_network(
+    nodes: int,
+    slots: int,
+    delta: int = 10,
+    eta: int = 2,
+    k: int = 2,
+    time_unit: float = 0.01,
+    queue_size: int = 1024,
+    batch_size: int = 256
+) -> list[NodeRunner]:
+    """
+    It runs `nodes` nodes, each hosting one validator, connected by a `LoopbackTransport` for `slots` slots, and
+    returns their runners. It calls `stubs.configure`.
+    """
+    identities = make_validator_identities(nodes)
+    stubs.configure(pmap({identity: 1 for identity in identities}))
+    configuration = Configuration(delta=delta, genesis=make_genesis(), eta=eta, k=k, prune_on_finality=True)
+    transport = LoopbackTransport()
+    genesis_time = asyncio.get_running_loop().time()
+    runners = [
+        NodeRunner(spec.init(identity, configuration), transport, time_unit, genesis_time, queue_size, batch_size)
+        for identity in identities
+    ]
+    try:
+        await asyncio.gather(*(runner.run(slots * 4 * delta) for runner in runners))
+    finally:
+        for runner in runners:
+            runner.close()
+    return runners
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--nodes", type=int, default=4)
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--delta", type=int, default=10)
+    parser.add_argument("--eta", type=int, default=2)
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--time-unit", type=float, default=0.01, help="seconds per unit of time of the specification")
+    parser.add_argument("--queue-size", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--signature-workers", type=int, default=None, metavar="N", help="verify batches of vote and aggregated vote signatures on N worker processes, see signature_verification.py")
+    parser.add_argument("--signature-min-batch", type=int, default=512, help="smallest batch verified by the workers")
+    args = parser.parse_args(argv)
+
+    with ExitStack() as stack:
+        verifier = None
+        if args.signature_workers is not None:
+            import signature_verification
+            verifier = stack.enter_context(signature_verification.installed(args.signature_workers, args.signature_min_batch))
+        runners = asyncio.run(run_local_network(
+            args.nodes, args.slots, args.delta, args.eta, args.k, args.time_unit, args.queue_size, args.batch_size
+        ))
+    report: dict[str, Any] = {"nodes": [runner_report(runner) for runner in runners]}
+    if verifier is not None:
+        report["signature_verification"] = verifier.stats()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Batch verification of vote and aggregated vote signatures on a pool of worker processes.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+A `BatchSignatureVerifier` wraps any per-vote verification function, such as the local stand-in signature scheme
+bound to `stubs.verify_vote_signature`, and any per-aggregate one, such as `stubs.verify_aggregated_vote_signature`.
+`installed` makes the batch stubs `stubs.verify_vote_signatures` and `stubs.verify_aggregated_vote_signatures`,
+through which the specification verifies the signatures of the votes it receives and of the aggregated votes included
+in blocks and proposer views, delegate to one, e.g.
+
+    python simulator.py --nodes 10 --validators-per-node 100 --signature-workers 4
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from pyrsistent import PMap, PSet, pset
+
+import stubs
+from data_structures import AggregatedVoteMessage, NodeIdentity, SignedVoteMessage
+
+
+def _verify_chunk(verify: Callable[..., bool], items: Sequence[tuple[Any, ...]]) -> list[bool]:
+    return [verify(*item) for item in items]
+
+
+class BatchSignatureVerifier:
+    """
+    It verifies a set of votes with `verify`, or a map of aggregated votes to their participants with `verify_aggregate`,
+    splitting them into chunks of at most `chunk_size` which are verified on `processes` worker processes.
+    Batches with fewer than `min_parallel_batch` elements, or any batch if `processes` is `0`, are verified in the
+    calling process, as shipping them to the workers would cost more than verifying them.
+    `verify` and `verify_aggregate` must be picklable, i.e. module-level functions, for the workers to be able to run them.
+    """
+
+    def __init__(
+        self,
+        verify: Callable[[SignedVoteMessage], bool],
+        verify_aggregate: Callable[[AggregatedVoteMessage, PSet[NodeIdentity]], bool],
+        processes: Optional[int] = None,
+        chunk_size: int = 256,
+        min_parallel_batch: int = 512
+    ):
+        self.verify = verify
+        self.verify_aggregate = verify_aggregate
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.min_parallel_batch = min_parallel_batch
+        self._executor: Optional[Executor] = None
+        self.batches = 0
+        self.parallel_batches = 0
+        self.votes = 0
+        self.votes_verified_in_workers = 0
+        self.aggregates = 0
+        self.aggregates_verified_in_workers = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        return self._executor
+
+    def _verdicts(self, verify: Callable[..., bool], items: list[tuple[Any, ...]]) -> tuple[list[bool], bool]:
+        """
+        The verdict of `verify` on each of `items`, and whether they were verified by the workers.
+        """
+        self.batches += 1
+        if self.processes == 0 or len(items) < self.min_parallel_batch:
+            return _verify_chunk(verify, items), False
+        self.parallel_batches += 1
+        chunks = [items[i:i + self.chunk_size] for i in range(0, len(items), self.chunk_size)]
+        futures = [self._get_executor().submit(_verify_chunk, verify, chunk) for chunk in chunks]
+        return [verdict for future in futures for verdict in future.result()], True
+
+    def __call__(self, votes: PSet[SignedVoteMessage]) -> PSet[SignedVoteMessage]:
+        ordered = list(votes)
+        verdicts, in_workers = self._verdicts(self.verify, [(vote,) for vote in ordered])
+        self.votes += len(ordered)
+        if in_workers:
+            self.votes_verified_in_workers += len(ordered)
+        return pset(vote for vote, verdict in zip(ordered, verdicts) if verdict)
+
+    def verify_aggregates(self, aggregates: PMap[AggregatedVoteMessage, PSet[NodeIdentity]]) -> PSet[AggregatedVoteMessage]:
+        ordered = list(aggregates.items())
+        verdicts, in_workers = self._verdicts(self.verify_aggregate, ordered)
+        self.aggregates += len(ordered)
+        if in_workers:
+            self.aggregates_verified_in_workers += len(ordered)
+        return pset(aggregate for (aggregate, _), verdict in zip(ordered, verdicts) if verdict)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "processes": self.processes,
+            "batches": self.batches,
+            "parallel_batches": self.parallel_batches,
+            "votes": self.votes,
+            "votes_verified_in_workers": self.votes_verified_in_workers,
+            "aggregates": self.aggregates,
+            "aggregates_verified_in_workers": self.aggregates_verified_in_workers,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self) -> "BatchSignatureVerifier":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+
+
+@contextmanager
+def installed(processes: Optional[int] = None, min_parallel_batch: int = 512) -> Iterator[BatchSignatureVerifier]:
+    """
+    It verifies the batches of vote and aggregated vote signatures of the specification with a `BatchSignatureVerifier`
+    of `stubs.verify_vote_signature` and `stubs.verify_aggregated_vote_signature` on `processes` worker processes while
+    in the context, and shuts its workers down on exit.
+    """
+    verifier = BatchSignatureVerifier(
+        stubs.verify_vote_signature,
+        stubs.verify_aggregated_vote_signature,
+        processes,
+        min_parallel_batch=min_parallel_batch
+    )
+    stubs.set_vote_signatures_verifier(verifier)
+    stubs.set_aggregated_vote_signatures_verifier(verifier.verify_aggregates)
+    try:
+        yield verifier
+    finally:
+        stubs.set_vote_signatures_verifier(None)
+        stubs.set_aggregated_vote_signatures_verifier(None)
+        verifier.shutdown()
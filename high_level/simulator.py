@@ -0,0 +1,446 @@
+"""
+Discrete-event simulator running many nodes of the specification together over a simulated network.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+Every node is a `NodeState` driven only through the event handlers of `3sf_high_level.py`: each node is ticked at
+every phase boundary, i.e. every `delta` time units, and the messages in the `NewNodeStateAndMessagesToTx` returned
+by any handler are broadcast to all the nodes, the sender included, through a `NetworkModel`.
+Each node may host several validators, like a beacon node serving several validator clients: the node runs the
+specification under the identity of one of them, and its votes are re-signed by all the others.
+The functions declared in `stubs.pyi` are provided by the reference implementation in `stubs.py`.
+
+Example:
+
+    python simulator.py --nodes 16 --validators-per-node 64 --slots 100
+"""
+import argparse
+import heapq
+import importlib
+import json
+import random
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass, fields
+from enum import IntEnum
+from typing import Any, Callable, Iterable, Optional, Sequence
+
+from pyrsistent import pmap, pset
+
+import helpers
+import memoization
+import stubs
+from data_structures import *
+
+spec = importlib.import_module('3sf_high_level')
+memoization.enable()
+
+
+@dataclass(frozen=True)
+class Partition:
+    """
+    Between `start` and `end`, messages are only delivered between nodes of the same group; the others are held back
+    and delivered at `end`. Nodes in no group form a group on their own.
+    """
+    start: int
+    end: int
+    groups: tuple[frozenset[int], ...]
+
+    def separates(self, sender: int, receiver: int) -> bool:
+        return not any(sender in group and receiver in group for group in self.groups)
+
+
+@dataclass
+class NetworkModel:
+    """
+    The delay of a message is drawn uniformly from [`min_latency`, `max_latency`], unless `latency` is given, in which
+    case it is `latency(rng)`. Messages a node sends to itself are delivered immediately.
+    A message is dropped with probability `drop_probability`, independently for each receiver.
+    """
+    min_latency: int = 0
+    max_latency: int = 0
+    drop_probability: float = 0.0
+    partitions: Sequence[Partition] = ()
+    latency: Optional[Callable[[random.Random], int]] = None
+
+    def delivery_time(self, now: int, sender: int, receiver: int, rng: random.Random) -> Optional[int]:
+        """
+        The time at which a message sent by `sender` at `now` reaches `receiver`, or `None` if it is dropped.
+        """
+        if sender == receiver:
+            return now
+        if self.drop_probability > 0 and rng.random() < self.drop_probability:
+            return None
+        delay = self.latency(rng) if self.latency is not None else rng.randint(self.min_latency, self.max_latency)
+        arrival = now + max(delay, 0)
+        for partition in self.partitions:
+            if partition.start <= now < partition.end and partition.separates(sender, receiver):
+                arrival = max(arrival, partition.end)
+        return arrival
+
+
+class EventKind(IntEnum):
+    # Deliveries at a given time are processed before the ticks at the same time.
+    PROPOSE = 0
+    VOTE = 1
+    TICK = 2
+
+
+@dataclass
+class SimulatedNode:
+    index: int
+    validators: tuple[NodeIdentity, ...]
+    state: NodeState
+
+
+@dataclass
+class SimulationStats:
+    events: int = 0
+    ticks: int = 0
+    proposes_sent: int = 0
+    votes_sent: int = 0
+    deliveries: int = 0
+    drops: int = 0
+    handler_seconds: float = 0.0
+    wall_seconds: float = 0.0
+
+    def add(self, other: "SimulationStats") -> None:
+        for stat in fields(self):
+            setattr(self, stat.name, getattr(self, stat.name) + getattr(other, stat.name))
+
+    def events_per_second(self) -> float:
+        return self.events / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+
+@dataclass
+class SimulationReport:
+    slots: int
+    nodes: int
+    validators: int
+    stats: SimulationStats
+    finalized_slots: list[int]
+    justified_slots: list[int]
+    available_chain_lengths: list[int]
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "slots": self.slots,
+            "nodes": self.nodes,
+            "validators": self.validators,
+            "events": self.stats.events,
+            "ticks": self.stats.ticks,
+            "proposes_sent": self.stats.proposes_sent,
+            "votes_sent": self.stats.votes_sent,
+            "deliveries": self.stats.deliveries,
+            "drops": self.stats.drops,
+            "wall_seconds": self.stats.wall_seconds,
+            "handler_seconds": self.stats.handler_seconds,
+            "events_per_second": self.stats.events_per_second(),
+            "finalized_slots": self.finalized_slots,
+            "justified_slots": self.justified_slots,
+            "available_chain_lengths": self.available_chain_lengths,
+        }
+
+
+def make_validator_identities(count: int) -> list[NodeIdentity]:
+    width = len(str(max(count - 1, 0)))
+    return [NodeIdentity(f"v{i:0{width}d}") for i in range(count)]
+
+
+def get_equivocating_senders_and_slots(votes: Iterable[SignedVoteMessage]) -> set[tuple[NodeIdentity, int]]:
+    """
+    The senders and slots for which `votes` hold votes for different heads.
+    """
+    heads: dict[tuple[NodeIdentity, int], set[Hash]] = {}
+    for vote in votes:
+        heads.setdefault((vote.sender, vote.message.slot), set()).add(vote.message.head_hash)
+    return {sender_and_slot for sender_and_slot, voted in heads.items() if len(voted) > 1}
+
+
+def get_head_from_scratch(node_state: NodeState) -> Block:
+    """
+    The head of `node_state` computed as the fork-choice function was originally specified: from all the votes in
+    `node_state.view_votes`, without the invalid, equivocating and expired ones, keeping the latest vote of each
+    sender, and without those for non-descendants of the greatest justified checkpoint, weighted by `get_GHOST_weight`.
+    It reads neither the fork-choice store, nor the latest-message table, nor the index of the heads voted by each
+    sender in each slot, so that it does not share the computations it is checked against.
+    """
+    justified = helpers.get_block_from_hash(helpers.get_greatest_justified_checkpoint(node_state).block_hash, node_state)
+    equivocating = get_equivocating_senders_and_slots(node_state.view_votes)
+    latest: dict[NodeIdentity, SignedVoteMessage] = {}
+    for vote in helpers.filter_out_invalid_votes(node_state.view_votes, node_state):
+        if (
+            (vote.sender, vote.message.slot) not in equivocating and
+            not helpers.is_GHOST_vote_expired(vote, node_state) and
+            (vote.sender not in latest or vote.message.slot > latest[vote.sender].message.slot)
+        ):
+            latest[vote.sender] = vote
+    votes = helpers.filter_out_GHOST_votes_non_descendant_of_block(justified, pset(latest.values()), node_state)
+    balances = stubs.get_validator_set_for_slot(justified, node_state.current_slot, node_state)
+    block = justified
+    while len(children := helpers.get_children(block, node_state)) > 0:
+        block = helpers.pset_max(children, lambda child: helpers.get_GHOST_weight(child, votes, node_state, balances))
+    return block
+
+
+def check_fork_choice(node_state: NodeState) -> None:
+    """
+    It checks that the fork-choice store of `node_state`, once brought in sync by `update_fork_choice_store`, counts the
+    same heads and weights as a store rebuilt from scratch, and that the head read from it is `get_head_from_scratch`.
+    """
+    synced = helpers.update_fork_choice_store(node_state)
+    store = synced.fork_choice_store
+    rebuilt = helpers.update_fork_choice_store(
+        synced.set(fork_choice_store=helpers.get_empty_fork_choice_store(store.justified_hash, pmap()))
+    ).fork_choice_store
+    assert store.latest_heads == rebuilt.latest_heads, f"{node_state.identity}: stale latest heads in the fork-choice store"
+    assert {h: w for h, w in store.weights.items() if w != 0} == {h: w for h, w in rebuilt.weights.items() if w != 0}, \
+        f"{node_state.identity}: stale weights in the fork-choice store"
+    assert helpers.get_head(synced) == get_head_from_scratch(synced), f"{node_state.identity}: wrong head"
+
+
+def make_genesis() -> Block:
+    return Block(parent_hash=Hash(""), slot=0, votes=pset(), body=BlockBody())
+
+
+class Simulation:
+    """
+    A simulation of `nodes` nodes, each hosting `validators_per_node` validators of balance `balance`.
+    """
+
+    def __init__(
+        self,
+        nodes: int,
+        validators_per_node: int = 1,
+        network: Optional[NetworkModel] = None,
+        delta: int = 10,
+        eta: int = 2,
+        k: int = 2,
+        balance: int = 1,
+        prune_on_finality: bool = True,
+        seed: int = 0,
+        hosted_nodes: Optional[Iterable[int]] = None,
+        check_fork_choice: bool = False,
+        record_events: bool = False
+    ):
+        self.network = network if network is not None else NetworkModel(max_latency=delta // 2)
+        self.delta = delta
+        self.stats = SimulationStats()
+        self.queue: list[tuple[int, int, int, int, Any]] = []
+        self.sequence = 0
+        self.now = 0
+        self.node_count = nodes
+        self.check_fork_choice = check_fork_choice
+        self.record_events = record_events
+
+        identities = make_validator_identities(nodes * validators_per_node)
+        stubs.configure(pmap({identity: balance for identity in identities}))
+        self.configuration = Configuration(delta=delta, genesis=make_genesis(), eta=eta, k=k, prune_on_finality=prune_on_finality)
+        self.host_of: dict[NodeIdentity, int] = {}
+        for index in range(nodes):
+            for identity in identities[index * validators_per_node:(index + 1) * validators_per_node]:
+                self.host_of[identity] = index
+        # Only the nodes in `hosted_nodes` are run by this simulation, see `parallel_simulator.py`.
+        self.nodes: dict[int, SimulatedNode] = {}
+        self.rngs: dict[int, random.Random] = {}
+        for index in (range(nodes) if hosted_nodes is None else hosted_nodes):
+            hosted = tuple(identities[index * validators_per_node:(index + 1) * validators_per_node])
+            self.nodes[index] = SimulatedNode(index, hosted, spec.init(hosted[0], self.configuration))
+            # Each node samples the network for its own messages, so that runs do not depend on which nodes share a process.
+            self.rngs[index] = random.Random(f"{seed}:{index}")
+        # The initial state and the events handled by each node, with the time of each tick, see `check_fast_replay`.
+        self.initial_states: dict[int, NodeState] = {index: node.state for index, node in self.nodes.items()}
+        self.events: dict[int, list[tuple[EventKind, Any]]] = {index: [] for index in self.nodes}
+
+    @property
+    def validators(self) -> int:
+        return len(self.host_of)
+
+    def schedule(self, at: int, kind: EventKind, node: int, payload: Any = None) -> None:
+        heapq.heappush(self.queue, (at, kind, self.sequence, node, payload))
+        self.sequence += 1
+
+    def deliver(self, sender: int, receiver: int, at: int, kind: EventKind, message: Any) -> None:
+        self.schedule(at, kind, receiver, message)
+
+    def broadcast(self, sender: int, kind: EventKind, message: Any) -> None:
+        rng = self.rngs[sender]
+        for receiver in range(self.node_count):
+            arrival = self.network.delivery_time(self.now, sender, receiver, rng)
+            if arrival is None:
+                self.stats.drops += 1
+            else:
+                self.deliver(sender, receiver, arrival, kind, message)
+
+    def route(self, node: SimulatedNode, output: NewNodeStateAndMessagesToTx) -> None:
+        node.state = output.state
+        for propose in output.proposeMessagesToTx:
+            self.stats.proposes_sent += 1
+            self.broadcast(node.index, EventKind.PROPOSE, propose)
+        for vote in output.voteMessagesToTx:
+            for signer in node.validators:
+                if signer == vote.sender:
+                    signed = vote
+                else:
+                    signed = stubs.sign_vote_message(vote.message, node.state.set(identity=signer))
+                self.stats.votes_sent += 1
+                self.broadcast(node.index, EventKind.VOTE, signed)
+
+    def tick(self, node: SimulatedNode) -> NewNodeStateAndMessagesToTx:
+        if self.now % (4 * self.delta) == 0:
+            # The node runs the slot under the identity of the proposer, if it hosts it, so that `on_propose` fires.
+            proposer = stubs.get_proposer_for_slot(self.now // (4 * self.delta))
+            identity = proposer if self.host_of.get(proposer) == node.index else node.validators[0]
+            if node.state.identity != identity:
+                node.state = node.state.set(identity=identity)
+        self.stats.ticks += 1
+        return spec.on_tick(node.state, self.now)
+
+    def process(self, kind: EventKind, node: SimulatedNode, payload: Any) -> None:
+        if self.record_events:
+            self.events[node.index].append((kind, self.now if kind == EventKind.TICK else payload))
+        started = time.perf_counter()
+        if kind == EventKind.TICK:
+            output = self.tick(node)
+        elif kind == EventKind.PROPOSE:
+            self.stats.deliveries += 1
+            output = spec.on_received_propose(payload, node.state)
+        else:
+            self.stats.deliveries += 1
+            output = spec.on_vote_received(payload, node.state)
+        self.stats.handler_seconds += time.perf_counter() - started
+        self.stats.events += 1
+        if self.check_fork_choice:
+            check_fork_choice(output.state)
+        self.route(node, output)
+
+    def schedule_ticks(self, start: int, end: int) -> None:
+        """
+        It schedules a tick of every node at each phase boundary in [`start`, `end`).
+        """
+        for boundary in range(start + (-start) % self.delta, end, self.delta):
+            for index in self.nodes:
+                self.schedule(boundary, EventKind.TICK, index)
+
+    def advance(self, end: int) -> None:
+        """
+        It processes all the events scheduled before `end`.
+        """
+        while self.queue and self.queue[0][0] < end:
+            at, kind, _, index, payload = heapq.heappop(self.queue)
+            self.now = at
+            self.process(EventKind(kind), self.nodes[index], payload)
+        self.now = end
+
+    def run(self, slots: int) -> SimulationReport:
+        """
+        It runs the simulation from its current time until the end of slot `slots - 1`.
+        """
+        started = time.perf_counter()
+        end = slots * 4 * self.delta
+        self.schedule_ticks(self.now, end)
+        self.advance(end)
+        self.stats.wall_seconds += time.perf_counter() - started
+        return self.report(slots)
+
+    def node_summaries(self) -> dict[int, tuple[int, int, int]]:
+        """
+        The greatest finalized and justified checkpoint slots and the length of the available chain of each node.
+        """
+        return {
+            index: (
+                spec.get_greatest_finalized_checkpoint(node.state).chkp_slot,
+                spec.get_greatest_justified_checkpoint(node.state).chkp_slot,
+                spec.get_block_depth(spec.block_hash(node.state.chava), node.state) + 1
+            )
+            for index, node in self.nodes.items()
+        }
+
+    def check_fast_replay(self) -> None:
+        """
+        It checks that replaying the events recorded for each node with the updates of the fork-choice store deferred
+        gives the same states as replaying them without, see `journal.check_fast_replay`. As the identity a node runs a
+        slot under is not recorded, the replays start from the initial state under the identity of its first validator.
+        """
+        import journal
+        for index, events in self.events.items():
+            journal.check_fast_replay(
+                [journal.JournalRecord(sequence, journal.RecordKind[kind.name], payload) for sequence, (kind, payload) in enumerate(events)],
+                self.initial_states[index]
+            )
+
+    def report(self, slots: int) -> SimulationReport:
+        return make_report(slots, self.node_count, self.validators, self.stats, self.node_summaries())
+
+
+def make_report(slots: int, nodes: int, validators: int, stats: SimulationStats, summaries: dict[int, tuple[int, int, int]]) -> SimulationReport:
+    ordered = [summaries[index] for index in sorted(summaries)]
+    return SimulationReport(
+        slots=slots,
+        nodes=nodes,
+        validators=validators,
+        stats=stats,
+        finalized_slots=[summary[0] for summary in ordered],
+        justified_slots=[summary[1] for summary in ordered],
+        available_chain_lengths=[summary[2] for summary in ordered],
+    )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--nodes", type=int, default=8)
+    parser.add_argument("--validators-per-node", type=int, default=1)
+    parser.add_argument("--slots", type=int, default=20)
+    parser.add_argument("--delta", type=int, default=10)
+    parser.add_argument("--eta", type=int, default=2)
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--min-latency", type=int, default=0)
+    parser.add_argument("--max-latency", type=int, default=None, help="defaults to half of delta")
+    parser.add_argument("--drop-probability", type=float, default=0.0)
+    parser.add_argument("--no-pruning", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check-fork-choice", action="store_true", help="check the fork-choice store against a from-scratch computation after every event")
+    parser.add_argument("--check-fast-replay", action="store_true", help="check at the end that each node's events replay to the same states with the fork-choice updates deferred, see journal.py")
+    parser.add_argument("--profile", metavar="PATH", help="instrument the specification and write a per-slot report to PATH, see instrumentation.py")
+    parser.add_argument("--signature-workers", type=int, default=None, metavar="N", help="verify batches of vote and aggregated vote signatures on N worker processes, see signature_verification.py")
+    parser.add_argument("--signature-min-batch", type=int, default=512, help="smallest batch verified by the workers")
+    args = parser.parse_args(argv)
+
+    network = NetworkModel(
+        min_latency=args.min_latency,
+        max_latency=args.delta // 2 if args.max_latency is None else args.max_latency,
+        drop_probability=args.drop_probability,
+    )
+    simulation = Simulation(
+        nodes=args.nodes,
+        validators_per_node=args.validators_per_node,
+        network=network,
+        delta=args.delta,
+        eta=args.eta,
+        k=args.k,
+        prune_on_finality=not args.no_pruning,
+        seed=args.seed,
+        check_fork_choice=args.check_fork_choice,
+        record_events=args.check_fast_replay,
+    )
+    with ExitStack() as stack:
+        verifier = None
+        if args.signature_workers is not None:
+            import signature_verification
+            verifier = stack.enter_context(signature_verification.installed(args.signature_workers, args.signature_min_batch))
+        if args.profile:
+            import instrumentation
+            with instrumentation.instrumented() as profile:
+                report = simulation.run(args.slots)
+            profile.dump_json(args.profile)
+        else:
+            report = simulation.run(args.slots)
+    if args.check_fast_replay:
+        simulation.check_fast_replay()
+    output = report.to_json()
+    if verifier is not None:
+        output["signature_verification"] = verifier.stats()
+    print(json.dumps(output, indent=2))
+
+
+if __name__ == "__main__":
+    main()
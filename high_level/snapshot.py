@@ -0,0 +1,493 @@
+"""
+Compact binary snapshots of a `NodeState`, restored through a memory mapping of the snapshot file.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+A snapshot is made of NumPy columns:
+- the hashes, node identities and signatures are interned into string tables, and referred to by index;
+- the checkpoints are interned too, and stored as three columns;
+- every vote is stored once, as one row of the vote columns, every aggregated vote once, as one row of the aggregated
+  vote columns, and every block once, as one row of the block columns with the rows of its aggregated votes; a vote
+  extracted from an aggregated vote refers to its row instead of a signature; flags record which of the views, buffers
+  and candidate sets of the node hold each of them, and which blocks are headers, see `stubs.get_block_header`;
+- the indexes of the node, e.g. `view_ancestry` or `ffg_votes_by_target`, are stored as groups of rows, so that they
+  are restored as they were rather than recomputed from the views.
+
+The file starts with a magic number and a JSON header listing the sections, each aligned on 8 bytes. `SnapshotReader`
+maps the file in memory and exposes the sections as read-only NumPy arrays backed by the mapping, so that restoring a
+node only reads the file once, sequentially, and allocates nothing but the objects of the restored state.
+As the specification works on a `NodeState` made of `pyrsistent` collections, all of these objects are built when
+restoring, and this is what restoring costs, most of it hashing the votes into the sets of the state. The sets shared
+by many entries of an index are built once. On a single core, restoring takes 3.7 seconds for 96,000 votes and 7.4
+seconds for 192,000, and the snapshot takes about 78 bytes per vote: a node with millions of votes restarts in tens of
+seconds per million votes, not in seconds. Restoring faster would take a state whose views of votes are columns
+materialised on demand, like `columnar_votes.ColumnarVoteView`, rather than the `pyrsistent` sets the specification
+works on.
+
+Example:
+
+    save_snapshot(node_state, "node.snapshot")
+    node_state = load_snapshot("node.snapshot")
+"""
+import json
+import mmap
+import struct
+from dataclasses import fields
+from typing import Any, Callable, Iterable, Optional
+
+import numpy as np
+from pyrsistent import pmap, pset
+
+import stubs
+from columnar_votes import InternTable
+from data_structures import *
+from message_codec import reference_signature_from_str, reference_signature_to_str
+
+MAGIC = b"SSFSNAP2"  # Version 2 adds the column `ancestry_increasing_slots_depth`
+_HEADER_LENGTH = struct.Struct("<Q")
+_ALIGNMENT = 8
+
+# Flags of the block rows
+VIEW_BLOCK = 1
+ARCHIVED_BLOCK = 2
+BUFFER_BLOCK = 4
+CANDIDATE_BLOCK = 8  # In `s_cand`
+HEADER_BLOCK = 16  # Header returned by `stubs.get_block_header`, whose hash is restored from the hash of its row
+
+# Flags of the vote rows
+VIEW_VOTE = 1
+BUFFER_VOTE = 2
+
+# Flags of the aggregated vote rows
+PENDING_AGGREGATE = 1  # In `pending_aggregates`
+
+
+class _SnapshotWriter:
+    def __init__(self, signature_to_str: Callable[[Signature], str]):
+        self.signature_to_str = signature_to_str
+        self.hashes: InternTable[str] = InternTable()
+        self.identities: InternTable[str] = InternTable()
+        self.signatures: InternTable[str] = InternTable()
+        self.checkpoints: InternTable[Checkpoint] = InternTable()
+        self.votes: InternTable[SignedVoteMessage] = InternTable()
+        self.vote_flags: list[int] = []
+        self.participations: InternTable[str] = InternTable()
+        self.aggregates: InternTable[AggregatedVoteMessage] = InternTable()
+        self.aggregate_flags: list[int] = []
+        self.blocks: InternTable[Hash] = InternTable()
+        self.block_values: list[Block] = []
+        self.block_flags: list[int] = []
+        self.sections: dict[str, np.ndarray] = {}
+
+    def hash(self, value: Hash) -> int:
+        return self.hashes.intern(value)
+
+    def checkpoint(self, value: Checkpoint) -> int:
+        self.hash(value.block_hash)
+        return self.checkpoints.intern(value)
+
+    def message(self, value: VoteMessage) -> None:
+        self.hash(value.head_hash)
+        self.checkpoint(value.ffg_source)
+        self.checkpoint(value.ffg_target)
+
+    def vote(self, value: SignedVoteMessage, flags: int = 0) -> int:
+        row = self.votes.intern(value)
+        if row == len(self.vote_flags):
+            self.vote_flags.append(0)
+            self.message(value.message)
+            self.identities.intern(value.sender)
+            if isinstance(value.signature, AggregatedVoteSignature):
+                self.aggregate(value.signature.aggregate)
+            else:
+                self.signatures.intern(self.signature_to_str(value.signature))
+        self.vote_flags[row] |= flags
+        return row
+
+    def aggregate(self, value: AggregatedVoteMessage, flags: int = 0) -> int:
+        row = self.aggregates.intern(value)
+        if row == len(self.aggregate_flags):
+            self.aggregate_flags.append(0)
+            self.message(value.message)
+            self.participations.intern(f"{value.participation_bits:x}")
+            self.signatures.intern(self.signature_to_str(value.signature))
+        self.aggregate_flags[row] |= flags
+        return row
+
+    def block(self, value: Block, flags: int = 0, value_hash: Optional[Hash] = None) -> int:
+        row = self.blocks.intern(stubs.block_hash(value) if value_hash is None else value_hash)
+        if row == len(self.block_flags):
+            self.block_flags.append(HEADER_BLOCK if isinstance(value.body, stubs.ReferenceBlockHeaderBody) else 0)
+            self.block_values.append(value)
+            self.hash(self.blocks.values[row])
+            self.hash(value.parent_hash)
+        self.block_flags[row] |= flags
+        return row
+
+    def column(self, name: str, values: Iterable[int], dtype: Any) -> None:
+        self.sections[name] = np.fromiter(values, dtype=dtype)
+
+    def strings(self, name: str, table: InternTable[str]) -> None:
+        encoded = [value.encode() for value in table.values]
+        self.sections[f"{name}_data"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        self.sections[f"{name}_offsets"] = np.cumsum([0] + [len(e) for e in encoded], dtype=np.int64)
+
+    def groups(self, name: str, groups: list[tuple[tuple[int, ...], list[int]]], key_names: tuple[str, ...]) -> None:
+        """
+        It stores `groups`, a list of keys and member rows, as one column per key component and the concatenated members.
+        """
+        for position, key_name in enumerate(key_names):
+            self.column(f"{name}_{key_name}", (key[position] for key, _ in groups), np.int64)
+        self.sections[f"{name}_offsets"] = np.cumsum([0] + [len(members) for _, members in groups], dtype=np.int64)
+        self.column(f"{name}_members", (m for _, members in groups for m in members), np.int64)
+
+    def write(self, node_state: NodeState, path: str) -> None:
+        for h, block in node_state.view_blocks.items():
+            self.block(block, VIEW_BLOCK, h)
+        for h, block in node_state.archived_blocks.items():
+            self.block(block, ARCHIVED_BLOCK, h)
+        for h, block in node_state.buffer_blocks.items():
+            self.block(block, BUFFER_BLOCK, h)
+        for block in node_state.s_cand:
+            self.block(block, CANDIDATE_BLOCK)
+        chava = self.block(node_state.chava)
+        genesis = self.block(node_state.configuration.genesis)
+        for vote in node_state.view_votes:
+            self.vote(vote, VIEW_VOTE)
+        for vote in node_state.buffer_votes:
+            self.vote(vote, BUFFER_VOTE)
+        for aggregate in node_state.pending_aggregates:
+            self.aggregate(aggregate, PENDING_AGGREGATE)
+        block_votes = [[self.aggregate(a) for a in block.votes] for block in self.block_values]
+
+        self.groups("children", [
+            ((self.hash(parent),), [self.hash(child) for child in children])
+            for parent, children in node_state.view_children.items()
+        ], ("parent",))
+        self.groups("latest_messages", [
+            ((self.identities.intern(sender),), [self.vote(v) for v in votes])
+            for sender, votes in node_state.latest_messages.items()
+        ], ("sender",))
+        self.groups("vote_heads", [
+            ((self.identities.intern(key.sender), key.slot), [self.hash(h) for h in heads])
+            for key, heads in node_state.view_vote_heads.items()
+        ], ("sender", "slot"))
+        self.groups("votes_by_head", [
+            ((self.hash(head),), [self.vote(v) for v in votes])
+            for head, votes in node_state.view_votes_by_head.items()
+        ], ("head",))
+        self.groups("ffg_by_target", [
+            ((self.checkpoint(target),), [self.vote(v) for v in votes])
+            for targets in node_state.ffg_votes_by_target.values()
+            for target, votes in targets.items()
+        ], ("checkpoint",))
+        self.groups("ffg_by_source", [
+            ((self.checkpoint(source),), [self.vote(v) for v in votes])
+            for source, votes in node_state.ffg_votes_by_source.items()
+        ], ("checkpoint",))
+
+        ancestry = list(node_state.view_ancestry.items())
+        self.column("ancestry_block", (self.hash(h) for h, _ in ancestry), np.int32)
+        self.column("ancestry_depth", (e.depth for _, e in ancestry), np.int64)
+        self.column("ancestry_jump", (self.hash(e.jump_hash) for _, e in ancestry), np.int32)
+        self.column("ancestry_increasing_slots_depth", (e.increasing_slots_depth for _, e in ancestry), np.int64)
+
+        store = node_state.fork_choice_store
+        self.column("balance_validator", (self.identities.intern(v) for v in store.validator_balances.keys()), np.int32)
+        self.column("balance_amount", store.validator_balances.values(), np.int64)
+        self.column("latest_head_validator", (self.identities.intern(v) for v in store.latest_heads.keys()), np.int32)
+        self.column("latest_head_hash", (self.hash(h) for h in store.latest_heads.values()), np.int32)
+        self.column("weight_hash", (self.hash(h) for h in store.weights.keys()), np.int32)
+        self.column("weight_amount", store.weights.values(), np.int64)
+        self.column("stale_sender", (self.identities.intern(v) for v in store.stale_senders), np.int32)
+        self.column("justified", (self.checkpoint(c) for c in node_state.justified_checkpoints), np.int32)
+        self.column("finalized", (self.checkpoint(c) for c in node_state.finalized_checkpoints), np.int32)
+
+        header: dict[str, Any] = {
+            "identity": self.identities.intern(node_state.identity),
+            "current_slot": node_state.current_slot,
+            "current_phase": node_state.current_phase.name,
+            "configuration": {
+                f.name: getattr(node_state.configuration, f.name)
+                for f in fields(node_state.configuration) if f.name != "genesis"
+            },
+            "genesis": genesis,
+            "chava": chava,
+            "pruning_anchor": self.checkpoint(node_state.pruning_anchor),
+            "justified_hash": self.hash(store.justified_hash),
+        }
+
+        votes = self.votes.values
+        self.column("vote_slot", (v.message.slot for v in votes), np.int64)
+        self.column("vote_head", (self.hashes.indices[v.message.head_hash] for v in votes), np.int32)
+        self.column("vote_source", (self.checkpoints.indices[v.message.ffg_source] for v in votes), np.int32)
+        self.column("vote_target", (self.checkpoints.indices[v.message.ffg_target] for v in votes), np.int32)
+        self.column("vote_sender", (self.identities.indices[v.sender] for v in votes), np.int32)
+        self.column("vote_signature", (
+            -1 if isinstance(v.signature, AggregatedVoteSignature) else self.signatures.indices[self.signature_to_str(v.signature)]
+            for v in votes
+        ), np.int32)
+        self.column("vote_aggregate", (
+            self.aggregates.indices[v.signature.aggregate] if isinstance(v.signature, AggregatedVoteSignature) else -1
+            for v in votes
+        ), np.int32)
+        self.sections["vote_flags"] = np.array(self.vote_flags, dtype=np.uint8)
+
+        aggregates = self.aggregates.values
+        self.column("aggregate_slot", (a.message.slot for a in aggregates), np.int64)
+        self.column("aggregate_head", (self.hashes.indices[a.message.head_hash] for a in aggregates), np.int32)
+        self.column("aggregate_source", (self.checkpoints.indices[a.message.ffg_source] for a in aggregates), np.int32)
+        self.column("aggregate_target", (self.checkpoints.indices[a.message.ffg_target] for a in aggregates), np.int32)
+        self.column("aggregate_participation", (self.participations.indices[f"{a.participation_bits:x}"] for a in aggregates), np.int32)
+        self.column("aggregate_signature", (self.signatures.indices[self.signature_to_str(a.signature)] for a in aggregates), np.int32)
+        self.sections["aggregate_flags"] = np.array(self.aggregate_flags, dtype=np.uint8)
+
+        self.sections["block_hash"] = np.fromiter((self.hashes.indices[h] for h in self.blocks.values), dtype=np.int32)
+        self.column("block_parent", (self.hashes.indices[b.parent_hash] for b in self.block_values), np.int32)
+        self.column("block_slot", (b.slot for b in self.block_values), np.int64)
+        self.sections["block_flags"] = np.array(self.block_flags, dtype=np.uint8)
+        self.sections["block_votes_offsets"] = np.cumsum([0] + [len(rows) for rows in block_votes], dtype=np.int64)
+        self.column("block_votes", (row for rows in block_votes for row in rows), np.int32)
+
+        self.column("checkpoint_hash", (self.hashes.indices[c.block_hash] for c in self.checkpoints.values), np.int32)
+        self.column("checkpoint_chkp_slot", (c.chkp_slot for c in self.checkpoints.values), np.int64)
+        self.column("checkpoint_block_slot", (c.block_slot for c in self.checkpoints.values), np.int64)
+        self.strings("hashes", self.hashes)
+        self.strings("identities", self.identities)
+        self.strings("signatures", self.signatures)
+        self.strings("participations", self.participations)
+
+        offset = 0
+        layout = {}
+        for name, array in self.sections.items():
+            layout[name] = [offset, array.dtype.str, len(array)]
+            offset += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+        header["sections"] = layout
+        encoded_header = json.dumps(header).encode()
+        encoded_header += b" " * (-(len(MAGIC) + _HEADER_LENGTH.size + len(encoded_header)) % _ALIGNMENT)
+
+        with open(path, "wb") as output:
+            output.write(MAGIC)
+            output.write(_HEADER_LENGTH.pack(len(encoded_header)))
+            output.write(encoded_header)
+            for array in self.sections.values():
+                data = array.tobytes()
+                output.write(data)
+                output.write(b"\0" * (-len(data) % _ALIGNMENT))
+
+
+def save_snapshot(node_state: NodeState, path: str, signature_to_str: Callable[[Signature], str] = reference_signature_to_str) -> None:
+    """
+    It writes a snapshot of `node_state` to `path`. Signatures are stored as the strings returned by `signature_to_str`.
+    """
+    _SnapshotWriter(signature_to_str).write(node_state, path)
+
+
+class SnapshotReader:
+    """
+    A snapshot file mapped in memory. The arrays returned by `column` are only valid until `close`.
+    """
+
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.mapping = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mapping[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a snapshot, or one of another version")
+        length, = _HEADER_LENGTH.unpack_from(self.mapping, len(MAGIC))
+        start = len(MAGIC) + _HEADER_LENGTH.size
+        self.header = json.loads(self.mapping[start:start + length])
+        self.data_start = start + length
+
+    def column(self, name: str) -> np.ndarray:
+        offset, dtype, count = self.header["sections"][name]
+        return np.frombuffer(self.mapping, dtype=np.dtype(dtype), count=count, offset=self.data_start + offset)
+
+    def strings(self, name: str) -> list[str]:
+        data = self.column(f"{name}_data").tobytes()
+        offsets = self.column(f"{name}_offsets").tolist()
+        return [data[offsets[i]:offsets[i + 1]].decode() for i in range(len(offsets) - 1)]
+
+    def groups(self, name: str, key_names: tuple[str, ...]) -> Iterable[tuple[tuple[int, ...], list[int]]]:
+        keys = list(zip(*(self.column(f"{name}_{key_name}").tolist() for key_name in key_names)))
+        offsets = self.column(f"{name}_offsets").tolist()
+        members = self.column(f"{name}_members").tolist()
+        return ((key, members[offsets[i]:offsets[i + 1]]) for i, key in enumerate(keys))
+
+    def node_state(self, signature_from_str: Callable[[str], Signature] = reference_signature_from_str) -> NodeState:
+        """
+        It restores the snapshotted `NodeState`.
+        """
+        header = self.header
+        hashes = [Hash(s) for s in self.strings("hashes")]
+        identities = [NodeIdentity(s) for s in self.strings("identities")]
+        signatures = [signature_from_str(s) for s in self.strings("signatures")]
+
+        checkpoints = [
+            Checkpoint(block_hash=hashes[h], chkp_slot=chkp_slot, block_slot=block_slot)
+            for h, chkp_slot, block_slot in zip(
+                self.column("checkpoint_hash").tolist(),
+                self.column("checkpoint_chkp_slot").tolist(),
+                self.column("checkpoint_block_slot").tolist()
+            )
+        ]
+        messages: dict[tuple[int, int, int, int], VoteMessage] = {}
+
+        def message(slot: int, head: int, source: int, target: int) -> VoteMessage:
+            key = (slot, head, source, target)
+            found = messages.get(key)
+            if found is None:
+                found = messages[key] = VoteMessage(slot=slot, head_hash=hashes[head], ffg_source=checkpoints[source], ffg_target=checkpoints[target])
+            return found
+
+        participations = [int(s, 16) for s in self.strings("participations")]
+        aggregates = [
+            AggregatedVoteMessage(message=message(slot, head, source, target), participation_bits=participations[participation], signature=signatures[signature])
+            for slot, head, source, target, participation, signature in zip(
+                self.column("aggregate_slot").tolist(),
+                self.column("aggregate_head").tolist(),
+                self.column("aggregate_source").tolist(),
+                self.column("aggregate_target").tolist(),
+                self.column("aggregate_participation").tolist(),
+                self.column("aggregate_signature").tolist()
+            )
+        ]
+        aggregate_signatures = [AggregatedVoteSignature(aggregate=aggregate) for aggregate in aggregates]
+        votes = [
+            SignedVoteMessage(
+                message=message(slot, head, source, target),
+                signature=signatures[signature] if signature >= 0 else aggregate_signatures[aggregate],
+                sender=identities[sender]
+            )
+            for slot, head, source, target, sender, signature, aggregate in zip(
+                self.column("vote_slot").tolist(),
+                self.column("vote_head").tolist(),
+                self.column("vote_source").tolist(),
+                self.column("vote_target").tolist(),
+                self.column("vote_sender").tolist(),
+                self.column("vote_signature").tolist(),
+                self.column("vote_aggregate").tolist()
+            )
+        ]
+        vote_flags = self.column("vote_flags")
+
+        block_votes = self.column("block_votes").tolist()
+        block_offsets = self.column("block_votes_offsets").tolist()
+        block_hashes = [hashes[h] for h in self.column("block_hash").tolist()]
+        block_flags = self.column("block_flags")
+        header_blocks = set(np.flatnonzero(block_flags & HEADER_BLOCK).tolist())
+        blocks = [
+            Block(
+                parent_hash=hashes[parent],
+                slot=slot,
+                votes=pset(aggregates[r] for r in block_votes[block_offsets[i]:block_offsets[i + 1]]),
+                body=stubs.ReferenceBlockHeaderBody(block_hash=block_hashes[i]) if i in header_blocks else BlockBody()
+            )
+            for i, (parent, slot) in enumerate(zip(self.column("block_parent").tolist(), self.column("block_slot").tolist()))
+        ]
+
+        def blocks_with(flag: int) -> list[int]:
+            return np.flatnonzero(block_flags & flag).tolist()
+
+        def votes_with(flag: int) -> list[int]:
+            return np.flatnonzero(vote_flags & flag).tolist()
+
+        ffg_by_target: dict[int, dict[Checkpoint, PSet[SignedVoteMessage]]] = {}
+        for (target,), rows in self.groups("ffg_by_target", ("checkpoint",)):
+            ffg_by_target.setdefault(checkpoints[target].chkp_slot, {})[checkpoints[target]] = pset(votes[r] for r in rows)
+
+        # Most senders vote for the same few heads, so the sets of heads of `view_vote_heads` are shared between its entries
+        head_sets: dict[tuple[int, ...], PSet[Hash]] = {}
+
+        def head_set(heads: list[int]) -> PSet[Hash]:
+            key = tuple(heads)
+            found = head_sets.get(key)
+            if found is None:
+                found = head_sets[key] = pset(hashes[h] for h in heads)
+            return found
+
+        ancestry = zip(
+            self.column("ancestry_block").tolist(),
+            self.column("ancestry_depth").tolist(),
+            self.column("ancestry_jump").tolist(),
+            self.column("ancestry_increasing_slots_depth").tolist()
+        )
+        configuration = Configuration(genesis=blocks[header["genesis"]], **header["configuration"])
+
+        return NodeState(
+            configuration=configuration,
+            identity=identities[header["identity"]],
+            current_slot=header["current_slot"],
+            current_phase=NodePhase[header["current_phase"]],
+            view_blocks=pmap({block_hashes[i]: blocks[i] for i in blocks_with(VIEW_BLOCK)}),
+            view_children=pmap({
+                hashes[parent]: pset(hashes[c] for c in children)
+                for (parent,), children in self.groups("children", ("parent",))
+            }),
+            view_ancestry=pmap({
+                hashes[h]: AncestryIndexEntry(depth=depth, jump_hash=hashes[jump], increasing_slots_depth=increasing)
+                for h, depth, jump, increasing in ancestry
+            }),
+            archived_blocks=pmap({block_hashes[i]: blocks[i] for i in blocks_with(ARCHIVED_BLOCK)}),
+            pruning_anchor=checkpoints[header["pruning_anchor"]],
+            fork_choice_store=ForkChoiceStore(
+                justified_hash=hashes[header["justified_hash"]],
+                validator_balances=pmap(dict(zip(
+                    (identities[v] for v in self.column("balance_validator").tolist()),
+                    self.column("balance_amount").tolist()
+                ))),
+                latest_heads=pmap(dict(zip(
+                    (identities[v] for v in self.column("latest_head_validator").tolist()),
+                    (hashes[h] for h in self.column("latest_head_hash").tolist())
+                ))),
+                weights=pmap(dict(zip(
+                    (hashes[h] for h in self.column("weight_hash").tolist()),
+                    self.column("weight_amount").tolist()
+                ))),
+                stale_senders=pset(identities[v] for v in self.column("stale_sender").tolist()),
+            ),
+            view_votes=pset(votes[r] for r in votes_with(VIEW_VOTE)),
+            latest_messages=pmap({
+                identities[sender]: pset(votes[r] for r in rows)
+                for (sender,), rows in self.groups("latest_messages", ("sender",))
+            }),
+            view_vote_heads=pmap({
+                SenderAndSlot(sender=identities[sender], slot=slot): head_set(heads)
+                for (sender, slot), heads in self.groups("vote_heads", ("sender", "slot"))
+            }),
+            view_votes_by_head=pmap({
+                hashes[head]: pset(votes[r] for r in rows)
+                for (head,), rows in self.groups("votes_by_head", ("head",))
+            }),
+            ffg_votes_by_target=pmap({slot: pmap(targets) for slot, targets in ffg_by_target.items()}),
+            ffg_votes_by_source=pmap({
+                checkpoints[source]: pset(votes[r] for r in rows)
+                for (source,), rows in self.groups("ffg_by_source", ("checkpoint",))
+            }),
+            justified_checkpoints=pset(checkpoints[c] for c in self.column("justified").tolist()),
+            finalized_checkpoints=pset(checkpoints[c] for c in self.column("finalized").tolist()),
+            buffer_votes=pset(votes[r] for r in votes_with(BUFFER_VOTE)),
+            pending_aggregates=pset(aggregates[r] for r in np.flatnonzero(self.column("aggregate_flags") & PENDING_AGGREGATE).tolist()),
+            buffer_blocks=pmap({block_hashes[i]: blocks[i] for i in blocks_with(BUFFER_BLOCK)}),
+            s_cand=pset(blocks[i] for i in blocks_with(CANDIDATE_BLOCK)),
+            chava=blocks[header["chava"]],
+        )
+
+    def close(self) -> None:
+        try:
+            self.mapping.close()
+        except BufferError:
+            # Arrays returned by `column` are still alive, e.g. in the traceback of an exception raised while
+            # restoring: the mapping is closed once they are released.
+            pass
+        self.file.close()
+
+    def __enter__(self) -> "SnapshotReader":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def load_snapshot(path: str, signature_from_str: Callable[[str], Signature] = reference_signature_from_str) -> NodeState:
+    with SnapshotReader(path) as reader:
+        return reader.node_state(signature_from_str)
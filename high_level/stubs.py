@@ -0,0 +1,226 @@
+"""
+Reference implementation of the functions declared in `stubs.pyi`, used to execute the specification.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+It implements a stand-in signature scheme, where the key of each node is derived from its identity, a static validator
+set, set via `configure`, and a stake-weighted proposer selection seeded by the slot. The batch verification of vote
+signatures and of aggregated vote signatures can be delegated, e.g. to a pool of worker processes, via
+`set_vote_signatures_verifier` and `set_aggregated_vote_signatures_verifier`.
+None of this is secure; it is only meant to be deterministic and cheap enough to simulate many nodes.
+"""
+import hashlib
+import hmac
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+from pyrsistent import PMap, PSet, PVector, pmap, pset
+
+from data_structures import *
+from pythonic_code_generic import BoundedCache
+
+__all__ = [
+    'block_hash',
+    'verify_vote_signature',
+    'verify_vote_signatures',
+    'aggregate_vote_signatures',
+    'verify_aggregated_vote_signature',
+    'verify_aggregated_vote_signatures',
+    'get_block_body',
+    'get_block_header',
+    'get_proposer',
+    'get_validator_set_for_slot',
+    'sign_propose_message',
+    'get_signer_of_vote_message',
+    'sign_vote_message',
+]
+
+
+@dataclass(frozen=True)
+class ReferenceSignature(Signature):
+    digest: str
+
+
+@dataclass(frozen=True)
+class ReferenceBlockHeaderBody(BlockBody):
+    block_hash: Hash  # Hash of the block whose header this is
+
+
+@dataclass(frozen=True)
+class ReferenceParameters:
+    validator_balances: ValidatorBalances
+
+
+_parameters = ReferenceParameters(validator_balances=pmap())
+_block_hashes = BoundedCache(1 << 18)
+_vote_signatures_verifier: Optional[Callable[[PSet[SignedVoteMessage]], PSet[SignedVoteMessage]]] = None
+_aggregated_vote_signatures_verifier: Optional[Callable[[PMap[AggregatedVoteMessage, PSet[NodeIdentity]]], PSet[AggregatedVoteMessage]]] = None
+
+
+def configure(validator_balances: ValidatorBalances) -> None:
+    """
+    It sets the validator set returned by `get_validator_set_for_slot`, which is the same for every block and slot.
+    """
+    global _parameters
+    _parameters = ReferenceParameters(validator_balances=pmap(validator_balances))
+
+
+def get_reference_parameters() -> ReferenceParameters:
+    return _parameters
+
+
+def _digest(payload: str) -> str:
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _key(identity: NodeIdentity) -> bytes:
+    return hashlib.sha256(b"ssf-reference-key:" + identity.encode()).digest()
+
+
+def _sign(identity: NodeIdentity, payload: str) -> ReferenceSignature:
+    return ReferenceSignature(digest=hmac.new(_key(identity), payload.encode(), hashlib.sha256).hexdigest())
+
+
+def _signature_digest(signature: Signature) -> str:
+    return signature.digest if isinstance(signature, ReferenceSignature) else ""
+
+
+def encode_checkpoint(checkpoint: Checkpoint) -> str:
+    return f"{checkpoint.block_hash}:{checkpoint.chkp_slot}:{checkpoint.block_slot}"
+
+
+def encode_vote_message(message: VoteMessage) -> str:
+    return f"{message.slot}|{message.head_hash}|{encode_checkpoint(message.ffg_source)}|{encode_checkpoint(message.ffg_target)}"
+
+
+def encode_aggregated_vote_message(aggregate: AggregatedVoteMessage) -> str:
+    return f"{encode_vote_message(aggregate.message)}|{aggregate.participation_bits:x}|{_signature_digest(aggregate.signature)}"
+
+
+def block_hash(block: Block) -> Hash:
+    """
+    The SHA-256 digest of the parent hash, slot and aggregated votes of `block`. Digests are cached per block object.
+    The hash of a header returned by `get_block_header` is the one carried by its body.
+    """
+    if isinstance(block.body, ReferenceBlockHeaderBody):
+        return block.body.block_hash
+    found, cached = _block_hashes.lookup(id(block))
+    if found and cached[0] is block:
+        return cached[1]
+    digest = Hash(_digest(
+        f"{block.parent_hash}|{block.slot}|" + ",".join(sorted(_digest(encode_aggregated_vote_message(aggregate)) for aggregate in block.votes))
+    ))
+    _block_hashes.store(id(block), (block, digest))
+    return digest
+
+
+def verify_vote_signature(vote: SignedVoteMessage) -> bool:
+    return hmac.compare_digest(_signature_digest(vote.signature), _sign(vote.sender, encode_vote_message(vote.message)).digest)
+
+
+def set_vote_signatures_verifier(verifier: Optional[Callable[[PSet[SignedVoteMessage]], PSet[SignedVoteMessage]]]) -> None:
+    """
+    It makes `verify_vote_signatures` delegate to `verifier`, e.g. a `signature_verification.BatchSignatureVerifier`,
+    or verify the votes one by one if `verifier` is `None`. As the specification binds `verify_vote_signatures` when it is
+    imported, the verifier is looked up on every call rather than by rebinding the function.
+    """
+    global _vote_signatures_verifier
+    _vote_signatures_verifier = verifier
+
+
+def verify_vote_signatures(votes: PSet[SignedVoteMessage]) -> PSet[SignedVoteMessage]:
+    if _vote_signatures_verifier is not None:
+        return _vote_signatures_verifier(votes)
+    return pset(vote for vote in votes if verify_vote_signature(vote))
+
+
+def _xor_digests(digests: Iterable[str]) -> str:
+    combined = 0
+    for digest in digests:
+        combined ^= int(digest, 16)
+    return f"{combined:064x}"
+
+
+def aggregate_vote_signatures(signatures: PVector[Signature]) -> Signature:
+    """
+    The aggregate of `signatures` is the XOR of their digests, so that, like BLS aggregates, the aggregates of disjoint
+    sets of signers can be aggregated further.
+    """
+    return ReferenceSignature(digest=_xor_digests(_signature_digest(signature) for signature in signatures))
+
+
+def verify_aggregated_vote_signature(aggregate: AggregatedVoteMessage, participants: PSet[NodeIdentity]) -> bool:
+    payload = encode_vote_message(aggregate.message)
+    expected = _xor_digests(_sign(participant, payload).digest for participant in participants)
+    return hmac.compare_digest(_signature_digest(aggregate.signature), expected)
+
+
+def set_aggregated_vote_signatures_verifier(
+    verifier: Optional[Callable[[PMap[AggregatedVoteMessage, PSet[NodeIdentity]]], PSet[AggregatedVoteMessage]]]
+) -> None:
+    """
+    It makes `verify_aggregated_vote_signatures` delegate to `verifier`, or verify the aggregated votes one by one if
+    `verifier` is `None`, see `set_vote_signatures_verifier`.
+    """
+    global _aggregated_vote_signatures_verifier
+    _aggregated_vote_signatures_verifier = verifier
+
+
+def verify_aggregated_vote_signatures(aggregates: PMap[AggregatedVoteMessage, PSet[NodeIdentity]]) -> PSet[AggregatedVoteMessage]:
+    if _aggregated_vote_signatures_verifier is not None:
+        return _aggregated_vote_signatures_verifier(aggregates)
+    return pset(aggregate for aggregate, participants in aggregates.items() if verify_aggregated_vote_signature(aggregate, participants))
+
+
+def get_block_body(nodeState: NodeState) -> BlockBody:
+    return BlockBody()
+
+
+def get_block_header(block: Block) -> Block:
+    """
+    The header of `block`: a block with its parent hash and slot, no votes, and a body carrying its hash. A block without
+    votes is its own header.
+    """
+    if len(block.votes) == 0:
+        return block
+    return Block(parent_hash=block.parent_hash, slot=block.slot, votes=pset(), body=ReferenceBlockHeaderBody(block_hash=block_hash(block)))
+
+
+def get_proposer_for_slot(slot: int) -> NodeIdentity:
+    """
+    It picks a validator with probability proportional to its balance, using the digest of `slot` as the source of randomness.
+    """
+    balances = _parameters.validator_balances
+    validators = sorted(balances.keys())
+    point = int(_digest(f"proposer:{slot}"), 16) % sum(balances[v] for v in validators)
+    for validator in validators:
+        point -= balances[validator]
+        if point < 0:
+            return validator
+    raise AssertionError("unreachable")
+
+
+def get_proposer(nodeState: NodeState) -> NodeIdentity:
+    return get_proposer_for_slot(nodeState.current_slot)
+
+
+def get_validator_set_for_slot(block: Block, slot: int, nodeState: NodeState) -> ValidatorBalances:
+    return _parameters.validator_balances
+
+
+def sign_propose_message(propose_message: ProposeMessage, nodeState: NodeState) -> SignedProposeMessage:
+    return SignedProposeMessage(
+        message=propose_message,
+        signature=_sign(nodeState.identity, f"propose|{block_hash(propose_message.block)}")
+    )
+
+
+def get_signer_of_vote_message(vote: SignedVoteMessage, nodeState: NodeState) -> NodeIdentity:
+    return vote.sender
+
+
+def sign_vote_message(vote_message: VoteMessage, nodeState: NodeState) -> SignedVoteMessage:
+    return SignedVoteMessage(
+        message=vote_message,
+        signature=_sign(nodeState.identity, encode_vote_message(vote_message)),
+        sender=nodeState.identity
+    )
@@ -9,9 +9,30 @@ def block_hash(block: Block) -> Hash:
 def verify_vote_signature(vote: SignedVoteMessage) -> bool:
     ...
 
+def verify_vote_signatures(votes: PSet[SignedVoteMessage]) -> PSet[SignedVoteMessage]:
+    ...
+
+def aggregate_vote_signatures(signatures: PVector[Signature]) -> Signature:
+    ...
+
+def verify_aggregated_vote_signature(aggregate: AggregatedVoteMessage, participants: PSet[NodeIdentity]) -> bool:
+    ...
+
+def verify_aggregated_vote_signatures(aggregates: PMap[AggregatedVoteMessage, PSet[NodeIdentity]]) -> PSet[AggregatedVoteMessage]:
+    """
+    The aggregated votes among the keys of `aggregates` whose aggregate signature is valid for the participants they are mapped to.
+    """
+    ...
+
 def get_block_body(nodeState: NodeState) -> BlockBody:
     ...
 
+def get_block_header(block: Block) -> Block:
+    """
+    A block with the parent hash, slot and hash of `block`, and no votes.
+    """
+    ...
+
 def get_proposer(nodeState: NodeState) -> NodeIdentity:
     ...
 
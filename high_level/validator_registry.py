@@ -0,0 +1,60 @@
+"""
+Dense integer registry of the validators of a `ValidatorBalances` map, used to aggregate stake with NumPy.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+The specification only reaches it through the helpers `pmap_sum_values` and `pmap_sum_values_of_keys` of
+`pythonic_code_generic.py`.
+"""
+from typing import Generic, Hashable, Iterable, TypeVar
+
+import numpy as np
+from pyrsistent import PMap
+
+K = TypeVar('K', bound=Hashable)
+
+
+class ValidatorRegistry(Generic[K]):
+    """
+    It assigns to each key of `balances` a dense index, following the sorted order of the keys, and stores the
+    balances in a NumPy array so that the weight of any set of validators is a single masked sum.
+    Sets of validators are represented as boolean masks over the indices, see `mask`.
+    """
+
+    def __init__(self, balances: PMap[K, int]):
+        self.validators: list[K] = sorted(balances.keys())
+        self.indices: dict[K, int] = {validator: index for index, validator in enumerate(self.validators)}
+        self.balances = np.fromiter((balances[validator] for validator in self.validators), dtype=np.int64, count=len(self.validators))
+        self.total_weight = int(self.balances.sum())
+
+    def __len__(self) -> int:
+        return len(self.validators)
+
+    def has(self, validator: K) -> bool:
+        return validator in self.indices
+
+    def index_of(self, validator: K) -> int:
+        return self.indices[validator]
+
+    def empty_mask(self) -> np.ndarray:
+        return np.zeros(len(self.validators), dtype=bool)
+
+    def mask(self, validators: Iterable[K]) -> np.ndarray:
+        """
+        It returns the boolean mask of the validators in `validators` that are in the registry; the others are ignored.
+        """
+        indices = self.indices
+        mask = self.empty_mask()
+        mask[np.fromiter((indices[v] for v in validators if v in indices), dtype=np.intp)] = True
+        return mask
+
+    def weight(self, mask: np.ndarray) -> int:
+        """
+        It returns the total balance of the validators set in `mask`.
+        """
+        return int(self.balances[mask].sum())
+
+    def weight_of(self, validators: Iterable[K]) -> int:
+        return self.weight(self.mask(validators))
+
+    def validators_of(self, mask: np.ndarray) -> list[K]:
+        return [self.validators[index] for index in np.flatnonzero(mask)]
@@ -0,0 +1,356 @@
+"""
+Deterministic generator of synthetic, and possibly adversarial, workloads for a node.
+
+This module is tooling for executing the specification and is not subject to the hard rules of the specification.
+A `Scenario` is a seed together with `ScenarioParameters`, and is serializable to JSON. `generate_workload` turns it
+into a `Workload`, i.e. a time-ordered stream of the blocks and votes received by a node, and `replay` feeds the
+stream to the event handlers of a fresh node, ticking it at every phase boundary, to produce the resulting `NodeState`.
+The same scenario always produces the same workload, and workloads can also be saved and loaded as is, see
+`save_workload`.
+
+The parameters combine the following features, `SCENARIOS` gives a scenario emphasizing each of them:
+- a chain of `slots` slots, with one block and one vote per validator in every slot;
+- `fork_width` branches competing with the canonical chain over its last `fork_depth` slots, voted for by the
+  validators evenly if `balanced_forks`, or by one validator in ten otherwise;
+- `late_blocks` blocks whose parent is withheld, received after the last merge so that they are left in
+  `buffer_blocks`;
+- validators casting a second vote, for the parent of their head, with probability `equivocation_rate` in every slot;
+- `stale_votes_per_validator` votes of each validator for random slots expired by more than `eta`, received in the
+  last slot;
+- if `justification_overlap` is positive, the validators vote for the canonical chain and the first branch as two
+  groups sharing that fraction of the validators, which vote for both, so that both branches get justified if it is
+  at least 1/3.
+"""
+import argparse
+import importlib
+import json
+import random
+import struct
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Optional, Sequence, Union
+
+from pyrsistent import pmap, pset
+
+import helpers
+import stubs
+from data_structures import *
+from message_codec import MessageCodec
+from simulator import make_genesis, make_validator_identities
+
+spec = importlib.import_module('3sf_high_level')
+
+WorkloadMessage = Union[Block, SignedVoteMessage]
+
+
+@dataclass(frozen=True)
+class ScenarioParameters:
+    validators: int = 64
+    slots: int = 32
+    delta: int = 10
+    eta: int = 2
+    k: int = 2
+    fork_width: int = 0
+    fork_depth: int = 0
+    balanced_forks: bool = True
+    late_blocks: int = 0
+    equivocation_rate: float = 0.0
+    stale_votes_per_validator: int = 0
+    justification_overlap: float = 0.0
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    seed: int = 0
+    parameters: ScenarioParameters = ScenarioParameters()
+
+    def to_json(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @staticmethod
+    def from_json(data: dict[str, Any]) -> "Scenario":
+        return Scenario(name=data["name"], seed=data["seed"], parameters=ScenarioParameters(**data["parameters"]))
+
+
+SCENARIOS: dict[str, ScenarioParameters] = {
+    "long_chain": ScenarioParameters(slots=256),
+    "wide_balanced_forks": ScenarioParameters(fork_width=8, fork_depth=8),
+    "late_blocks": ScenarioParameters(late_blocks=16),
+    "equivocation": ScenarioParameters(equivocation_rate=0.3),
+    "stale_vote_flood": ScenarioParameters(stale_votes_per_validator=8),
+    "competing_justification": ScenarioParameters(fork_width=1, fork_depth=4, justification_overlap=0.34),
+}
+
+
+@dataclass(frozen=True)
+class WorkloadEvent:
+    time: int
+    message: WorkloadMessage
+
+
+@dataclass(frozen=True)
+class Workload:
+    scenario: Scenario
+    events: tuple[WorkloadEvent, ...]  # Ordered by time
+
+    @property
+    def end_time(self) -> int:
+        """
+        The last time unit of slot `slots`, the last slot of the workload.
+        """
+        return (self.scenario.parameters.slots + 1) * 4 * self.scenario.parameters.delta - 1
+
+
+def get_scenario(name: str, seed: int = 0) -> Scenario:
+    return Scenario(name=name, seed=seed, parameters=SCENARIOS[name])
+
+
+def checkpoint_of(block: Block, chkp_slot: int) -> Checkpoint:
+    return Checkpoint(block_hash=stubs.block_hash(block), chkp_slot=chkp_slot, block_slot=block.slot)
+
+
+class _Generator:
+    def __init__(self, scenario: Scenario):
+        self.parameters = scenario.parameters
+        self.rng = random.Random(scenario.seed)
+        self.validators = make_validator_identities(self.parameters.validators)
+        self.genesis = make_genesis()
+        self.blocks: dict[Hash, Block] = {stubs.block_hash(self.genesis): self.genesis}
+        self.justified: list[Checkpoint] = [checkpoint_of(self.genesis, 0)]
+        self.sources: dict[Hash, Checkpoint] = {}
+        self.events: list[tuple[int, int, WorkloadMessage]] = []
+        self.signing_state = spec.init(self.validators[0], Configuration(delta=self.parameters.delta, genesis=self.genesis, eta=self.parameters.eta, k=self.parameters.k))
+
+    def slot_start(self, slot: int) -> int:
+        return slot * 4 * self.parameters.delta
+
+    def emit(self, at: int, message: WorkloadMessage) -> None:
+        self.events.append((at, len(self.events), message))
+
+    def latency(self) -> int:
+        return self.rng.randint(1, max(1, self.parameters.delta - 1))
+
+    def new_block(self, parent: Block, slot: int) -> Block:
+        block = Block(parent_hash=stubs.block_hash(parent), slot=slot, votes=pset(), body=BlockBody())
+        self.blocks[stubs.block_hash(block)] = block
+        return block
+
+    def is_ancestor(self, ancestor: Block, block: Block) -> bool:
+        while block.slot > ancestor.slot:
+            block = self.blocks[block.parent_hash]
+        return block == ancestor
+
+    def source_for(self, head: Block) -> Checkpoint:
+        """
+        The greatest justified checkpoint that is an ancestor of `head`. Results are cached until `update_justified`.
+        """
+        head_hash = stubs.block_hash(head)
+        if head_hash not in self.sources:
+            self.sources[head_hash] = next(
+                c for c in sorted(self.justified, key=lambda c: -c.chkp_slot) if self.is_ancestor(self.blocks[c.block_hash], head)
+            )
+        return self.sources[head_hash]
+
+    def vote(self, validator: NodeIdentity, slot: int, head: Block) -> SignedVoteMessage:
+        return stubs.sign_vote_message(
+            VoteMessage(slot=slot, head_hash=stubs.block_hash(head), ffg_source=self.source_for(head), ffg_target=checkpoint_of(head, slot)),
+            self.signing_state.set(identity=validator)
+        )
+
+    def heads_of(self, index: int, tips: list[Block]) -> list[Block]:
+        """
+        The heads voted by the `index`-th validator, given the tips of the canonical chain and of the branches.
+        """
+        p = self.parameters
+        if len(tips) == 1:
+            return tips
+        if p.justification_overlap > 0:
+            position = index / p.validators
+            heads = []
+            if position < (1 + p.justification_overlap) / 2:
+                heads.append(tips[0])
+            if position >= (1 - p.justification_overlap) / 2:
+                heads.append(tips[1])
+            return heads
+        if p.balanced_forks:
+            return [tips[index % len(tips)]]
+        return [tips[1 + (index // 10) % (len(tips) - 1)] if index % 10 == 9 else tips[0]]
+
+    def update_justified(self, votes: list[SignedVoteMessage]) -> None:
+        links: dict[tuple[Checkpoint, Checkpoint], set[NodeIdentity]] = {}
+        for vote in votes:
+            links.setdefault((vote.message.ffg_source, vote.message.ffg_target), set()).add(vote.sender)
+        for (source, target), senders in links.items():
+            if source in self.justified and 3 * len(senders) >= 2 * self.parameters.validators and target not in self.justified:
+                self.justified.append(target)
+                self.sources = {}
+
+    def generate(self) -> list[WorkloadEvent]:
+        p = self.parameters
+        fork_start = p.slots - p.fork_depth if p.fork_width > 0 else p.slots + 1
+        tips = [self.genesis]
+
+        for slot in range(1, p.slots + 1):
+            tips[0] = self.new_block(tips[0], slot)
+            self.emit(self.slot_start(slot) + self.latency(), tips[0])
+            if slot == fork_start:
+                tips.extend(self.blocks[tips[0].parent_hash] for _ in range(p.fork_width))
+            for branch in range(1, len(tips)):
+                # The first block of each branch skips slots so that it differs from the canonical one and the other branches.
+                if slot >= fork_start + branch:
+                    tips[branch] = self.new_block(tips[branch], slot)
+                    self.emit(self.slot_start(slot) + self.latency(), tips[branch])
+            voted_tips = [tip for branch, tip in enumerate(tips) if branch == 0 or slot >= fork_start + branch]
+
+            votes = []
+            for index, validator in enumerate(self.validators):
+                for head in self.heads_of(index, voted_tips):
+                    votes.append(self.vote(validator, slot, head))
+                if p.equivocation_rate > 0 and self.rng.random() < p.equivocation_rate:
+                    head = self.blocks[votes[-1].message.head_hash]
+                    if head.parent_hash in self.blocks and head.slot > 1:
+                        votes.append(self.vote(validator, slot, self.blocks[head.parent_hash]))
+            for vote in votes:
+                self.emit(self.slot_start(slot) + p.delta + self.latency(), vote)
+            self.update_justified(votes)
+
+        canonical = sorted((b for b in self.blocks.values() if self.is_ancestor(b, tips[0])), key=lambda b: b.slot)
+        self.add_late_blocks(canonical)
+        self.add_stale_votes(canonical)
+        self.events.sort(key=lambda event: (event[0], event[1]))
+        return [WorkloadEvent(at, message) for at, _, message in self.events]
+
+    def add_late_blocks(self, canonical: list[Block]) -> None:
+        p = self.parameters
+        candidates = [b for b in canonical if b.slot + 3 <= p.slots]
+        for parent in self.rng.sample(candidates, min(p.late_blocks, len(candidates))):
+            withheld = self.new_block(parent, parent.slot + 2)
+            late = self.new_block(withheld, parent.slot + 3)
+            self.emit(self.slot_start(p.slots) + 3 * p.delta + self.latency(), late)
+
+    def add_stale_votes(self, canonical: list[Block]) -> None:
+        p = self.parameters
+        stale = [b for b in canonical if 0 < b.slot < p.slots - p.eta]
+        if len(stale) == 0:
+            return
+        for validator in self.validators:
+            for _ in range(p.stale_votes_per_validator):
+                head = self.rng.choice(stale)
+                vote = stubs.sign_vote_message(
+                    VoteMessage(slot=head.slot, head_hash=stubs.block_hash(head), ffg_source=checkpoint_of(self.genesis, 0), ffg_target=checkpoint_of(head, head.slot)),
+                    self.signing_state.set(identity=validator)
+                )
+                self.emit(self.slot_start(p.slots) + p.delta + self.latency(), vote)
+
+
+def configure_stubs(scenario: Scenario) -> None:
+    stubs.configure(pmap({validator: 1 for validator in make_validator_identities(scenario.parameters.validators)}))
+
+
+def generate_workload(scenario: Scenario) -> Workload:
+    """
+    It generates the workload of `scenario`. It calls `configure_stubs`.
+    """
+    configure_stubs(scenario)
+    return Workload(scenario=scenario, events=tuple(_Generator(scenario).generate()))
+
+
+def replay(workload: Workload, until: Optional[int] = None, identity: NodeIdentity = NodeIdentity("observer")) -> NodeState:
+    """
+    It returns the state of a node named `identity` having received the events of `workload` up to time `until`,
+    by default the end of the workload. By default the node is not a validator, so that it never proposes.
+    It calls `configure_stubs`.
+    """
+    parameters = workload.scenario.parameters
+    end = workload.end_time if until is None else until
+    configure_stubs(workload.scenario)
+    node_state = spec.init(identity, Configuration(delta=parameters.delta, genesis=make_genesis(), eta=parameters.eta, k=parameters.k))
+    next_tick = 0
+
+    def tick_until(node_state: NodeState, at: int) -> NodeState:
+        nonlocal next_tick
+        while next_tick <= at:
+            node_state = spec.on_tick(node_state, next_tick).state
+            next_tick += parameters.delta
+        return node_state
+
+    for event in workload.events:
+        if event.time > end:
+            break
+        node_state = tick_until(node_state, event.time)
+        if isinstance(event.message, Block):
+            node_state = spec.on_block_received(event.message, node_state).state
+        else:
+            node_state = spec.on_vote_received(event.message, node_state).state
+    return tick_until(node_state, end)
+
+
+_HEADER = struct.Struct("<I")
+
+
+def save_workload(workload: Workload, path: str) -> None:
+    """
+    It saves `workload` as the JSON of its scenario followed by its events encoded by `message_codec.py`, with the time
+    of each event as the arrival of its single delivery.
+    """
+    header = json.dumps(workload.scenario.to_json()).encode()
+    with open(path, "wb") as output:
+        output.write(_HEADER.pack(len(header)))
+        output.write(header)
+        output.write(MessageCodec().encode_batch((event.message, [(0, event.time)]) for event in workload.events))
+
+
+def load_workload(path: str) -> Workload:
+    with open(path, "rb") as source:
+        data = source.read()
+    length, = _HEADER.unpack_from(data)
+    scenario = Scenario.from_json(json.loads(data[_HEADER.size:_HEADER.size + length]))
+    events = MessageCodec().decode_batch(data[_HEADER.size + length:])
+    return Workload(scenario=scenario, events=tuple(WorkloadEvent(deliveries[0][1], message) for message, deliveries in events))
+
+
+def time_handlers(node_state: NodeState) -> dict[str, float]:
+    """
+    It times `get_head`, `on_vote` and `on_confirm` on `node_state`, in seconds.
+    """
+    timings = {}
+    for name, handler in (("get_head", helpers.get_head), ("on_vote", spec.on_vote), ("on_confirm", spec.on_confirm)):
+        started = time.perf_counter()
+        handler(node_state)
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--scenario", choices=sorted(SCENARIOS))
+    source.add_argument("--load", metavar="PATH", help="replay a workload saved with --save")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", metavar="PATH")
+    args = parser.parse_args(argv)
+
+    workload = load_workload(args.load) if args.load else generate_workload(get_scenario(args.scenario, args.seed))
+    if args.save:
+        save_workload(workload, args.save)
+
+    started = time.perf_counter()
+    node_state = replay(workload)
+    replay_seconds = time.perf_counter() - started
+    print(json.dumps({
+        "scenario": workload.scenario.to_json(),
+        "events": len(workload.events),
+        "replay_seconds": replay_seconds,
+        "view_blocks": len(node_state.view_blocks),
+        "buffer_blocks": len(node_state.buffer_blocks),
+        "view_votes": len(node_state.view_votes),
+        "head_slot": helpers.get_head(node_state).slot,
+        "justified_slot": helpers.get_greatest_justified_checkpoint(node_state).chkp_slot,
+        "finalized_slot": helpers.get_greatest_finalized_checkpoint(node_state).chkp_slot,
+        "handler_seconds": time_handlers(node_state),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()